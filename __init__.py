@@ -3,8 +3,11 @@ __all__ = [
     "extract_jpeg_meta",
     "build_database",
     "match_against_db",
+    "analyze_file",
+    "run_analysis",
 ]
 
 from .extract import extract_qtables, extract_jpeg_meta
 from .db import build_database
 from .match import match_against_db
+from .pipeline import analyze_file, run_analysis
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+ATTRIBUTION_SCHEMA = "qext.attribution.v1"
+# itens de referencia sem arquivo (synth-db): path = "synthetic:<familia>/<variante>"
+SYNTHETIC_PREFIX = "synthetic:"
+
+# niveis de evidencia, do mais especifico ao mais geral (backoff)
+LEVELS = ("Y+C+sub+prog", "Y+C", "Y", "C")
+
+Label = Tuple[str, Optional[int]]  # (software, quality)
+
+
+def _flag(v: Any) -> str:
+    return "" if v is None else str(int(v)) if isinstance(v, bool) else str(v)
+
+
+def evidence_keys(qhash: Dict[str, str], meta: Optional[Dict[str, Any]] = None) -> List[Tuple[str, str]]:
+    """(nivel, chave) de um fingerprint, na ordem de LEVELS. Niveis sem o hash necessario ficam de fora."""
+    meta = meta or {}
+    y, c = qhash.get("Y"), qhash.get("C")
+    keys: List[Tuple[str, str]] = []
+    if y is not None and c is not None:
+        keys.append((LEVELS[0], f"{y}|{c}|{_flag(meta.get('subsampling'))}|{_flag(meta.get('progressive'))}"))
+        keys.append((LEVELS[1], f"{y}|{c}"))
+    if y is not None:
+        keys.append((LEVELS[2], y))
+    if c is not None:
+        keys.append((LEVELS[3], c))
+    return keys
+
+
+def item_evidence(item: Dict[str, Any]) -> Tuple[Label, List[Tuple[str, str]]]:
+    """Rotulo (software, quality) e chaves de evidencia de um item do DB."""
+    label = (item.get("software", "?"), item.get("quality"))
+    return label, evidence_keys(item.get("qhash") or {}, item.get("jpeg_meta"))
+
+
+def is_synthetic(item: Dict[str, Any]) -> bool:
+    """Item gerado por synth-db (tambem reconhecido pelo path, que e o que o SQLite guarda)."""
+    return bool(item.get("synthetic")) or str(item.get("path") or "").startswith(SYNTHETIC_PREFIX)
+
+
+def posterior(counts: Dict[Label, int], level: str, topk: int = 10) -> Dict[str, Any]:
+    """Normaliza as contagens de uma chave em P(software, quality | evidencia) e P(software | evidencia).
+
+    Estimativa de maxima verossimilhanca (frequencia relativa) sobre os itens
+    do DB com a mesma evidencia; `n` diz quantos itens sustentam a estimativa.
+    """
+    n = sum(counts.values())
+    labels = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0][0], kv[0][1] or 10**9))
+    families: Dict[str, int] = {}
+    for (sw, _q), k in counts.items():
+        families[sw] = families.get(sw, 0) + k
+    fam = sorted(families.items(), key=lambda kv: (-kv[1], kv[0]))
+    return {
+        "level": level,
+        "n": n,
+        "families": [{"software": sw, "p": k / n, "count": k} for sw, k in fam],
+        "posterior": [{"software": sw, "quality": q, "p": k / n, "count": k} for (sw, q), k in labels[:topk]],
+    }
+
+
+class AttributionModel:
+    """Tabelas de contagem para atribuicao de encoder: P(software, quality | Y, C, subsampling, progressive).
+
+    Para cada nivel de LEVELS guarda chave -> {(software, quality): contagem}.
+    A consulta usa o nivel mais especifico com evidencia no DB (ex.: sem o par
+    exato Y+C+sub+prog, cai para Y+C, depois Y, depois C): custo O(1) no
+    tamanho do DB. add() atualiza as contagens de forma incremental.
+
+    Itens sinteticos (is_synthetic) nao entram nas contagens: cada (software, quality)
+    sintetico vale 1 por chave, somado na consulta. Quantas configuracoes o gerador
+    enumerou (subsampling, progressive, presets) nao pesa no posterior.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, Dict[str, Dict[Label, int]]] = {lv: {} for lv in LEVELS}
+        self.synthetic: Dict[str, Dict[str, Set[Label]]] = {lv: {} for lv in LEVELS}
+
+    def add(self, item: Dict[str, Any], n: int = 1) -> None:
+        label, keys = item_evidence(item)
+        if is_synthetic(item):
+            for level, key in keys:
+                self.synthetic[level].setdefault(key, set()).add(label)
+            return
+        for level, key in keys:
+            bucket = self.counts[level].setdefault(key, {})
+            bucket[label] = bucket.get(label, 0) + n
+
+    def add_items(self, items: Iterable[Dict[str, Any]]) -> "AttributionModel":
+        for it in items:
+            self.add(it)
+        return self
+
+    def lookup(self, qhash: Dict[str, str], meta: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], Dict[Label, int]]:
+        for level, key in evidence_keys(qhash, meta):
+            counts = self.counts[level].get(key)
+            synthetic = self.synthetic[level].get(key)
+            if synthetic:
+                counts = dict(counts or {})
+                for label in synthetic:
+                    counts[label] = counts.get(label, 0) + 1
+            if counts:
+                return level, counts
+        return None, {}
+
+    def attribute(self, qhash: Dict[str, str], meta: Optional[Dict[str, Any]] = None, topk: int = 10) -> Dict[str, Any]:
+        """Posterior ranqueado sobre (software, quality) e sobre familias de encoder."""
+        level, counts = self.lookup(qhash, meta)
+        if not counts:
+            return {"level": None, "n": 0, "families": [], "posterior": []}
+        return posterior(counts, level, topk=topk)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma serializavel (JSON): nivel -> chave -> [[software, quality, contagem], ...];
+        "synthetic" (so se houver): nivel -> chave -> [[software, quality], ...]."""
+        out: Dict[str, Any] = {
+            "schema": ATTRIBUTION_SCHEMA,
+            "levels": {
+                lv: {key: [[sw, q, k] for (sw, q), k in counts.items()] for key, counts in self.counts[lv].items()}
+                for lv in LEVELS
+            },
+        }
+        if any(self.synthetic.values()):
+            out["synthetic"] = {
+                lv: {
+                    key: [[sw, q] for sw, q in sorted(labels, key=lambda lb: (lb[0], -1 if lb[1] is None else lb[1]))]
+                    for key, labels in self.synthetic[lv].items()
+                }
+                for lv in LEVELS
+            }
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AttributionModel":
+        m = cls()
+        for lv, keys in (data.get("levels") or {}).items():
+            if lv in m.counts:
+                m.counts[lv] = {key: {(sw, q): k for sw, q, k in rows} for key, rows in keys.items()}
+        for lv, keys in (data.get("synthetic") or {}).items():
+            if lv in m.synthetic:
+                m.synthetic[lv] = {key: {(sw, q) for sw, q in rows} for key, rows in keys.items()}
+        return m
+
+    @classmethod
+    def from_db(cls, db: Dict[str, Any]) -> "AttributionModel":
+        """Modelo gravado no DB, ou recalculado a partir dos itens (DBs anteriores ao modelo)."""
+        if db.get("attribution"):
+            return cls.from_dict(db["attribution"])
+        return cls().add_items(db.get("items", []))
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .extract import JPEGMeta, parse_jpeg_header, qhash_from_tables
+from .match import match_fingerprint
+from .profiling import count, timed
+
+SOI = b"\xFF\xD8\xFF"
+EOI = b"\xFF\xD9"
+
+# Janela mapeada por vez: o espaco de enderecamento e a memoria residente ficam limitados
+# mesmo para fontes de centenas de GB (e dispositivos de bloco, cujo st_size e 0).
+DEFAULT_WINDOW = 256 * 1024 * 1024
+# Maior cabecalho aceito (APPn com EXIF/ICC/XMP + DQT/DHT/SOF ate o SOS).
+MAX_HEADER = 1024 * 1024
+# Sem EOI ate aqui, o candidato e reportado como truncado/fragmentado (length None).
+MAX_SIZE = 64 * 1024 * 1024
+
+
+@dataclass(slots=True)
+class CarvedJPEG:
+    offset: int  # offset absoluto do SOI na fonte
+    length: Optional[int]  # ate o EOI inclusive; None = sem EOI ate max_size
+    qtables: Dict[str, Any]
+    qhash: Dict[str, str]
+    meta: JPEGMeta
+    sha256: Optional[str] = None  # dos bytes carvados (so candidatos completos)
+
+    @property
+    def complete(self) -> bool:
+        return self.length is not None
+
+
+def source_size(f: Any) -> int:
+    """Tamanho de arquivo regular ou dispositivo de bloco (seek ao fim; st_size nao serve para /dev/sdX)."""
+    end = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    return end
+
+
+def carve_jpegs(
+    source: Path,
+    start: int = 0,
+    end: Optional[int] = None,
+    window: int = DEFAULT_WINDOW,
+    max_size: int = MAX_SIZE,
+    max_header: int = MAX_HEADER,
+    hash_carved: bool = True,
+    extract_dir: Optional[Path] = None,
+) -> Iterator[CarvedJPEG]:
+    """Varre uma fonte bruta (imagem de disco, dump de memoria, ZIP/PDF/DOCX, espaco nao alocado)
+    atras de JPEGs, em streaming.
+
+    A fonte e mapeada em janelas de `window` bytes (mmap com offset), sobrepostas em max_size:
+    um candidato so e processado na janela que contem max_size bytes a partir dele, entao
+    cabecalho e EOI nunca cruzam a borda. O SOI e achado com mmap.find (memchr em C), e
+    DQT/SOF sao lidos no lugar via memoryview (parse_jpeg_header), sem copiar os bytes.
+    Candidatos cuja estrutura de marcadores nao fecha ate o SOS sao descartados.
+    Um JPEG completo e pulado ate o EOI (miniaturas embutidas no APP1 nao viram candidatos);
+    um truncado so ate o SOS, para nao perder o que vier depois dele.
+    """
+    max_header = min(max_header, max_size)
+    gran = mmap.ALLOCATIONGRANULARITY
+    window = max(window, max_size + gran)
+    if extract_dir is not None:
+        extract_dir = Path(extract_dir)
+        extract_dir.mkdir(parents=True, exist_ok=True)
+    with open(source, "rb") as f:
+        size = source_size(f)
+        stop = size if end is None else min(end, size)
+        pos = max(0, start)
+        while pos < stop:
+            base = pos - pos % gran
+            length = min(window, size - base)
+            at_eof = base + length >= size
+            # ultimo inicio de candidato tratado nesta janela; o resto vai para a proxima
+            limit = min(stop - base, length if at_eof else length - max_size)
+            with mmap.mmap(f.fileno(), length, offset=base, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                resume = pos - base  # proximo byte a examinar (pode passar de limit apos um EOI)
+                try:
+                    while True:
+                        with timed("carve_scan"):
+                            i = mm.find(SOI, resume, limit + len(SOI) - 1)
+                        if i < 0:
+                            break
+                        with timed("header_parse"):
+                            hdr = parse_jpeg_header(view, i, i + max_header, embedded=False)
+                        if hdr is None:
+                            count("carve_rejected")
+                            resume = i + 1
+                            continue
+                        with timed("carve_scan"):
+                            j = mm.find(EOI, hdr.sos, min(i + max_size, length))
+                        carved = CarvedJPEG(
+                            offset=base + i,
+                            length=None if j < 0 else j + 2 - i,
+                            qtables=hdr.qtables,
+                            qhash=qhash_from_tables(hdr.qtables),
+                            meta=hdr.meta,
+                        )
+                        if carved.length is not None:
+                            data = view[i : i + carved.length]
+                            if hash_carved:
+                                with timed("hash"):
+                                    carved.sha256 = hashlib.sha256(data).hexdigest()
+                            if extract_dir is not None:
+                                (extract_dir / f"carved_{carved.offset:012x}.jpg").write_bytes(data)
+                            data.release()
+                            resume = j + 2
+                        else:
+                            count("carve_truncated")
+                            resume = hdr.sos
+                        count("carved")
+                        yield carved
+                finally:
+                    view.release()
+            pos = base + max(limit, resume)
+
+
+def _fingerprint_key(c: CarvedJPEG) -> Tuple[Any, ...]:
+    return c.qhash.get("Y"), c.qhash.get("C"), c.meta.subsampling, c.meta.progressive
+
+
+def match_carved(db: Any, source: Path, topk: int = 10, prefilter: Any = None, **carve_kw: Any) -> Iterator[Dict[str, Any]]:
+    """Carving + match de cada candidato contra o DB, um resultado por JPEG encontrado.
+
+    Mesmo formato de match_against_db; "input" traz source/offset/length em vez de path.
+    Candidatos com o mesmo fingerprint (tabelas + subsampling/progressive, tipico de
+    centenas de fotos da mesma camera) consultam o DB uma unica vez.
+    """
+    source = Path(source)
+    cache: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for c in carve_jpegs(source, **carve_kw):
+        meta = asdict(c.meta)
+        key = _fingerprint_key(c)
+        if key not in cache:
+            cache[key] = match_fingerprint(db, c.qhash, meta, topk=topk, prefilter=prefilter)
+        res: Dict[str, Any] = {
+            "input": {
+                "source": str(source.resolve()),
+                "offset": c.offset,
+                "length": c.length,
+                "complete": c.complete,
+                "sha256": c.sha256,
+                "qhash": c.qhash,
+                "jpeg_meta": meta,
+            },
+        }
+        res.update(cache[key])
+        yield res
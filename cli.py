@@ -2,46 +2,432 @@ from __future__ import annotations
 
 import argparse
 import json
+import signal
+import sys
+import threading
+from dataclasses import asdict
 from pathlib import Path
 
-from .db import build_database, save_db_json, load_db_json
-from .match import match_against_db
+from .attribution import LEVELS
+from .carve import MAX_SIZE, carve_jpegs, match_carved
+from .db import build_database, parse_shard, save_db_json
+from .db_sqlite import SQLITE_SUFFIXES, build_database_sqlite
+from .join import DEFAULT_MAX_ROWS, join_collections
+from .match import LazyDB, match_db_file, match_paths
+from .merge import build_sharded, merge_databases
+from .mjpeg import match_mjpeg
+from .pipeline import DEFAULT_STAGES, STAGES, run_analysis
+from .prefilter import load_prefilter_for_db, write_prefilter_for_db
+from .scan import scan_jpegs
+from .synth import SYNTH_FAMILIES, parse_qualities, write_synthetic_db
+from .watch import run_watch
+from . import profiling
+
+
+def _arg_type(parse):
+    # converte o ValueError do parser em erro de uso do argparse (mensagem sem traceback)
+    def conv(spec: str):
+        try:
+            return parse(spec)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e)) from None
+
+    conv.__name__ = parse.__name__
+    return conv
 
 
 def cmd_build_db(args: argparse.Namespace) -> int:
-    db = build_database(Path(args.dataset), workers=args.workers)
+    if args.shards:
+        # coordenador local: um subprocesso build-db --shard i/n por shard, depois merge-db
+        stats = build_sharded(
+            Path(args.dataset),
+            Path(args.out),
+            shards=args.shards,
+            jobs=args.jobs,
+            workers=args.workers,
+            dedup=not args.no_dedup,
+            shard_dir=Path(args.shard_dir) if args.shard_dir else None,
+            keep_shards=args.keep_shards,
+        )
+        print(
+            f"OK: DB salvo em {args.out} ({args.shards} shard(s) em {stats['shard_build_s']}s; items={stats['items_out']}, "
+            f"copias entre shards={stats['aliased']}, prefiltro={stats['prefilter']})"
+        )
+        return 0
+    shard = args.shard
+    if Path(args.out).suffix.lower() in SQLITE_SUFFIXES:
+        n = build_database_sqlite(Path(args.dataset), Path(args.out), workers=args.workers, dedup=not args.no_dedup, shard=shard)
+        bloom = write_prefilter_for_db(Path(args.out))
+        print(f"OK: DB SQLite salvo em {args.out} (items inseridos={n}, prefiltro={bloom})")
+        return 0
+    db = build_database(Path(args.dataset), workers=args.workers, dedup=not args.no_dedup, shard=shard)
     save_db_json(db, Path(args.out))
-    print(f"OK: DB salvo em {args.out} (items={len(db.get('items', []))})")
+    bloom = write_prefilter_for_db(Path(args.out), db)
+    print(f"OK: DB salvo em {args.out} (items={len(db.get('items', []))}, prefiltro={bloom})")
+    return 0
+
+
+def cmd_merge_db(args: argparse.Namespace) -> int:
+    stats = merge_databases([Path(p) for p in args.inputs], Path(args.out))
+    if stats["missing_shards"]:
+        print(f"AVISO: faltam os shards {stats['missing_shards']}", file=sys.stderr)
+    print(
+        f"OK: DB salvo em {args.out} ({stats['inputs']} entrada(s), items={stats['items_out']}, "
+        f"repetidos descartados={stats['duplicates']}, copias entre entradas={stats['aliased']}, prefiltro={stats['prefilter']})"
+    )
+    return 0
+
+
+def cmd_synth_db(args: argparse.Namespace) -> int:
+    # tabelas de referencia sem imagens: IJG analitica + Pillow/libjpeg colhida em encodes 8x8
+    families = [f.strip() for f in args.families.split(",") if f.strip()]
+    stats = write_synthetic_db(Path(args.out), families=families, qualities=args.qualities, workers=args.workers)
+    print(
+        f"OK: DB salvo em {args.out} (entradas sinteticas geradas={stats['generated']}, novas={stats['added']}, "
+        f"prefiltro={stats['prefilter']})"
+    )
     return 0
 
 
 def cmd_match(args: argparse.Namespace) -> int:
-    db = load_db_json(Path(args.db))
-    res = match_against_db(db, Path(args.input), topk=args.topk)
+    input_path = Path(args.input)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input nao encontrado: {input_path}")
+    if input_path.is_file():
+        res = match_db_file(Path(args.db), input_path, topk=args.topk, use_prefilter=not args.no_prefilter)
+        print(json.dumps(res, indent=2, ensure_ascii=False))
+        return 0
+
+    # diretorio: um resultado JSON por linha; copias identicas reaproveitam o match.
+    # O DB so e aberto quando algum arquivo passa pelo prefiltro.
+    prefilter = None if args.no_prefilter else load_prefilter_for_db(Path(args.db))
+    db = LazyDB(Path(args.db))
+    try:
+        for res in match_paths(db, scan_jpegs(input_path), topk=args.topk, prefilter=prefilter):
+            print(json.dumps(res, ensure_ascii=False))
+    finally:
+        db.close()
+        if prefilter is not None:
+            prefilter.close()
+    return 0
+
+
+def cmd_analyze(args: argparse.Namespace) -> int:
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    options = {"ela_quality": args.ela_quality}
+    if args.max_tile_mb:
+        options["max_tile_mb"] = args.max_tile_mb
+    if args.near_dup is not None:
+        options["near_dup_radius"] = args.near_dup
+    if args.face_model:
+        options["face_model"] = args.face_model
+        options["face_config"] = args.face_config
+    stats = run_analysis(
+        Path(args.input),
+        Path(args.out),
+        stages=stages,
+        workers=args.workers,
+        resume=not args.no_resume,
+        options=options,
+    )
+    print(
+        f"OK: {stats['analyzed']} arquivo(s) analisado(s), {stats['skipped']} ja no checkpoint, "
+        f"{stats['near_duplicates']} quase-duplicata(s), {stats['with_errors']} com erro -> {args.out}"
+    )
+    return 0
+
+
+def cmd_custody(args: argparse.Namespace) -> int:
+    from .deepfake_module.custody import custody_hash, find_record, verify_custody
+
+    if args.verify:
+        # aceita o registro puro ou um relatorio de extracao (source_video.custody)
+        record = find_record(json.loads(Path(args.verify).read_text(encoding="utf-8")))
+        start = end = None
+        if args.range:
+            a, _, b = args.range.partition(":")
+            start, end = (int(a) if a else None), (int(b) if b else None)
+        res = verify_custody(Path(args.input), record, start=start, end=end, workers=args.workers)
+        print(json.dumps(res, ensure_ascii=False))
+        return 0 if res["ok"] else 1
+
+    record = custody_hash(Path(args.input), chunk_size=int(args.chunk_mb * 1024 * 1024), workers=args.workers,
+                          whole_file=not args.no_sha256)
+    record["path"] = str(Path(args.input).resolve())
+    text = json.dumps(record, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"OK: custodia de {args.input} (raiz {record['merkle']['root']}, {record['merkle']['leaf_count']} folhas) -> {args.out}")
+    else:
+        print(text)
+    return 0
+
+
+def cmd_temporal(args: argparse.Namespace) -> int:
+    from .deepfake_module.temporal import analyze_video_temporal, record_in_case_report
+
+    detector = None
+    if args.face_model:
+        from .deepfake_module.face_detector import ForensicFaceDetector
+
+        detector = ForensicFaceDetector(model_path=args.face_model, config_path=args.face_config)
+    res = analyze_video_temporal(
+        args.input, step=args.step, face_detector=detector, max_frames=args.max_frames,
+        halflife=args.halflife, enter=args.threshold, exit=args.threshold * 0.625,
+    )
+    res["video"] = str(Path(args.input).resolve())
+    if args.report:
+        # anexado ao relatorio do caso (extraction_report.json do frame_extractor)
+        record_in_case_report(args.report, res)
+        print(f"OK: {res['frames']} frame(s), {len(res['segments'])} trecho(s) anomalo(s) -> {args.report}")
+    else:
+        print(json.dumps(res, indent=2, ensure_ascii=False))
+    return 0
+
+
+def cmd_carve(args: argparse.Namespace) -> int:
+    # um registro JSON por JPEG encontrado (offset/length na fonte + fingerprint; com --db, tambem o match)
+    kw = {
+        "start": args.start,
+        "end": args.end,
+        "max_size": int(args.max_size_mb * 1024 * 1024),
+        "extract_dir": Path(args.extract_dir) if args.extract_dir else None,
+    }
+    if not args.db:
+        for c in carve_jpegs(Path(args.input), **kw):
+            rec = {"offset": c.offset, "length": c.length, "complete": c.complete, "sha256": c.sha256,
+                   "qhash": c.qhash, "jpeg_meta": asdict(c.meta)}
+            print(json.dumps(rec, ensure_ascii=False))
+        return 0
+    prefilter = None if args.no_prefilter else load_prefilter_for_db(Path(args.db))
+    db = LazyDB(Path(args.db))
+    try:
+        for res in match_carved(db, Path(args.input), topk=args.topk, prefilter=prefilter, **kw):
+            print(json.dumps(res, ensure_ascii=False))
+    finally:
+        db.close()
+        if prefilter is not None:
+            prefilter.close()
+    return 0
+
+
+def cmd_mjpeg(args: argparse.Namespace) -> int:
+    # fingerprint por frame direto do conteiner; um match por segmento de tabela (nao por frame)
+    prefilter = None
+    db = None
+    if args.db:
+        prefilter = None if args.no_prefilter else load_prefilter_for_db(Path(args.db))
+        db = LazyDB(Path(args.db))
+    try:
+        res = match_mjpeg(db, Path(args.input), topk=args.topk, prefilter=prefilter)
+    finally:
+        if db is not None:
+            db.close()
+        if prefilter is not None:
+            prefilter.close()
     print(json.dumps(res, indent=2, ensure_ascii=False))
+    if "error" in res:
+        print(f"ERRO: {args.input}: {res['error']} (nao e video MJPEG?)", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_join(args: argparse.Namespace) -> int:
+    # um grupo JSON por fingerprint presente nos dois conjuntos; resumo no stderr
+    stats = {}
+    for g in join_collections(
+        Path(args.a),
+        Path(args.b),
+        level=args.level,
+        workers=args.workers,
+        max_rows=args.max_rows,
+        max_paths=args.max_paths or None,
+        tmpdir=Path(args.tmpdir) if args.tmpdir else None,
+        stats=stats,
+    ):
+        print(json.dumps(g, ensure_ascii=False))
+    print(
+        f"OK: {stats['groups']} fingerprint(s) em comum; A: {stats['a_matched']}/{stats['a']['rows']} arquivo(s), "
+        f"B: {stats['b_matched']}/{stats['b']['rows']} arquivo(s)"
+        f"{' (particionado em disco)' if stats['spilled'] else ''}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def cmd_watch(args: argparse.Namespace) -> int:
+    # roda ate Ctrl+C; o que ja estava em processamento termina e vai para o log
+    if not args.input and not args.dataset:
+        print("ERRO: informe --input e/ou --dataset", file=sys.stderr)
+        return 2
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    print(f"Observando {', '.join(args.input + ([args.dataset] if args.dataset else []))} -> {args.log}", file=sys.stderr)
+    stats = run_watch(
+        [Path(p) for p in args.input],
+        Path(args.db),
+        Path(args.log),
+        dataset=Path(args.dataset) if args.dataset else None,
+        workers=args.workers,
+        topk=args.topk,
+        settle=args.settle,
+        interval=args.interval,
+        poll=True if args.poll else None,
+        existing=not args.no_existing,
+        stop=stop,
+    )
+    print(
+        f"OK ({stats['mode']}): {stats['matched']} match(es), {stats['added']} referencia(s) no DB, "
+        f"{stats['skipped']} ja no log, {stats['errors']} erro(s)"
+    )
     return 0
 
 
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="qext", description="JPEG quantization fingerprint toolkit")
+    p.add_argument("--profile", action="store_true", help="Imprime (stderr) o tempo gasto por estagio ao final")
+    p.add_argument("--profile-pstats", metavar="ARQ", help="Grava dump cProfile/pstats (thread principal; use --workers 1)")
+    p.add_argument("--profile-trace", metavar="ARQ", help="Grava trace JSON para chrome://tracing / Perfetto")
     sub = p.add_subparsers(dest="cmd", required=True)
 
     p_db = sub.add_parser("build-db", help="Varre dataset e gera quant_db.json")
     p_db.add_argument("--dataset", required=True, help="Pasta dataset/<software>/*.jpg")
-    p_db.add_argument("--out", required=True, help="Arquivo JSON de saida")
+    p_db.add_argument("--out", required=True, help="Arquivo de saida (.json, ou .sqlite/.db para o backend SQLite)")
     p_db.add_argument("--workers", type=int, default=4, help="Threads para acelerar extracao")
+    p_db.add_argument("--no-dedup", action="store_true", help="Extrai tambem copias identicas (sem pre-passo de dedup)")
+    g_shard = p_db.add_mutually_exclusive_group()
+    g_shard.add_argument("--shard", metavar="I/N", type=_arg_type(parse_shard), help="Monta so o shard I de N (particao deterministica por caminho; junte com merge-db)")
+    g_shard.add_argument("--shards", type=int, help="Coordenador local: N shards em subprocessos + merge")
+    p_db.add_argument("--jobs", type=int, help="Shards simultaneos com --shards (padrao: min(N, CPUs))")
+    p_db.add_argument("--shard-dir", help="Onde gravar os DBs parciais com --shards (padrao: ao lado de --out)")
+    p_db.add_argument("--keep-shards", action="store_true", help="Mantem os DBs parciais depois do merge")
     p_db.set_defaults(func=cmd_build_db)
 
+    p_sy = sub.add_parser("synth-db", help="Gera entradas de referencia sinteticas (tabelas IJG calculadas, Pillow colhidas) direto no DB")
+    p_sy.add_argument("--out", required=True, help="DB de destino (.json ou .sqlite/.db); criado ou acrescido")
+    p_sy.add_argument("--families", default=",".join(SYNTH_FAMILIES), help=f"Familias separadas por virgula ({', '.join(SYNTH_FAMILIES)})")
+    p_sy.add_argument("--qualities", type=_arg_type(parse_qualities), default="1-100", help="Qualities: faixas e listas, ex.: 1-100 ou 50,75,90")
+    p_sy.add_argument("--workers", type=int, default=4, help="Threads para os encodes 8x8 do Pillow")
+    p_sy.set_defaults(func=cmd_synth_db)
+
+    p_mg = sub.add_parser("merge-db", help="Junta DBs parciais (shards) com dedup por sha256 e reconstroi indices/atribuicao")
+    p_mg.add_argument("--inputs", nargs="+", required=True, help="DBs parciais (JSON ou SQLite, podem ser misturados)")
+    p_mg.add_argument("--out", required=True, help="DB final (.json, ou .sqlite/.db para o backend SQLite)")
+    p_mg.set_defaults(func=cmd_merge_db)
+
     p_m = sub.add_parser("match", help="Compara um JPEG contra o DB")
-    p_m.add_argument("--db", required=True, help="quant_db.json")
-    p_m.add_argument("--input", required=True, help="JPEG alvo")
+    p_m.add_argument("--db", required=True, help="quant_db.json ou DB SQLite")
+    p_m.add_argument("--input", required=True, help="JPEG alvo ou diretorio (saida JSONL)")
     p_m.add_argument("--topk", type=int, default=10)
+    p_m.add_argument("--no-prefilter", action="store_true", help="Ignora <db>.bloom e consulta o DB para todo input")
     p_m.set_defaults(func=cmd_match)
 
+    p_a = sub.add_parser("analyze", help="Pipeline DQT+ELA+DFT por arquivo (JSONL retomavel)")
+    p_a.add_argument("--input", required=True, help="Arquivo ou diretorio (varredura recursiva)")
+    p_a.add_argument("--out", required=True, help="JSONL de saida (tambem usado como checkpoint)")
+    p_a.add_argument("--stages", default=",".join(DEFAULT_STAGES), help=f"Estagios separados por virgula ({', '.join(STAGES)})")
+    p_a.add_argument("--workers", type=int, default=4, help="Threads de analise")
+    p_a.add_argument("--ela-quality", type=int, default=95, help="Qualidade de re-save do ELA")
+    p_a.add_argument("--max-tile-mb", type=float, help="ELA/DFT em tiles com no maximo ~N MB de memoria de trabalho (imagens gigantes)")
+    p_a.add_argument("--near-dup", type=int, metavar="RAIO", help="Agrupa quase-duplicatas (pHash, Hamming <= RAIO) e analisa so um representativo por grupo")
+    p_a.add_argument("--face-model", help="Modelo de rosto local para o estagio face: cascade .xml, YuNet .onnx ou res10 .caffemodel")
+    p_a.add_argument("--face-config", help="deploy.prototxt do res10 SSD (so com .caffemodel)")
+    p_a.add_argument("--no-resume", action="store_true", help="Ignora checkpoint e sobrescreve a saida")
+    p_a.set_defaults(func=cmd_analyze)
+
+    p_c = sub.add_parser("custody", help="Hash de custodia: arvore de Merkle por blocos (paralela) + SHA-256 do arquivo")
+    p_c.add_argument("--input", required=True, help="Arquivo de evidencia (ex.: video)")
+    p_c.add_argument("--out", help="JSON do registro de custodia (default: stdout)")
+    p_c.add_argument("--chunk-mb", type=float, default=4, help="Tamanho de cada folha em MB")
+    p_c.add_argument("--workers", type=int, help="Threads de hash (default: nucleos, max 8)")
+    p_c.add_argument("--no-sha256", action="store_true", help="So a arvore de Merkle (sem o SHA-256 sequencial do arquivo inteiro)")
+    p_c.add_argument("--verify", metavar="REGISTRO", help="Reverifica o arquivo contra um registro salvo e lista os blocos divergentes")
+    p_c.add_argument("--range", metavar="INICIO:FIM", help="Com --verify: so os blocos que cobrem esse intervalo de bytes")
+    p_c.set_defaults(func=cmd_custody)
+
+    p_t = sub.add_parser("temporal", help="Consistencia temporal de video: oscilacao de ELA/espectro/blockiness entre frames (memoria constante)")
+    p_t.add_argument("--input", required=True, help="Video")
+    p_t.add_argument("--report", help="Relatorio do caso (ex.: extraction_report.json) onde gravar temporal_analysis (default: stdout)")
+    p_t.add_argument("--step", type=int, default=1, help="Analisa 1 a cada N frames")
+    p_t.add_argument("--max-frames", type=int, help="Limite de frames analisados")
+    p_t.add_argument("--halflife", type=float, default=50.0, help="Meia-vida (em frames analisados) das medias/variancias moveis")
+    p_t.add_argument("--threshold", type=float, default=4.0, help="Escore (z RMS por grupo de features) que abre um trecho anomalo")
+    p_t.add_argument("--face-model", help="Restringe as features ao maior rosto rastreado: cascade .xml, YuNet .onnx ou res10 .caffemodel")
+    p_t.add_argument("--face-config", help="deploy.prototxt do res10 SSD (so com .caffemodel)")
+    p_t.set_defaults(func=cmd_temporal)
+
+    p_cv = sub.add_parser("carve", help="Carving de JPEGs em imagem de disco/dump/conteiner, com match opcional contra o DB (JSONL)")
+    p_cv.add_argument("--input", required=True, help="Fonte bruta: imagem de disco, dump de memoria, ZIP/PDF/DOCX, dispositivo de bloco")
+    p_cv.add_argument("--db", help="quant_db.json ou DB SQLite (sem --db: so offsets e fingerprints)")
+    p_cv.add_argument("--topk", type=int, default=10)
+    p_cv.add_argument("--no-prefilter", action="store_true", help="Ignora <db>.bloom e consulta o DB para todo candidato")
+    p_cv.add_argument("--start", type=int, default=0, help="Offset inicial (bytes)")
+    p_cv.add_argument("--end", type=int, help="Offset final (bytes, exclusivo)")
+    p_cv.add_argument("--max-size-mb", type=float, default=MAX_SIZE / (1024 * 1024), help="Sem EOI ate esse tamanho, o candidato sai como truncado")
+    p_cv.add_argument("--extract-dir", help="Grava cada JPEG completo como carved_<offset hex>.jpg")
+    p_cv.set_defaults(func=cmd_carve)
+
+    p_mj = sub.add_parser("mjpeg", help="Tabelas de cada frame de video MJPEG (AVI/MOV/stream) sem decodificar; detecta trocas de tabela")
+    p_mj.add_argument("--input", required=True, help="Video MJPEG: AVI, QuickTime/MP4 (jpeg/mjpa) ou JPEGs concatenados")
+    p_mj.add_argument("--db", help="quant_db.json ou DB SQLite (sem --db: so os segmentos de tabela)")
+    p_mj.add_argument("--topk", type=int, default=10)
+    p_mj.add_argument("--no-prefilter", action="store_true", help="Ignora <db>.bloom e consulta o DB para todo segmento")
+    p_mj.set_defaults(func=cmd_mjpeg)
+
+    p_j = sub.add_parser("join", help="Arquivos de A e B que compartilham fingerprint de encoder (hash join, com spill em disco)")
+    p_j.add_argument("--a", required=True, help="Conjunto A: diretorio de JPEGs ou DB do qext (JSON/SQLite)")
+    p_j.add_argument("--b", required=True, help="Conjunto B: diretorio de JPEGs ou DB do qext (JSON/SQLite)")
+    p_j.add_argument("--level", choices=LEVELS, default=LEVELS[0], help="Chave do join: tabelas + estrutura (padrao) ou so tabelas")
+    p_j.add_argument("--workers", type=int, default=4)
+    p_j.add_argument("--max-rows", type=int, default=DEFAULT_MAX_ROWS, help="Linhas por lado em memoria antes de particionar em disco")
+    p_j.add_argument("--max-paths", type=int, default=100, help="Caminhos listados por lado em cada grupo (0 = todos; contagens sempre completas)")
+    p_j.add_argument("--tmpdir", help="Diretorio das particoes em disco (padrao: temporario do sistema)")
+    p_j.set_defaults(func=cmd_join)
+
+    p_w = sub.add_parser("watch", help="Observa diretorios e faz match de cada JPEG novo (inotify ou polling), com DB em memoria")
+    p_w.add_argument("--input", action="append", default=[], help="Diretorio de evidencias (pode repetir)")
+    p_w.add_argument("--dataset", help="Diretorio dataset/<software>/: JPEGs novos entram no DB")
+    p_w.add_argument("--db", required=True, help="quant_db.json ou DB SQLite (criado se nao existir)")
+    p_w.add_argument("--log", required=True, help="Log JSONL (um resultado por linha; tambem serve de checkpoint)")
+    p_w.add_argument("--workers", type=int, default=4)
+    p_w.add_argument("--topk", type=int, default=10)
+    p_w.add_argument("--settle", type=float, default=0.3, help="Segundos sem mudanca de tamanho/mtime para considerar a escrita concluida")
+    p_w.add_argument("--interval", type=float, default=0.5, help="Intervalo de varredura no modo polling (s)")
+    p_w.add_argument("--poll", action="store_true", help="Forca polling (compartilhamentos de rede, onde inotify nao ve escritas remotas)")
+    p_w.add_argument("--no-existing", action="store_true", help="Ignora arquivos ja presentes ao iniciar")
+    p_w.set_defaults(func=cmd_watch)
+
     return p
 
 
+def _run_profiled(args: argparse.Namespace) -> int:
+    prof = profiling.enable(trace=bool(args.profile_trace))
+    cprof = None
+    if args.profile_pstats:
+        import cProfile
+
+        cprof = cProfile.Profile()
+        cprof.enable()
+    try:
+        return args.func(args)
+    finally:
+        if cprof is not None:
+            cprof.disable()
+            cprof.dump_stats(args.profile_pstats)
+        profiling.disable()
+        print(prof.report(), file=sys.stderr)
+        if args.profile_trace:
+            prof.write_chrome_trace(Path(args.profile_trace))
+
+
 def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
+    if args.profile or args.profile_pstats or args.profile_trace:
+        raise SystemExit(_run_profiled(args))
     raise SystemExit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .attribution import AttributionModel
+from .db import SCHEMA_V2, load_db_json, table_csv
+
+
+NONE = -1  # valor ausente nas colunas inteiras (quality, progressive, width, ...)
+SUBSAMPLINGS = ("444", "422", "420")
+
+
+class StringColumn:
+    """Coluna de strings empacotada: um blob UTF-8 + offsets (sem um objeto str por linha)."""
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, values: Sequence[Optional[str]]):
+        enc = [(v or "").encode("utf-8") for v in values]
+        self.offsets = np.zeros(len(enc) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in enc], out=self.offsets[1:])
+        self.blob = b"".join(enc)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.blob) + self.offsets.nbytes
+
+
+class ColumnarDB:
+    """DB de referencia em colunas NumPy (struct-of-arrays), para DBs com milhoes de itens.
+
+    Cada campo do item vira um vetor; qhash Y/C viram ids (int32) numa tabela de
+    tabelas distintas, e as tabelas ficam empacotadas numa matriz (n_tabelas, 64)
+    uint16. software e um codigo sobre `software_names` (ordenado, entao a
+    ordem dos codigos e a ordem alfabetica); sha256 e guardado em bytes (n, 32).
+    Valores ausentes = NONE (-1). Miniaturas/previews embutidos ("embedded") ficam em
+    colunas paralelas `emb_*`, uma linha por miniatura, com emb_row = linha do item (crescente).
+
+    Pode ser passado diretamente para match_against_db no lugar do dict JSON;
+    o match compara ids inteiros de forma vetorizada.
+    """
+
+    def __init__(
+        self,
+        software_names: List[str],
+        software: np.ndarray,
+        quality: np.ndarray,
+        y_id: np.ndarray,
+        c_id: np.ndarray,
+        table_hashes: List[str],
+        tables: np.ndarray,
+        sha256: np.ndarray,
+        progressive: np.ndarray,
+        subsampling: np.ndarray,
+        width: np.ndarray,
+        height: np.ndarray,
+        filename: StringColumn,
+        path: StringColumn,
+        alias_of: StringColumn,
+        dataset_root: Optional[str] = None,
+        attribution: Optional[AttributionModel] = None,
+        embedded: Optional[Dict[str, np.ndarray]] = None,
+        embedded_kinds: Optional[List[str]] = None,
+    ):
+        self.software_names = software_names
+        self.software = software
+        self.quality = quality
+        self.y_id = y_id
+        self.c_id = c_id
+        self.table_hashes = table_hashes
+        self.table_index = {h: i for i, h in enumerate(table_hashes)}
+        self.tables = tables
+        self.sha256 = sha256
+        self.progressive = progressive
+        self.subsampling = subsampling
+        self.width = width
+        self.height = height
+        self.filename = filename
+        self.path = path
+        self.alias_of = alias_of
+        self.dataset_root = dataset_root
+        self.attribution = attribution if attribution is not None else AttributionModel()
+        emb = embedded or {}
+        empty = np.zeros(0, dtype=np.int32)
+        self.emb_row = emb.get("row", empty)
+        self.emb_kind = emb.get("kind", empty)
+        self.emb_y = emb.get("y", empty)
+        self.emb_c = emb.get("c", empty)
+        self.emb_progressive = emb.get("prog", empty.astype(np.int8))
+        self.emb_subsampling = emb.get("sub", empty.astype(np.int8))
+        self.emb_width = emb.get("w", empty)
+        self.emb_height = emb.get("h", empty)
+        self.embedded_kinds = embedded_kinds or []
+
+    @classmethod
+    def from_items(
+        cls,
+        items: Iterable[Dict[str, Any]],
+        tables: Optional[Dict[str, str]] = None,
+        dataset_root: Optional[str] = None,
+        attribution: Optional[AttributionModel] = None,
+    ) -> "ColumnarDB":
+        """Monta as colunas a partir de itens v1 (com qtables) ou v2 (+ dicionario `tables`).
+
+        Sem `attribution`, o modelo de atribuicao e calculado dos proprios itens.
+        """
+        tables = dict(tables or {})
+        table_index: Dict[str, int] = {}
+        cols: Dict[str, List[Any]] = {k: [] for k in (
+            "software", "quality", "y", "c", "sha256", "prog", "sub", "w", "h", "filename", "path", "alias_of",
+        )}
+        emb: Dict[str, List[int]] = {k: [] for k in ("row", "kind", "y", "c", "prog", "sub", "w", "h")}
+        kind_index: Dict[str, int] = {}
+        sw_index: Dict[str, int] = {}
+
+        def tid(h: Optional[str]) -> int:
+            if h is None:
+                return NONE
+            if h not in table_index:
+                table_index[h] = len(table_index)
+            return table_index[h]
+
+        model = attribution if attribution is not None else AttributionModel()
+        for it in items:
+            if attribution is None:
+                model.add(it)
+            for rec in (it, *it.get("embedded", ())):
+                qh = rec.get("qhash") or {}
+                qt = rec.get("qtables") or {}
+                if "Y" in qt and "Y" in qh:
+                    tables.setdefault(qh["Y"], table_csv(qt["Y"]))
+                if "Cb" in qt and "C" in qh:
+                    tables.setdefault(qh["C"], table_csv(qt["Cb"]))
+            for e in it.get("embedded", ()):
+                eq, em = e.get("qhash") or {}, e.get("jpeg_meta") or {}
+                emb["row"].append(len(cols["software"]))
+                emb["kind"].append(kind_index.setdefault(e.get("kind", "?"), len(kind_index)))
+                emb["y"].append(tid(eq.get("Y")))
+                emb["c"].append(tid(eq.get("C")))
+                emb["prog"].append(NONE if em.get("progressive") is None else int(em["progressive"]))
+                emb["sub"].append(SUBSAMPLINGS.index(em["subsampling"]) if em.get("subsampling") in SUBSAMPLINGS else NONE)
+                emb["w"].append(NONE if em.get("width") is None else em["width"])
+                emb["h"].append(NONE if em.get("height") is None else em["height"])
+            qh = it.get("qhash") or {}
+            meta = it.get("jpeg_meta") or {}
+            sw = it.get("software", "?")
+            cols["software"].append(sw_index.setdefault(sw, len(sw_index)))
+            cols["quality"].append(NONE if it.get("quality") is None else it["quality"])
+            cols["y"].append(tid(qh.get("Y")))
+            cols["c"].append(tid(qh.get("C")))
+            cols["sha256"].append(bytes.fromhex(it["sha256"]) if it.get("sha256") else bytes(32))
+            prog = meta.get("progressive")
+            cols["prog"].append(NONE if prog is None else int(prog))
+            sub = meta.get("subsampling")
+            cols["sub"].append(SUBSAMPLINGS.index(sub) if sub in SUBSAMPLINGS else NONE)
+            cols["w"].append(NONE if meta.get("width") is None else meta["width"])
+            cols["h"].append(NONE if meta.get("height") is None else meta["height"])
+            cols["filename"].append(it.get("filename"))
+            cols["path"].append(it.get("path"))
+            cols["alias_of"].append(it.get("alias_of"))
+
+        # codigos de software em ordem alfabetica (ordenacao do match sem comparar strings)
+        names = sorted(sw_index)
+        remap = np.empty(len(names), dtype=np.int32)
+        for new, name in enumerate(names):
+            remap[sw_index[name]] = new
+
+        hashes = list(table_index)
+        packed = np.zeros((len(hashes), 64), dtype=np.uint16)
+        for i, h in enumerate(hashes):
+            if h in tables:
+                packed[i] = np.array(tables[h].split(","), dtype=np.uint16)
+
+        return cls(
+            software_names=names,
+            software=remap[np.array(cols["software"], dtype=np.int32)] if names else np.zeros(0, np.int32),
+            quality=np.array(cols["quality"], dtype=np.int16),
+            y_id=np.array(cols["y"], dtype=np.int32),
+            c_id=np.array(cols["c"], dtype=np.int32),
+            table_hashes=hashes,
+            tables=packed,
+            sha256=np.frombuffer(b"".join(cols["sha256"]), dtype=np.uint8).reshape(-1, 32),
+            progressive=np.array(cols["prog"], dtype=np.int8),
+            subsampling=np.array(cols["sub"], dtype=np.int8),
+            width=np.array(cols["w"], dtype=np.int32),
+            height=np.array(cols["h"], dtype=np.int32),
+            filename=StringColumn(cols["filename"]),
+            path=StringColumn(cols["path"]),
+            alias_of=StringColumn(cols["alias_of"]),
+            dataset_root=dataset_root,
+            attribution=model,
+            embedded={
+                k: np.array(v, dtype=np.int8 if k in ("prog", "sub") else np.int32) for k, v in emb.items()
+            },
+            embedded_kinds=list(kind_index),
+        )
+
+    @classmethod
+    def from_db(cls, db: Dict[str, Any]) -> "ColumnarDB":
+        """Converte o dict carregado do JSON (v1 ou v2)."""
+        model = AttributionModel.from_dict(db["attribution"]) if db.get("attribution") else None
+        return cls.from_items(
+            db.get("items", []), tables=db.get("tables"), dataset_root=db.get("dataset_root"), attribution=model
+        )
+
+    def __len__(self) -> int:
+        return len(self.quality)
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria ocupada pelas colunas (sem o dicionario hash -> id)."""
+        arrays = (
+            self.software, self.quality, self.y_id, self.c_id, self.tables, self.sha256,
+            self.progressive, self.subsampling, self.width, self.height,
+            self.emb_row, self.emb_kind, self.emb_y, self.emb_c,
+            self.emb_progressive, self.emb_subsampling, self.emb_width, self.emb_height,
+        )
+        return sum(a.nbytes for a in arrays) + self.filename.nbytes + self.path.nbytes + self.alias_of.nbytes
+
+    def table(self, qhash: str) -> Optional[List[List[int]]]:
+        i = self.table_index.get(qhash)
+        if i is None or not self.tables[i].any():
+            return None
+        return self.tables[i].reshape(8, 8).tolist()
+
+    def match_mask(self, qhash: Dict[str, str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(y_ok, c_ok) por linha. Hash fora do DB nao casa com nada (id inexistente)."""
+        y = self.table_index.get(qhash.get("Y"), -2) if "Y" in qhash else -2
+        c = self.table_index.get(qhash.get("C"), -2) if "C" in qhash else -2
+        return self.y_id == y, self.c_id == c
+
+    def item(self, i: int) -> Dict[str, Any]:
+        """Linha i no formato de item v2 (sem qtables)."""
+        qhash = {}
+        if self.y_id[i] != NONE:
+            qhash["Y"] = self.table_hashes[self.y_id[i]]
+        if self.c_id[i] != NONE:
+            qhash["C"] = self.table_hashes[self.c_id[i]]
+        prog, sub = int(self.progressive[i]), int(self.subsampling[i])
+        w, h, q = int(self.width[i]), int(self.height[i]), int(self.quality[i])
+        item = {
+            "software": self.software_names[self.software[i]],
+            "filename": self.filename[i] or None,
+            "path": self.path[i] or None,
+            "sha256": self.sha256[i].tobytes().hex() if self.sha256[i].any() else None,
+            "quality": None if q == NONE else q,
+            "qhash": qhash,
+            "jpeg_meta": {
+                "progressive": None if prog == NONE else bool(prog),
+                "subsampling": None if sub == NONE else SUBSAMPLINGS[sub],
+                "width": None if w == NONE else w,
+                "height": None if h == NONE else h,
+            },
+        }
+        alias = self.alias_of[i]
+        if alias:
+            item["alias_of"] = alias
+        lo, hi = np.searchsorted(self.emb_row, [i, i + 1])
+        if hi > lo:
+            item["embedded"] = [self._embedded(j) for j in range(int(lo), int(hi))]
+        return item
+
+    def _embedded(self, j: int) -> Dict[str, Any]:
+        qhash = {}
+        if self.emb_y[j] != NONE:
+            qhash["Y"] = self.table_hashes[self.emb_y[j]]
+        if self.emb_c[j] != NONE:
+            qhash["C"] = self.table_hashes[self.emb_c[j]]
+        prog, sub = int(self.emb_progressive[j]), int(self.emb_subsampling[j])
+        w, h = int(self.emb_width[j]), int(self.emb_height[j])
+        return {
+            "kind": self.embedded_kinds[self.emb_kind[j]],
+            "qhash": qhash,
+            "jpeg_meta": {
+                "progressive": None if prog == NONE else bool(prog),
+                "subsampling": None if sub == NONE else SUBSAMPLINGS[sub],
+                "width": None if w == NONE else w,
+                "height": None if h == NONE else h,
+            },
+        }
+
+    def candidates(self, qhash: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Itens com Y ou C igual ao do input (mesma interface de SqliteQuantDB)."""
+        y_ok, c_ok = self.match_mask(qhash)
+        for i in np.flatnonzero(y_ok | c_ok):
+            yield self.item(int(i))
+
+    def embedded_candidates(self, qhash: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Itens com uma miniatura de Y ou C igual ao qhash (mesma interface de SqliteQuantDB):
+        o item sai com o qhash da miniatura e "embedded_kind"."""
+        y = self.table_index.get(qhash.get("Y"), -2) if "Y" in qhash else -2
+        c = self.table_index.get(qhash.get("C"), -2) if "C" in qhash else -2
+        for j in np.flatnonzero((self.emb_y == y) | (self.emb_c == c)):
+            it = self.item(int(self.emb_row[j]))
+            e = self._embedded(int(j))
+            it.pop("embedded", None)
+            it["qhash"] = e["qhash"]
+            it["embedded_kind"] = e["kind"]
+            yield it
+
+    def to_db(self) -> Dict[str, Any]:
+        """Volta para o dict qext.quantdb.v2 (para gravar com save_db_json)."""
+        tables = {h: ",".join(map(str, self.tables[i].tolist())) for i, h in enumerate(self.table_hashes) if self.tables[i].any()}
+        return {
+            "schema": SCHEMA_V2,
+            "dataset_root": self.dataset_root,
+            "tables": tables,
+            "items": [self.item(i) for i in range(len(self))],
+            "attribution": self.attribution.to_dict(),
+        }
+
+
+def load_db_columnar(path: Path) -> ColumnarDB:
+    """Carrega um DB JSON (v1/v2/legado) direto para colunas."""
+    return ColumnarDB.from_db(load_db_json(Path(path)))
+
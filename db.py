@@ -1,20 +1,29 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import zlib
 from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from tqdm import tqdm
 
-from .extract import extract_jpeg_meta, extract_qtables, qhash_from_tables
-from .utils import sha256_file
+from .attribution import AttributionModel
+from .dedup import DuplicateIndex
+from .extract import embedded_fingerprints, parse_jpeg_meta, parse_qtables, qhash_from_tables
+from .profiling import count, timed
+from .scan import has_magic, iter_tree, scan_jpegs
+from .utils import flatten_8x8, imap_bounded
 
 
 QUALITY_RE = re.compile(r"(\d+)")
 
+SCHEMA_V1 = "qext.quantdb.v1"
+SCHEMA_V2 = "qext.quantdb.v2"
+
 
 def infer_quality_from_filename(name: str) -> Optional[int]:
     """Extrai o primeiro numero do nome do arquivo como quality.
@@ -35,63 +44,347 @@ def infer_quality_from_filename(name: str) -> Optional[int]:
     return None
 
 
-def _process_one(sw: str, p: Path) -> Dict[str, Any]:
-    """Processa uma imagem e devolve um registro pronto para DB."""
+def _process_one(sw: str, p: Path, sha256: Optional[str] = None) -> Dict[str, Any]:
+    """Processa uma imagem e devolve um registro pronto para DB.
+
+    O arquivo e lido uma vez: tabelas, SOF, miniaturas/previews embutidos e SHA-256 saem dos mesmos bytes.
+    """
     quality = infer_quality_from_filename(p.name)
-    qtables = extract_qtables(p)
+    with timed("read"):
+        data = p.read_bytes()
+    qtables = parse_qtables(data)
     qhash = qhash_from_tables(qtables)
-    meta = extract_jpeg_meta(p)
+    meta = parse_jpeg_meta(data)
+    embedded = [{k: v for k, v in e.items() if k != "offset"} for e in embedded_fingerprints(data, with_tables=True)]
+    if sha256 is None:
+        with timed("hash"):
+            sha256 = hashlib.sha256(data).hexdigest()
+    count("files")
 
-    return {
+    item = {
         "software": sw,
         "filename": p.name,
         "path": str(p.resolve()),
-        "sha256": sha256_file(p),
+        "sha256": sha256,
         "quality": quality,
         "qtables": qtables,
         "qhash": qhash,
         "jpeg_meta": asdict(meta),
     }
+    if embedded:
+        # fingerprints das miniaturas (EXIF/JFXX/Photoshop/MPF): sobrevivem a re-save do editor
+        item["embedded"] = embedded
+    return item
+
+
+def _alias_item(extracted: Dict[str, Any], sw: str, p: Path) -> Dict[str, Any]:
+    """Registro de uma duplicata: reaproveita a extracao do canonico, com rotulos proprios.
+
+    Sem "qtables": as tabelas ja entraram no DB pelo canonico (mesmo qhash).
+    """
+    count("aliases")
+    item = {
+        "software": sw,
+        "filename": p.name,
+        "path": str(p.resolve()),
+        "sha256": extracted["sha256"],
+        "quality": infer_quality_from_filename(p.name),
+        "qhash": extracted["qhash"],
+        "jpeg_meta": extracted["jpeg_meta"],
+        "alias_of": extracted["path"],
+    }
+    if extracted.get("embedded"):
+        item["embedded"] = [{k: v for k, v in e.items() if k != "qtables"} for e in extracted["embedded"]]
+    return item
+
+
+def shard_of(rel_path: str, n: int) -> int:
+    """Shard (0..n-1) de um arquivo pelo caminho relativo ao dataset ("software/sub/x.jpg").
+
+    crc32 do caminho: a mesma particao em qualquer maquina/execucao, independente do ponto
+    de montagem do dataset e da ordem de listagem do diretorio.
+    """
+    return zlib.crc32(rel_path.encode("utf-8")) % n
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """ "i/n" -> (i, n), com 0 <= i < n."""
+    try:
+        i, n = (int(v) for v in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard invalido: {spec!r} (use i/n, ex.: 0/4)") from None
+    if not 0 <= i < n:
+        raise ValueError(f"Shard invalido: {spec!r} (precisa 0 <= i < n)")
+    return i, n
+
+
+def _iter_dataset_files(dataset_dir: Path, shard: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[str, Path]]:
+    """Gera (software, jpeg) em streaming: dataset/<software>/**, JPEG detectado pelo conteudo.
+
+    Com shard=(i, n), so os arquivos do shard i; o filtro vem antes da leitura da assinatura,
+    entao arquivos de outros shards nao sao abertos.
+    """
+    with os.scandir(dataset_dir) as it:
+        software_dirs = [Path(e.path) for e in it if e.is_dir()]
+    for sw_dir in software_dirs:
+        if shard is None:
+            for p in scan_jpegs(sw_dir):
+                yield sw_dir.name, p
+            continue
+        i, n = shard
+        for entry in iter_tree(sw_dir):
+            p = Path(entry.path)
+            if shard_of(p.relative_to(dataset_dir).as_posix(), n) == i and has_magic(p):
+                yield sw_dir.name, p
+
+
+def iter_database_items(
+    dataset_dir: Path, workers: int = 1, dedup: bool = True, shard: Optional[Tuple[int, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Varre dataset_dir/<software>/** e gera os registros do DB um a um.
+
+    Base comum dos backends (JSON em memoria, SQLite em lotes). A varredura e
+    a extracao andam juntas (pool limitado), entao o primeiro registro sai logo.
+    Com dedup=True, arquivos de conteudo identico (tamanho -> hash parcial -> SHA-256)
+    sao extraidos uma unica vez; as copias saem como registros com "alias_of".
+    Com shard=(i, n), so a particao i (ver shard_of); copias entre shards sao
+    resolvidas no merge (merge.merge_databases).
+    """
+    dataset_dir = Path(dataset_dir)
+    if not dataset_dir.exists():
+        raise FileNotFoundError(f"Dataset nao encontrado: {dataset_dir}")
+
+    idx = DuplicateIndex()
+    # canonico -> resumo da extracao, so para canonicos que ja tem copias ou cujo tamanho
+    # colidiu (os unicos que ainda podem ganhar copias); um canonico descartado que ganhar
+    # copia depois e extraido de novo por ela. Copias podem terminar antes do canonico (waiting).
+    extracted: Dict[Path, Dict[str, Any]] = {}
+    inflight: Set[Path] = set()
+    owed: Set[Path] = set()  # canonicos em voo com copias ja submetidas (o resumo precisa ficar)
+    waiting: Dict[Path, List[Tuple[str, Path]]] = {}
+
+    def jobs() -> Iterator[Tuple[str, Path, Optional[Path], bool]]:
+        # roda na thread principal (imap_bounded consome o gerador), junto com o laco abaixo
+        for sw, p in _iter_dataset_files(dataset_dir, shard):
+            canon, own = None, True
+            if dedup:
+                with timed("dedup"):
+                    canon = idx.add(p)
+                if canon is None:
+                    inflight.add(p)
+                elif canon in extracted or canon in inflight:
+                    own = False
+                    if canon not in extracted:
+                        owed.add(canon)
+                else:
+                    # canonico de tamanho unico quando extraido (resumo nao guardado): a copia e extraida
+                    inflight.add(canon)
+            yield sw, p, canon, own
 
+    def work(job: Tuple[str, Path, Optional[Path], bool]) -> Tuple[Tuple[str, Path, Optional[Path], bool], Optional[Dict[str, Any]]]:
+        sw, p, canon, own = job
+        if not own:
+            return job, None
+        return job, _process_one(sw, p, sha256=idx.known_sha256(p))
 
-def build_database(dataset_dir: Path, workers: int = 1) -> Dict[str, Any]:
+    def summary(item: Dict[str, Any], canon: Path) -> Dict[str, Any]:
+        out = {k: item[k] for k in ("sha256", "qhash", "jpeg_meta")}
+        out["path"] = str(canon.resolve())
+        out["embedded"] = item.get("embedded")
+        return out
+
+    for (sw, p, canon, own), item in tqdm(imap_bounded(work, jobs(), workers=workers), desc="[build-db]", unit="img"):
+        if item is None:
+            if canon in extracted:
+                yield _alias_item(extracted[canon], sw, p)
+            else:
+                waiting.setdefault(canon, []).append((sw, p))
+            continue
+        if not dedup:
+            yield item
+            continue
+        key = p if canon is None else canon
+        summ = summary(item, key)
+        yield item if canon is None else _alias_item(summ, sw, p)
+        inflight.discard(key)
+        # ja tem copias (tendem a ter mais) ou o tamanho colidiu com outro arquivo
+        if canon is not None or key in owed or idx.size_collided(key):
+            extracted[key] = summ
+        owed.discard(key)
+        for sw_dup, dup in waiting.pop(key, []):
+            yield _alias_item(summ, sw_dup, dup)
+
+
+def build_database(
+    dataset_dir: Path, workers: int = 1, dedup: bool = True, shard: Optional[Tuple[int, int]] = None
+) -> Dict[str, Any]:
     """Varre dataset_dir/<software>/*.jpg e monta um DB auditavel.
 
     Parametros:
       - workers: numero de threads para processar JPEGs (I/O + parse). Use 4-16 para lotes grandes.
+      - dedup: extrai copias identicas uma unica vez (registradas com "alias_of").
+      - shard: (i, n) monta so a particao i de n (DB parcial, registrado em "shard"; junte com merge-db).
+
+    O DB sai com "attribution": contagens P(software, quality | Y, C, subsampling,
+    progressive) usadas pelo match para ranquear familias de encoder.
     """
     dataset_dir = Path(dataset_dir)
     if not dataset_dir.exists():
         raise FileNotFoundError(f"Dataset nao encontrado: {dataset_dir}")
 
     db: Dict[str, Any] = {
-        "schema": "qext.quantdb.v1",
+        "schema": SCHEMA_V2,
         "dataset_root": str(dataset_dir.resolve()),
+        "tables": {},
         "items": [],
     }
+    if shard is not None:
+        db["shard"] = list(shard)
+    model = AttributionModel()
+    for it in iter_database_items(dataset_dir, workers=workers, dedup=dedup, shard=shard):
+        model.add(it)
+        db["items"].append(pack_item(it, db["tables"]))
+    db["attribution"] = model.to_dict()
+    return db
+
+
+def table_csv(mat: List[List[int]]) -> str:
+    """Serializa uma tabela 8x8 no CSV de 64 valores usado pelo qhash (sha256 deste texto)."""
+    return ",".join(map(str, flatten_8x8(mat)))
 
-    software_dirs = [p for p in dataset_dir.iterdir() if p.is_dir()]
-    for sw_dir in software_dirs:
-        sw = sw_dir.name
-        jpgs = sorted([p for p in sw_dir.iterdir() if p.is_file() and p.suffix.lower() in {".jpg", ".jpeg"}])
-
-        if workers <= 1:
-            for p in tqdm(jpgs, desc=f"[{sw}]", unit="img"):
-                db["items"].append(_process_one(sw, p))
-        else:
-            with ThreadPoolExecutor(max_workers=workers) as ex:
-                futs = [ex.submit(_process_one, sw, p) for p in jpgs]
-                for fut in tqdm(as_completed(futs), total=len(futs), desc=f"[{sw}]", unit="img"):
-                    db["items"].append(fut.result())
 
+def csv_to_8x8(csv: str) -> List[List[int]]:
+    vals = [int(v) for v in csv.split(",")]
+    return [vals[r * 8 : (r + 1) * 8] for r in range(8)]
+
+
+def _pack_tables(rec: Dict[str, Any], tables: Dict[str, str]) -> Dict[str, Any]:
+    qt, qh = rec.get("qtables") or {}, rec.get("qhash") or {}
+    if "Y" in qt and "Y" in qh:
+        tables.setdefault(qh["Y"], table_csv(qt["Y"]))
+    if "Cb" in qt and "C" in qh:
+        tables.setdefault(qh["C"], table_csv(qt["Cb"]))
+    return {k: v for k, v in rec.items() if k != "qtables"}
+
+
+def _unpack_tables(rec: Dict[str, Any], tables: Dict[str, str]) -> Dict[str, Any]:
+    out = dict(rec)
+    qh = rec.get("qhash") or {}
+    qt: Dict[str, Any] = {}
+    if qh.get("Y") in tables:
+        qt["Y"] = csv_to_8x8(tables[qh["Y"]])
+    if qh.get("C") in tables:
+        chroma = csv_to_8x8(tables[qh["C"]])
+        qt["Cb"] = chroma
+        qt["Cr"] = chroma
+    out["qtables"] = qt
+    return out
+
+
+def pack_item(item: Dict[str, Any], tables: Dict[str, str]) -> Dict[str, Any]:
+    """Item v1 -> v2: tabelas vao para o dicionario `tables` (chave = qhash), o item so referencia.
+
+    Vale tambem para as tabelas das miniaturas em "embedded".
+    """
+    out = _pack_tables(item, tables)
+    if "embedded" in item:
+        out["embedded"] = [_pack_tables(e, tables) for e in item["embedded"]]
+    return out
+
+
+def unpack_item(item: Dict[str, Any], tables: Dict[str, str]) -> Dict[str, Any]:
+    """Item v2 -> v1 (com "qtables" Y/Cb/Cr embutidas), para leitores antigos."""
+    out = _unpack_tables(item, tables)
+    if "embedded" in item:
+        out["embedded"] = [_unpack_tables(e, tables) for e in item["embedded"]]
+    return out
+
+
+def pack_db(db: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte um DB v1 para v2 (tabelas deduplicadas). DB v2 e devolvido como esta."""
+    if db.get("schema") == SCHEMA_V2:
+        return db
+    tables: Dict[str, str] = {}
+    items = [pack_item(it, tables) for it in db.get("items", [])]
+    out = {k: v for k, v in db.items() if k != "items"}
+    out.update({"schema": SCHEMA_V2, "tables": tables, "items": items})
+    return out
+
+
+def iter_items(db: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Itera os itens sempre no formato v1 (com qtables), seja o DB v1 ou v2."""
+    if db.get("schema") != SCHEMA_V2:
+        yield from db.get("items", [])
+        return
+    tables = db.get("tables", {})
+    for it in db.get("items", []):
+        yield unpack_item(it, tables)
+
+
+def unpack_db(db: Dict[str, Any]) -> Dict[str, Any]:
+    """DB v2 -> v1 completo em memoria (compatibilidade)."""
+    out = {k: v for k, v in db.items() if k not in ("tables", "items")}
+    out["schema"] = SCHEMA_V1
+    out["items"] = list(iter_items(db))
+    return out
+
+
+def convert_legacy_db(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Converte a saida do extrator categorico (forensic_db_combined.json) para v2.
+
+    Os qhash sao recalculados no formato do qext (o hash legado usa outro separador).
+    """
+    db: Dict[str, Any] = {"schema": SCHEMA_V2, "dataset_root": None, "tables": {}, "items": []}
+    for e in entries:
+        info = e.get("informacoes_categoricas", {})
+        tq = e.get("tabelas_quantizacao", {})
+        arq = e.get("arquivo", {})
+        qtables: Dict[str, Any] = {}
+        if tq.get("luminancia_Y"):
+            qtables["Y"] = tq["luminancia_Y"]
+        if tq.get("crominancia_C"):
+            qtables["Cb"] = qtables["Cr"] = tq["crominancia_C"]
+        sub = info.get("subsampling")
+        item = {
+            "software": info.get("software", "?"),
+            "filename": arq.get("nome"),
+            "path": arq.get("caminho"),
+            "sha256": arq.get("sha256"),
+            "quality": info.get("fator_qualidade"),
+            "qtables": qtables,
+            "qhash": qhash_from_tables(qtables),
+            "jpeg_meta": {
+                "progressive": info.get("progressive"),
+                "subsampling": sub if sub in ("444", "422", "420") else None,
+                "width": None,
+                "height": None,
+            },
+        }
+        db["items"].append(pack_item(item, db["tables"]))
+    db["attribution"] = AttributionModel().add_items(db["items"]).to_dict()
     return db
 
 
 def save_db_json(db: Dict[str, Any], out_path: Path) -> None:
+    """Grava o DB em JSON no formato v2 (DB v1 e convertido antes)."""
     out_path = Path(out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(db, indent=2, ensure_ascii=False), encoding="utf-8")
+    db = pack_db(db)
+    with timed("json_serialize"):
+        text = json.dumps(db, indent=2, ensure_ascii=False)
+    with timed("write"):
+        out_path.write_text(text, encoding="utf-8")
 
 
 def load_db_json(path: Path) -> Dict[str, Any]:
-    return json.loads(Path(path).read_text(encoding="utf-8"))
+    """Carrega o DB como gravado (v1 ou v2). Use iter_items() para ler itens no formato v1.
+
+    Arquivos do extrator categorico (lista JSON) sao convertidos para v2.
+    """
+    with timed("read"):
+        text = Path(path).read_text(encoding="utf-8")
+    with timed("json_load"):
+        db = json.loads(text)
+    if isinstance(db, list):
+        return convert_legacy_db(db)
+    return db
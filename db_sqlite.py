@@ -0,0 +1,489 @@
+from __future__ import annotations
+
+import sqlite3
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .attribution import AttributionModel, evidence_keys, is_synthetic, item_evidence, posterior
+from .db import SCHEMA_V2, csv_to_8x8, iter_database_items, iter_items, load_db_json, table_csv
+from .profiling import timed
+
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+SQLITE_SUFFIXES = {".sqlite", ".sqlite3", ".db"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+-- uma linha por tabela distinta; hash = qhash (SHA-256 do CSV dos 64 valores)
+CREATE TABLE IF NOT EXISTS qtables (
+    hash      TEXT PRIMARY KEY,
+    table_csv TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id          INTEGER PRIMARY KEY,
+    software    TEXT NOT NULL,
+    filename    TEXT,
+    path        TEXT,
+    sha256      TEXT,
+    quality     INTEGER,
+    qhash_y     TEXT REFERENCES qtables(hash),
+    qhash_c     TEXT REFERENCES qtables(hash),
+    progressive INTEGER,
+    subsampling TEXT,
+    width       INTEGER,
+    height      INTEGER,
+    alias_of    TEXT,
+    UNIQUE (path, sha256)
+);
+-- contagens do modelo de atribuicao (attribution.py); quality -1 = desconhecida
+CREATE TABLE IF NOT EXISTS attribution (
+    level    TEXT NOT NULL,
+    key      TEXT NOT NULL,
+    software TEXT NOT NULL,
+    quality  INTEGER NOT NULL,
+    count    INTEGER NOT NULL,
+    PRIMARY KEY (level, key, software, quality)
+) WITHOUT ROWID;
+-- evidencia sintetica (synth-db): cada (software, quality) vale 1 por chave, sem contagem
+CREATE TABLE IF NOT EXISTS attribution_synthetic (
+    level    TEXT NOT NULL,
+    key      TEXT NOT NULL,
+    software TEXT NOT NULL,
+    quality  INTEGER NOT NULL,
+    PRIMARY KEY (level, key, software, quality)
+) WITHOUT ROWID;
+-- miniaturas/previews embutidos de cada item (EXIF, JFXX, Photoshop, MPF)
+CREATE TABLE IF NOT EXISTS embedded (
+    item_id     INTEGER NOT NULL REFERENCES items(id),
+    kind        TEXT NOT NULL,
+    qhash_y     TEXT REFERENCES qtables(hash),
+    qhash_c     TEXT REFERENCES qtables(hash),
+    progressive INTEGER,
+    subsampling TEXT,
+    width       INTEGER,
+    height      INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_items_qhash_y  ON items(qhash_y);
+CREATE INDEX IF NOT EXISTS idx_items_qhash_c  ON items(qhash_c);
+CREATE INDEX IF NOT EXISTS idx_items_software ON items(software);
+CREATE INDEX IF NOT EXISTS idx_items_quality  ON items(quality);
+CREATE INDEX IF NOT EXISTS idx_items_sha256   ON items(sha256);
+CREATE INDEX IF NOT EXISTS idx_embedded_qhash_y ON embedded(qhash_y);
+CREATE INDEX IF NOT EXISTS idx_embedded_qhash_c ON embedded(qhash_c);
+CREATE INDEX IF NOT EXISTS idx_embedded_item    ON embedded(item_id);
+"""
+
+_ITEM_COLS = "software, filename, path, sha256, quality, qhash_y, qhash_c, progressive, subsampling, width, height, alias_of"
+# mesmas colunas qualificadas, para joins com embedded (que tambem tem qhash_y/qhash_c/...)
+_ITEM_COLS_Q = ", ".join(f"items.{c.strip()}" for c in _ITEM_COLS.split(","))
+_EMBEDDED_COLS = "kind, qhash_y, qhash_c, progressive, subsampling, width, height"
+
+
+def is_sqlite_file(path: Path) -> bool:
+    """Detecta SQLite pelo header do arquivo (nao pela extensao)."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def connect_db_sqlite(path: Path, readonly: bool = False, timeout: float = 30.0) -> sqlite3.Connection:
+    """Abre (ou cria) o DB SQLite pronto para uso concorrente.
+
+    WAL permite varios leitores simultaneos com um escritor; busy_timeout faz
+    processos concorrentes esperarem o lock em vez de falhar com "database is locked".
+    """
+    path = Path(path)
+    if readonly:
+        if not path.exists():
+            raise FileNotFoundError(f"DB nao encontrado: {path}")
+        conn = sqlite3.connect(f"file:{path.resolve()}?mode=ro", uri=True, timeout=timeout)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(path), timeout=timeout)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _backfill_attribution(conn)
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _item_row(it: Dict[str, Any]) -> Tuple[Any, ...]:
+    qh = it.get("qhash", {})
+    meta = it.get("jpeg_meta") or {}
+    prog = meta.get("progressive")
+    return (
+        it.get("software", "?"),
+        it.get("filename"),
+        it.get("path"),
+        it.get("sha256"),
+        it.get("quality"),
+        qh.get("Y"),
+        qh.get("C"),
+        None if prog is None else int(prog),
+        meta.get("subsampling"),
+        meta.get("width"),
+        meta.get("height"),
+        it.get("alias_of"),
+    )
+
+
+def _embedded_row(e: Dict[str, Any]) -> Tuple[Any, ...]:
+    qh = e.get("qhash", {})
+    meta = e.get("jpeg_meta") or {}
+    prog = meta.get("progressive")
+    return (
+        e.get("kind"),
+        qh.get("Y"),
+        qh.get("C"),
+        None if prog is None else int(prog),
+        meta.get("subsampling"),
+        meta.get("width"),
+        meta.get("height"),
+    )
+
+
+def _row_to_embedded(row: sqlite3.Row) -> Dict[str, Any]:
+    qhash = {}
+    if row["qhash_y"] is not None:
+        qhash["Y"] = row["qhash_y"]
+    if row["qhash_c"] is not None:
+        qhash["C"] = row["qhash_c"]
+    prog = row["progressive"]
+    return {
+        "kind": row["kind"],
+        "qhash": qhash,
+        "jpeg_meta": {
+            "progressive": None if prog is None else bool(prog),
+            "subsampling": row["subsampling"],
+            "width": row["width"],
+            "height": row["height"],
+        },
+    }
+
+
+_ATTRIBUTION_UPSERT = (
+    "INSERT INTO attribution(level, key, software, quality, count) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(level, key, software, quality) DO UPDATE SET count = count + excluded.count"
+)
+
+
+_SYNTHETIC_INSERT = "INSERT OR IGNORE INTO attribution_synthetic(level, key, software, quality) VALUES (?, ?, ?, ?)"
+
+
+def _attribution_rows(items: Iterable[Dict[str, Any]]) -> List[Tuple[str, str, str, int, int]]:
+    counts: Counter = Counter()
+    for it in items:
+        (sw, q), keys = item_evidence(it)
+        for level, key in keys:
+            counts[(level, key, sw, -1 if q is None else q)] += 1
+    return [(*k, n) for k, n in counts.items()]
+
+
+def _write_attribution(conn: sqlite3.Connection, items: List[Dict[str, Any]]) -> None:
+    """Contagens dos itens reais; itens sinteticos so marcam presenca (ver AttributionModel)."""
+    conn.executemany(_ATTRIBUTION_UPSERT, _attribution_rows(it for it in items if not is_synthetic(it)))
+    conn.executemany(_SYNTHETIC_INSERT, [row[:4] for row in _attribution_rows(it for it in items if is_synthetic(it))])
+
+
+def _backfill_attribution(conn: sqlite3.Connection) -> None:
+    """DB criado antes da tabela attribution: calcula as contagens a partir dos itens ja gravados."""
+    has_counts = conn.execute(
+        "SELECT EXISTS(SELECT 1 FROM attribution) OR EXISTS(SELECT 1 FROM attribution_synthetic)"
+    ).fetchone()[0]
+    if has_counts or not conn.execute("SELECT EXISTS(SELECT 1 FROM items)").fetchone()[0]:
+        return
+    conn.row_factory = sqlite3.Row
+    items = [_row_to_item(row) for row in conn.execute(f"SELECT {_ITEM_COLS} FROM items")]
+    with conn:
+        _write_attribution(conn, items)
+
+
+def insert_items(conn: sqlite3.Connection, items: Iterable[Dict[str, Any]], batch_size: int = 500) -> int:
+    """Insere itens (formato qext.quantdb.v1) em lotes, um commit por lote.
+
+    Reexecutar sobre o mesmo dataset e idempotente (UNIQUE(path, sha256)). As
+    contagens de atribuicao sao atualizadas no mesmo lote, so para itens novos.
+    """
+    n = 0
+    batch: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        tables = {}
+        for it in batch:
+            for rec in (it, *it.get("embedded", ())):
+                qt, qh = rec.get("qtables", {}), rec.get("qhash", {})
+                if "Y" in qt and "Y" in qh:
+                    tables[qh["Y"]] = table_csv(qt["Y"])
+                if "Cb" in qt and "C" in qh:
+                    tables[qh["C"]] = table_csv(qt["Cb"])
+        inserted: List[Dict[str, Any]] = []
+        with timed("sqlite_insert"), conn:
+            conn.executemany("INSERT OR IGNORE INTO qtables(hash, table_csv) VALUES (?, ?)", tables.items())
+            for it in batch:
+                # linha a linha: rowcount diz se o item entrou (repetido no DB ou no proprio lote = 0)
+                cur = conn.execute(f"INSERT OR IGNORE INTO items({_ITEM_COLS}) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", _item_row(it))
+                if cur.rowcount != 1:
+                    continue
+                inserted.append(it)
+                if it.get("embedded"):
+                    conn.executemany(
+                        f"INSERT INTO embedded(item_id, {_EMBEDDED_COLS}) VALUES (?,?,?,?,?,?,?,?)",
+                        [(cur.lastrowid, *_embedded_row(e)) for e in it["embedded"]],
+                    )
+            _write_attribution(conn, inserted)
+            if inserted:
+                # identifica esta versao do conteudo (carimbo do <db>.bloom, ver prefilter._source_stamp)
+                conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('generation', ?)", (uuid.uuid4().hex,))
+        batch.clear()
+
+    for it in items:
+        batch.append(it)
+        n += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return n
+
+
+def build_database_sqlite(
+    dataset_dir: Path,
+    out_path: Path,
+    workers: int = 1,
+    batch_size: int = 500,
+    dedup: bool = True,
+    shard: Optional[Tuple[int, int]] = None,
+) -> int:
+    """Como build_database, mas grava direto no SQLite em lotes (sem montar o DB em memoria)."""
+    conn = connect_db_sqlite(out_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta(key, value) VALUES ('schema', 'qext.quantdb.sqlite.v1'), ('dataset_root', ?)",
+                (str(Path(dataset_dir).resolve()),),
+            )
+            if shard is not None:
+                conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('shard', ?)", (f"{shard[0]}/{shard[1]}",))
+        items = iter_database_items(Path(dataset_dir), workers=workers, dedup=dedup, shard=shard)
+        return insert_items(conn, items, batch_size=batch_size)
+    finally:
+        conn.close()
+
+
+def save_db_sqlite(db: Dict[str, Any], out_path: Path, batch_size: int = 500) -> int:
+    """Converte um DB em memoria (dict v1 ou v2) para SQLite."""
+    conn = connect_db_sqlite(out_path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                [("schema", "qext.quantdb.sqlite.v1"), ("dataset_root", db.get("dataset_root"))],
+            )
+        return insert_items(conn, iter_items(db), batch_size=batch_size)
+    finally:
+        conn.close()
+
+
+def _row_to_item(row: sqlite3.Row) -> Dict[str, Any]:
+    qhash = {}
+    if row["qhash_y"] is not None:
+        qhash["Y"] = row["qhash_y"]
+    if row["qhash_c"] is not None:
+        qhash["C"] = row["qhash_c"]
+    prog = row["progressive"]
+    item = {
+        "software": row["software"],
+        "filename": row["filename"],
+        "path": row["path"],
+        "sha256": row["sha256"],
+        "quality": row["quality"],
+        "qhash": qhash,
+        "jpeg_meta": {
+            "progressive": None if prog is None else bool(prog),
+            "subsampling": row["subsampling"],
+            "width": row["width"],
+            "height": row["height"],
+        },
+    }
+    if row["alias_of"] is not None:
+        item["alias_of"] = row["alias_of"]
+    return item
+
+
+class SqliteQuantDB:
+    """DB de referencia em SQLite consultado por indice (sem carregar itens em memoria).
+
+    Pode ser passado diretamente para match_against_db no lugar do dict JSON.
+    """
+
+    def __init__(self, path: Path, readonly: bool = True):
+        self.path = Path(path)
+        self.conn = connect_db_sqlite(self.path, readonly=readonly)
+        self._attribution: Optional[AttributionModel] = None
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "SqliteQuantDB":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def candidates(self, qhash: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Itens com qhash_y == Y ou qhash_c == C (usa os dois indices)."""
+        y, c = qhash.get("Y"), qhash.get("C")
+        if y is None and c is None:
+            return
+        with timed("sqlite_query"):
+            cur = self.conn.execute(f"SELECT {_ITEM_COLS} FROM items WHERE qhash_y = ? OR qhash_c = ?", (y, c))
+        # cursor em streaming: tabelas populares (ex.: IJG Q75) nao viram uma lista inteira em memoria
+        for row in cur:
+            yield _row_to_item(row)
+
+    def embedded_candidates(self, qhash: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Itens com uma miniatura/preview de Y ou C igual ao qhash dado. Cada item sai com o
+        qhash da miniatura (para o score) e "embedded_kind"."""
+        y, c = qhash.get("Y"), qhash.get("C")
+        if y is None and c is None:
+            return
+        sql = (
+            f"SELECT {_ITEM_COLS_Q}, e.kind AS e_kind, e.qhash_y AS e_y, e.qhash_c AS e_c FROM embedded e "
+            "JOIN items ON items.id = e.item_id WHERE e.qhash_y = ? OR e.qhash_c = ?"
+        )
+        try:
+            with timed("sqlite_query"):
+                cur = self.conn.execute(sql, (y, c))
+        except sqlite3.OperationalError:
+            return  # DB criado antes da tabela embedded
+        for row in cur:
+            it = _row_to_item(row)
+            it["qhash"] = {k: v for k, v in (("Y", row["e_y"]), ("C", row["e_c"])) if v is not None}
+            it["embedded_kind"] = row["e_kind"]
+            yield it
+
+    def _embedded_for(self, ids: List[int], with_tables: bool) -> Dict[int, List[Dict[str, Any]]]:
+        """Miniaturas dos itens `ids` (um lote), pelo indice de item_id."""
+        out: Dict[int, List[Dict[str, Any]]] = {}
+        extra = ", ty.table_csv AS y_csv, tc.table_csv AS c_csv" if with_tables else ""
+        joins = (
+            " LEFT JOIN qtables ty ON ty.hash = embedded.qhash_y LEFT JOIN qtables tc ON tc.hash = embedded.qhash_c"
+            if with_tables else ""
+        )
+        cols = ", ".join(f"embedded.{c.strip()}" for c in _EMBEDDED_COLS.split(","))
+        rows = self.conn.execute(
+            f"SELECT embedded.item_id AS item_id, {cols}{extra} FROM embedded{joins} "
+            f"WHERE embedded.item_id IN ({','.join('?' * len(ids))}) ORDER BY embedded.item_id, embedded.rowid",
+            ids,
+        )
+        for row in rows:
+            e = _row_to_embedded(row)
+            if with_tables:
+                qt: Dict[str, Any] = {}
+                if row["y_csv"] is not None:
+                    qt["Y"] = csv_to_8x8(row["y_csv"])
+                if row["c_csv"] is not None:
+                    qt["Cb"] = qt["Cr"] = csv_to_8x8(row["c_csv"])
+                e["qtables"] = qt
+            out.setdefault(row["item_id"], []).append(e)
+        return out
+
+    def _synthetic_labels(self, level: str, key: str) -> List[Tuple[str, int]]:
+        try:
+            return self.conn.execute(
+                "SELECT software, quality FROM attribution_synthetic WHERE level = ? AND key = ?", (level, key)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []  # DB (aberto so para leitura) criado antes da tabela: sem evidencia sintetica
+
+    def attribute(self, qhash: Dict[str, str], meta: Optional[Dict[str, Any]] = None, topk: int = 10) -> Dict[str, Any]:
+        """Posterior de atribuicao (ver AttributionModel.attribute), consultado pela chave primaria."""
+        if self._attribution is not None:
+            return self._attribution.attribute(qhash, meta, topk=topk)
+        try:
+            for level, key in evidence_keys(qhash, meta):
+                rows = self.conn.execute(
+                    "SELECT software, quality, count FROM attribution WHERE level = ? AND key = ?", (level, key)
+                ).fetchall()
+                counts = {(sw, None if q < 0 else q): n for sw, q, n in rows}
+                for sw, q in self._synthetic_labels(level, key):
+                    label = (sw, None if q < 0 else q)
+                    counts[label] = counts.get(label, 0) + 1
+                if counts:
+                    return posterior(counts, level, topk=topk)
+        except sqlite3.OperationalError:
+            # DB criado antes da tabela attribution: modelo calculado em memoria uma vez
+            self._attribution = AttributionModel().add_items(self.iter_items())
+            return self._attribution.attribute(qhash, meta, topk=topk)
+        return {"level": None, "n": 0, "families": [], "posterior": []}
+
+    def iter_items(self, with_tables: bool = False, by_sha256: bool = False, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Itera todos os itens no formato qext.quantdb.v1 (streaming, em ordem de id).
+
+        Os itens saem em lotes de batch_size; as miniaturas ("embedded") de cada lote vem de
+        uma consulta pelo indice de item_id, entao a memoria nao cresce com o tamanho do DB.
+        by_sha256=True ordena por (sha256, path), pelo indice: entrada do merge k-way.
+        """
+        try:
+            has_embedded = self.conn.execute("SELECT EXISTS(SELECT 1 FROM embedded)").fetchone()[0]
+        except sqlite3.OperationalError:
+            has_embedded = False  # DB criado antes da tabela embedded
+        order = "items.sha256, items.path" if by_sha256 else "items.id"
+        if with_tables:
+            sql = (
+                f"SELECT items.id AS id, {_ITEM_COLS_Q}, ty.table_csv AS y_csv, tc.table_csv AS c_csv FROM items "
+                "LEFT JOIN qtables ty ON ty.hash = items.qhash_y "
+                f"LEFT JOIN qtables tc ON tc.hash = items.qhash_c ORDER BY {order}"
+            )
+        else:
+            sql = f"SELECT items.id AS id, {_ITEM_COLS} FROM items ORDER BY {order}"
+        cur = self.conn.execute(sql)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            embedded = self._embedded_for([row["id"] for row in rows], with_tables) if has_embedded else {}
+            for row in rows:
+                it = _row_to_item(row)
+                if row["id"] in embedded:
+                    it["embedded"] = embedded[row["id"]]
+                if with_tables:
+                    qt: Dict[str, Any] = {}
+                    if row["y_csv"] is not None:
+                        qt["Y"] = csv_to_8x8(row["y_csv"])
+                    if row["c_csv"] is not None:
+                        qt["Cb"] = qt["Cr"] = csv_to_8x8(row["c_csv"])
+                    it["qtables"] = qt
+                yield it
+
+
+def load_db_sqlite(path: Path) -> Dict[str, Any]:
+    """Carrega o SQLite inteiro como dict qext.quantdb.v2 (mesmo formato do JSON)."""
+    with SqliteQuantDB(path) as sdb:
+        meta = dict(sdb.conn.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            "schema": SCHEMA_V2,
+            "dataset_root": meta.get("dataset_root"),
+            "tables": dict(sdb.conn.execute("SELECT hash, table_csv FROM qtables").fetchall()),
+            "items": list(sdb.iter_items()),
+        }
+
+
+def open_db(path: Path) -> Union[Dict[str, Any], SqliteQuantDB]:
+    """Abre o DB de referencia no backend adequado (SQLite por indice ou JSON em memoria)."""
+    path = Path(path)
+    if is_sqlite_file(path):
+        return SqliteQuantDB(path)
+    return load_db_json(path)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+# Sem imports relativos de proposito: scripts/extrator_dqt_categorico.py importa
+# este modulo direto da raiz do repositorio.
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+PARTIAL_BYTES = 64 * 1024
+
+
+def partial_hash(path: Path, size: int, n: int = PARTIAL_BYTES) -> str:
+    """SHA-256 dos primeiros e ultimos n bytes (arquivo inteiro se size <= 2n)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        if size <= 2 * n:
+            h.update(f.read())
+        else:
+            h.update(f.read(n))
+            f.seek(size - n)
+            h.update(f.read(n))
+    return h.hexdigest()
+
+
+def full_hash(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DuplicateIndex:
+    """Detecta arquivos de conteudo identico de forma incremental.
+
+    Estagios, do mais barato ao mais caro, cada um so quando o anterior colide:
+      1. tamanho (stat, sem ler o arquivo)
+      2. hash parcial: primeiros/ultimos 64 KB
+      3. SHA-256 completo
+
+    Arquivos de tamanho unico nunca sao lidos. add() devolve o arquivo canonico
+    (o primeiro visto) quando `path` e duplicata, senao None.
+    """
+
+    def __init__(self, partial_bytes: int = PARTIAL_BYTES):
+        self.partial_bytes = partial_bytes
+        self._by_size: Dict[int, List[Path]] = {}
+        self._partial: Dict[Path, str] = {}
+        self._full: Dict[Path, str] = {}
+
+    def _partial_of(self, path: Path, size: int) -> str:
+        if path not in self._partial:
+            self._partial[path] = partial_hash(path, size, self.partial_bytes)
+        return self._partial[path]
+
+    def _full_of(self, path: Path) -> str:
+        if path not in self._full:
+            self._full[path] = full_hash(path)
+        return self._full[path]
+
+    def known_sha256(self, path: Path) -> Optional[str]:
+        """SHA-256 ja calculado durante a deduplicacao (evita hashear de novo)."""
+        return self._full.get(Path(path))
+
+    def size_collided(self, path: Path) -> bool:
+        """True se outro arquivo ja visto tem o mesmo tamanho que `path`.
+
+        Um canonico de tamanho unico so ganha copias se aparecer outro arquivo desse tamanho;
+        quem guarda dados por canonico pode guardar so os que colidiram (e refazer no caso raro).
+        """
+        return len(self._by_size.get(os.stat(path).st_size, ())) > 1
+
+    def add(self, path: Path) -> Optional[Path]:
+        path = Path(path)
+        size = os.stat(path).st_size
+        canon = self._by_size.get(size)
+        if canon is None:
+            self._by_size[size] = [path]
+            return None
+
+        ph = self._partial_of(path, size)
+        for c in canon:
+            if self._partial_of(c, size) == ph and self._full_of(c) == self._full_of(path):
+                return c
+        canon.append(path)
+        return None
+
@@ -0,0 +1,11 @@
+"""
+Stage timing hook for the analyzers: `timed` from the package profiler when deepfake_module
+is imported as part of quantization_extend, a no-op context manager otherwise.
+"""
+try:
+    from ..profiling import timed
+except ImportError:  # standalone use, outside the quantization_extend package
+    from contextlib import nullcontext
+
+    def timed(name):
+        return nullcontext()
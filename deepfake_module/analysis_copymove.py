@@ -0,0 +1,253 @@
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    from ._profiling import timed
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from _profiling import timed
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis (rows = frequencies)."""
+    k = np.arange(n)
+    d = np.cos((2 * k[None, :] + 1) * k[:, None] * np.pi / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d.astype(np.float32)
+
+
+# Lowest frequencies in zigzag order: robust to recompression and noise, and exactly
+# 8 of them so the quantized feature vector packs into one uint64 sort key.
+FEATURE_MODES = ((0, 0), (0, 1), (1, 0), (2, 0), (1, 1), (0, 2), (0, 3), (1, 2))
+
+
+class ForensicCopyMove:
+    """
+    Copy-move (cloned region) detection with overlapping-block DCT features.
+    Every block x block window (stride 1) is described by its lowest DCT coefficients,
+    computed for all windows at once as separable filters. Quantized features are packed
+    into a uint64 key and sorted lexicographically, so similar blocks become neighbours:
+    only nearby rows are compared, never all pairs. Candidate pairs vote for their shift
+    vector; a shift with enough votes whose matching blocks form a connected region is a
+    copied area, and those blocks (source and destination) form the mask.
+    """
+
+    def __init__(
+        self,
+        block: int = 16,
+        quant: float = 1.0,
+        tolerance: float = 1.0,
+        window: int = 6,
+        min_shift: int = 24,
+        min_votes: int = 64,
+        min_region: int = 200,
+        max_regions: int = 32,
+        min_std: float = 4.0,
+        max_pixels: Optional[int] = 3_000_000,
+    ):
+        self.block = block
+        self.quant = quant  # feature quantization step for the sort key (gray levels)
+        self.tolerance = tolerance  # max |feature difference| of a matching pair (gray levels)
+        self.window = window  # sorted neighbours compared per block
+        self.min_shift = min_shift  # shorter shifts are overlapping windows of the same region
+        self.min_votes = min_votes  # block pairs needed to consider a shift vector
+        self.min_region = min_region  # connected matching block positions needed to accept it
+        self.max_regions = max_regions  # strongest shift clusters checked for connectivity
+        self.min_std = min_std  # flat blocks (sky, walls) match everything: skipped
+        self.max_pixels = max_pixels  # larger images are analyzed at reduced resolution
+        self._bridge = np.ones((5, 5), np.uint8)
+        basis = _dct_matrix(block)
+        self._kernels = [(basis[u], basis[v]) for u, v in FEATURE_MODES]
+
+    def block_features(self, gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Features of all overlapping blocks whose standard deviation is above min_std.
+        Returns (features (8, n) float32, positions (n, 2) int32 as (row, col) of the top-left pixel).
+        """
+        b = self.block
+        img = gray.astype(np.float32)
+        h, w = img.shape[0] - b + 1, img.shape[1] - b + 1
+        if h <= 0 or w <= 0:
+            return np.zeros((len(FEATURE_MODES), 0), np.float32), np.zeros((0, 2), np.int32)
+
+        # local standard deviation of every window, from two box filters
+        box = dict(ksize=(b, b), anchor=(0, 0), normalize=True, borderType=cv2.BORDER_REPLICATE)
+        mean = cv2.boxFilter(img, -1, **box)[:h, :w]
+        sq = cv2.boxFilter(img * img, -1, **box)[:h, :w]
+        keep = np.flatnonzero((sq - mean * mean).ravel() > self.min_std ** 2)
+
+        # stored feature-major (8, n): the matcher compares one contiguous row at a time
+        feats = np.empty((len(self._kernels), keep.size), dtype=np.float32)
+        for i, (ky, kx) in enumerate(self._kernels):
+            # anchor (0, 0): output (y, x) is the coefficient of the block whose top-left is (y, x)
+            coef = cv2.sepFilter2D(img, -1, kx, ky, anchor=(0, 0), borderType=cv2.BORDER_REPLICATE)
+            feats[i] = coef[:h, :w].ravel()[keep]
+        feats /= b  # orthonormal DCT: DC / block = block mean, so features are in gray levels
+        pos = np.stack(np.divmod(keep, w), axis=1).astype(np.int32)
+        return feats, pos
+
+    def match_pairs(self, feats: np.ndarray, pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Similar block pairs via lexicographic sort of the quantized features.
+        Returns (positions of the first blocks (m, 2), positions of the second blocks (m, 2),
+        shift vectors (m, 2)); shifts are normalized to point down/right so both directions
+        of a copy vote together.
+        """
+        empty = np.zeros((0, 2), np.int32)
+        n = feats.shape[1]
+        if n < 2:
+            return empty, empty, empty
+        # one byte per feature (AC centered on 128), read as a big-endian uint64: the first
+        # feature (DC) is the most significant byte, so sorting the key is a lexicographic sort
+        q = np.rint(feats / self.quant)
+        q[1:] += 128
+        q = np.clip(q, 0, 255).astype(np.uint8).T.copy()
+        order = np.argsort(q.view(">u8").ravel().astype(np.uint64))
+        del q
+        # one gather, then every comparison below runs on contiguous slices
+        fs, ps = np.take(feats, order, axis=1), pos[order]
+
+        firsts, seconds = [], []
+        for d in range(1, self.window + 1):
+            diff = np.abs(fs[0, :-d] - fs[0, d:])
+            for i in range(1, len(fs)):
+                np.maximum(diff, np.abs(fs[i, :-d] - fs[i, d:]), out=diff)
+            idx = np.flatnonzero(diff <= self.tolerance)
+            pa, pb = ps[idx], ps[idx + d]
+            s = pb - pa
+            far = s[:, 0].astype(np.int64) ** 2 + s[:, 1].astype(np.int64) ** 2 >= self.min_shift ** 2
+            firsts.append(pa[far])
+            seconds.append(pb[far])
+        pa, pb = np.concatenate(firsts), np.concatenate(seconds)
+        s = pb - pa
+        flip = (s[:, 0] < 0) | ((s[:, 0] == 0) & (s[:, 1] < 0))
+        s[flip] *= -1
+        return pa, pb, s
+
+    @staticmethod
+    def _neighbour_votes(vecs: np.ndarray, votes: np.ndarray, span: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Votes of each shift plus those of its 8 neighbouring shifts, and the largest single
+        vote in that neighbourhood. A region copied by a non-integer offset (after resampling)
+        splits its votes between adjacent shift vectors; summing them keeps it above min_votes.
+        `vecs` must be sorted row-major (as np.unique returns them).
+        """
+        m = 2 * span + 3
+        keys = vecs[:, 0].astype(np.int64) * m + (vecs[:, 1].astype(np.int64) + span + 1)
+        support = np.zeros(len(votes), dtype=np.int64)
+        peak = np.zeros(len(votes), dtype=np.int64)
+        if not len(votes):
+            return support, peak
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                k = keys + dy * m + dx
+                j = np.minimum(np.searchsorted(keys, k), len(keys) - 1)
+                found = keys[j] == k
+                support[found] += votes[j[found]]
+                np.maximum(peak, np.where(found, votes[j], 0), out=peak)
+        return support, peak
+
+    def _regions(self, shape, pa, pb, vecs, inverse, support, peaks) -> Tuple[np.ndarray, list]:
+        """
+        Keeps the vote clusters that form a connected region. A copied area gives one dense
+        blob of matching block positions; smooth or noisy content also produces small
+        scattered matches at one shift. Returns (top-left marks of the accepted blocks, regions).
+        """
+        marks = np.zeros(shape, dtype=np.uint8)
+        regions = []
+        for k in peaks:
+            near = (np.abs(vecs[:, 0] - vecs[k, 0]) <= 1) & (np.abs(vecs[:, 1] - vecs[k, 1]) <= 1)
+            sel = near[inverse]
+            a, b = pa[sel], pb[sel]
+            src = np.zeros(shape, dtype=np.uint8)
+            src[a[:, 0], a[:, 1]] = 1
+            # recompression and resampling leave holes in a copied area: bridge small gaps,
+            # then count only real matching positions per component
+            n, labels = cv2.connectedComponents(cv2.dilate(src, self._bridge), connectivity=8)
+            lab = labels[a[:, 0], a[:, 1]]
+            big = np.bincount(lab, minlength=n) >= self.min_region
+            big[0] = False  # background
+            keep = big[lab]
+            if not keep.any():
+                continue
+            marks[a[keep, 0], a[keep, 1]] = 255
+            marks[b[keep, 0], b[keep, 1]] = 255
+            regions.append({"dy": int(vecs[k, 0]), "dx": int(vecs[k, 1]), "votes": int(support[k]), "blocks": int(keep.sum())})
+        return marks, regions
+
+    def analyze_array(self, img: np.ndarray) -> Dict:
+        """
+        Runs the detector on a decoded BGR or grayscale image.
+        Returns the accepted shift vectors (in original pixels, with votes and matching blocks),
+        the fraction of the image covered by matched blocks and the match mask
+        (uint8, 255 = cloned, original size).
+        """
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        H, W = gray.shape
+        scale = 1.0
+        if self.max_pixels and H * W > self.max_pixels:
+            scale = (self.max_pixels / float(H * W)) ** 0.5
+            gray = cv2.resize(gray, (max(1, int(W * scale)), max(1, int(H * scale))), interpolation=cv2.INTER_AREA)
+
+        with timed("copymove_features"):
+            feats, pos = self.block_features(gray)
+        with timed("copymove_match"):
+            pa, pb, shifts = self.match_pairs(feats, pos)
+            vecs, inverse, votes = np.unique(shifts, axis=0, return_inverse=True, return_counts=True)
+            support, peak = self._neighbour_votes(vecs, votes, span=gray.shape[1])
+            # candidate regions: local maxima of the vote clusters, strongest first
+            peaks = np.flatnonzero((support >= self.min_votes) & (votes == peak))
+            peaks = peaks[np.argsort(-support[peaks], kind="stable")][: self.max_regions]
+        with timed("copymove_regions"):
+            marks, regions = self._regions(gray.shape, pa, pb, vecs, inverse.ravel(), support, peaks)
+
+        # each marked top-left pixel covers its whole block
+        kernel = np.ones((self.block, self.block), np.uint8)
+        mask = cv2.dilate(marks, kernel, anchor=(self.block - 1, self.block - 1))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)  # holes left by unmatched blocks
+        if scale != 1.0:
+            mask = cv2.resize(mask, (W, H), interpolation=cv2.INTER_NEAREST)
+            for r in regions:
+                r["dy"], r["dx"] = round(r["dy"] / scale, 1), round(r["dx"] / scale, 1)
+        return {
+            "copy_move_detected": bool(regions),
+            "shifts": regions,
+            "matched_fraction": round(float((mask > 0).mean()), 6),
+            "blocks": int(feats.shape[1]),
+            "scale": round(scale, 4),
+            "mask": mask,
+        }
+
+    def perform_copymove(self, image_path: str, output_path: Optional[str] = None) -> Dict:
+        """
+        Runs the detector on an image file; optionally saves the image with cloned regions in red.
+        """
+        image_path = Path(image_path)
+        if not image_path.exists():
+            raise FileNotFoundError(f"Image not found: {image_path}")
+        with timed("decode"):
+            img = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Could not read image structure.")
+        res = self.analyze_array(img)
+        if output_path:
+            overlay = img.copy()
+            overlay[res["mask"] > 0] = (0, 0, 255)
+            cv2.imwrite(output_path, cv2.addWeighted(img, 0.5, overlay, 0.5, 0))
+        return res
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        cm = ForensicCopyMove()
+        try:
+            out = f"copymove_{Path(sys.argv[1]).name}"
+            res = cm.perform_copymove(sys.argv[1], out)
+            print(f"Copy-move: {res['copy_move_detected']}, shifts: {res['shifts'][:5]}, "
+                  f"matched: {res['matched_fraction']:.2%}; overlay saved to {out}")
+        except Exception as e:
+            print(f"Error: {e}")
+    else:
+        print("Usage: python analysis_copymove.py <image_path>")
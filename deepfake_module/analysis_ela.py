@@ -2,7 +2,44 @@ import cv2
 import numpy as np
 from pathlib import Path
 import os
-from typing import Optional, Tuple
+from typing import Iterator, Optional, Tuple
+
+try:
+    from ._profiling import timed
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from _profiling import timed
+
+
+# Tiles start on multiples of 16: 8x8 DCT blocks and 16x16 MCUs (4:2:0 chroma) of a tile
+# re-encode then coincide with those of the full image.
+TILE_ALIGN = 16
+# Decoder chroma upsampling reads neighbouring chroma samples: each tile is re-encoded
+# with this much context around it, and only its core is kept.
+TILE_MARGIN = 16
+# Working bytes per tile pixel (BGR copy, resaved, diff, encoded stream).
+ELA_BYTES_PER_PIXEL = 12
+
+
+def tile_side(max_tile_mb: float, bytes_per_pixel: int, align: int = TILE_ALIGN) -> int:
+    """Largest square tile side (multiple of `align`) whose working set fits in `max_tile_mb`."""
+    side = int((max_tile_mb * 2**20 / bytes_per_pixel) ** 0.5)
+    return max(align, side // align * align)
+
+
+def iter_tiles(shape: Tuple[int, int], core: int, margin: int = 0) -> Iterator[Tuple[slice, slice, slice, slice]]:
+    """
+    Row-major tiles covering an (h, w) image: yields (rows, cols) of the tile with its margin
+    and (rows, cols) of its core relative to that tile. Cores do not overlap and cover the image.
+    """
+    h, w = shape[:2]
+    for y0 in range(0, h, core):
+        for x0 in range(0, w, core):
+            y1, x1 = min(y0 + core, h), min(x0 + core, w)
+            ty0, tx0 = max(0, y0 - margin), max(0, x0 - margin)
+            ty1, tx1 = min(h, y1 + margin), min(w, x1 + margin)
+            yield (slice(ty0, ty1), slice(tx0, tx1),
+                   slice(y0 - ty0, y1 - ty0), slice(x0 - tx0, x1 - tx0))
+
 
 class ForensicELA:
     """
@@ -13,9 +50,13 @@ class ForensicELA:
     def __init__(self, quality: int = 95):
         self.quality = quality
         
-    def perform_ela(self, image_path: str, output_path: Optional[str] = None) -> Tuple[np.ndarray, float]:
+    def perform_ela(
+        self, image_path: str, output_path: Optional[str] = None, max_tile_mb: Optional[float] = None
+    ) -> Tuple[np.ndarray, float]:
         """
         Performs ELA on the input image.
+        With max_tile_mb, runs the tiled mode (see ela_tiled): a .npy input is memory-mapped
+        instead of loaded, and a .npy output_path is written through a memory map.
         Returns: (ela_image, max_diff_value)
         """
         image_path = Path(image_path)
@@ -23,20 +64,49 @@ class ForensicELA:
             raise FileNotFoundError(f"Image not found: {image_path}")
             
         # 1. Load Original
-        original = cv2.imread(str(image_path))
+        with timed("decode"):
+            if max_tile_mb and image_path.suffix.lower() == ".npy":
+                original = np.load(image_path, mmap_mode="r")  # raw scans: pages in tile by tile
+            else:
+                original = cv2.imread(str(image_path))
         if original is None:
             raise ValueError("Could not read image structure.")
             
-        # 2. Resave at known quality (Virtual/Memory buffer preferred to avoid disk I/O, but disk is standard for ELA)
+        # 2-4. Resave, difference and scaling (shared with in-memory callers)
+        if max_tile_mb:
+            out = None
+            if output_path and Path(output_path).suffix.lower() == ".npy":
+                out = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=original.shape)
+            ela_image, max_diff = self.ela_tiled(original, max_tile_mb=max_tile_mb, out=out)
+            if out is not None:
+                out.flush()
+                return ela_image, max_diff
+        else:
+            ela_image, max_diff = self.ela_from_array(original)
+        
+        # 5. Save if output path provided
+        if output_path:
+            cv2.imwrite(output_path, ela_image)
+            
+        return ela_image, max_diff
+
+    def ela_from_array(self, original: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Performs ELA on an already decoded BGR/grayscale image.
+        Lets pipelines that decode a file once reuse the same pixels.
+        Returns: (ela_image, max_diff_value)
+        """
+        # 1. Resave at known quality (Virtual/Memory buffer preferred to avoid disk I/O, but disk is standard for ELA)
         # Using memory buffer for speed and clean forensic separation
-        _, encoded_img = cv2.imencode('.jpg', original, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
-        resaved = cv2.imdecode(encoded_img, 1)
+        with timed("ela_encode"):
+            _, encoded_img = cv2.imencode('.jpg', original, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            resaved = cv2.imdecode(encoded_img, cv2.IMREAD_UNCHANGED)
         
-        # 3. Calculate Absolute Difference
+        # 2. Calculate Absolute Difference
         # 1.0 * orig - resaved to allow float arithmetic
         diff = cv2.absdiff(original, resaved)
         
-        # 4. Enhance the difference (Forensic Scaling)
+        # 3. Enhance the difference (Forensic Scaling)
         # Find local max to scale
         max_diff = np.max(diff)
         if max_diff == 0:
@@ -46,13 +116,40 @@ class ForensicELA:
             scale = 255.0 / max_diff
             
         ela_image = cv2.convertScaleAbs(diff, alpha=scale)
-        
-        # 5. Save if output path provided
-        if output_path:
-            cv2.imwrite(output_path, ela_image)
-            
         return ela_image, max_diff
 
+    def ela_tiled(
+        self, original: np.ndarray, max_tile_mb: float = 64.0, out: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, float]:
+        """
+        Tiled ELA with bounded working memory, for gigapixel scans and panoramas.
+        Each tile (core aligned to the 16 px MCU grid, plus TILE_MARGIN of context) is
+        re-encoded on its own and only its core is written, so the stitched result matches
+        ela_from_array. Peak memory is the input, the output and one tile's working set
+        (about max_tile_mb); `original` and `out` may be np.memmap arrays to keep the image
+        itself on disk.
+        Two passes over `out`: raw differences, then in-place scaling by the global maximum.
+        Returns: (ela_image, max_diff_value)
+        """
+        core = max(TILE_ALIGN, tile_side(max_tile_mb, ELA_BYTES_PER_PIXEL) - 2 * TILE_MARGIN)
+        if out is None:
+            out = np.empty(original.shape, dtype=np.uint8)
+        max_diff = 0
+        for rows, cols, core_rows, core_cols in iter_tiles(original.shape, core, TILE_MARGIN):
+            tile = np.ascontiguousarray(original[rows, cols])
+            with timed("ela_encode"):
+                _, encoded = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                resaved = cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+            diff = cv2.absdiff(tile[core_rows, core_cols], resaved[core_rows, core_cols])
+            max_diff = max(max_diff, int(diff.max()))
+            out[rows, cols][core_rows, core_cols] = diff
+
+        if max_diff:
+            scale = 255.0 / max_diff
+            for rows, cols, _, _ in iter_tiles(original.shape, core):
+                out[rows, cols] = cv2.convertScaleAbs(out[rows, cols], alpha=scale)
+        return out, np.uint8(max_diff)
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
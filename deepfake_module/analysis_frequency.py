@@ -1,8 +1,19 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
+
+try:
+    from ._profiling import timed
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from _profiling import timed
+
+
+# Working bytes per tile pixel: windowed float32 tile, complex DFT, shifted copy, magnitude.
+DFT_BYTES_PER_PIXEL = 40
+# Smallest tile side: below this the Hann window leaves almost no usable pixels.
+MIN_TILE = 8
+
 
 class ForensicFrequency:
     """
@@ -10,26 +21,119 @@ class ForensicFrequency:
     Generates Spectrograms using 2D DFT.
     """
     
-    def perform_dft(self, image_path: str, output_path: Optional[str] = None):
+    def magnitude_spectrum(self, img: np.ndarray) -> np.ndarray:
+        """
+        Computes the centered log-magnitude spectrum of a grayscale image.
+        Accepts already decoded pixels so pipelines can share one decode.
+        """
+        # 1. DFT
+        with timed("fft"):
+            dft = cv2.dft(np.float32(img), flags=cv2.DFT_COMPLEX_OUTPUT)
+            dft_shift = np.fft.fftshift(dft)
+        
+        # 2. Magnitude Spectrum (Log scale for visibility)
+        return 20 * np.log(cv2.magnitude(dft_shift[:, :, 0], dft_shift[:, :, 1]) + 1)
+    
+    def radial_profile(self, magnitude_spectrum: np.ndarray, bins: int = 64) -> np.ndarray:
+        """
+        Azimuthal average of a centered spectrum (1D power profile).
+        Radius is normalized to [0, 1] so profiles of different sizes are comparable.
+        """
+        h, w = magnitude_spectrum.shape[:2]
+        yy, xx = np.indices((h, w))
+        r = np.hypot(yy - h // 2, xx - w // 2)
+        r = r / max(r.max(), 1.0)
+        idx = np.minimum((r * bins).astype(np.int32), bins - 1)
+        sums = np.bincount(idx.ravel(), weights=magnitude_spectrum.ravel(), minlength=bins)
+        counts = np.bincount(idx.ravel(), minlength=bins)
+        return sums / np.maximum(counts, 1)
+
+    def tiled_features(
+        self,
+        img: np.ndarray,
+        tile: Optional[int] = None,
+        overlap: float = 0.5,
+        bins: int = 32,
+        max_tile_mb: float = 16.0,
+    ) -> Dict:
+        """
+        Windowed per-tile spectral features for images too large for one full-size DFT.
+        Tiles of `tile` x `tile` pixels (default: the largest power of two whose working set
+        fits in max_tile_mb, capped by the shorter image side) overlap by `overlap`; each is multiplied
+        by a Hann window before the DFT so tile borders do not add spectral leakage.
+        The last row/column of tiles is flush with the image edge, so the whole image is covered.
+        Returns per-tile radial profiles (ty, tx, bins), per-tile high-frequency ratios
+        (ty, tx) and their mean profile; memory is bounded by one tile and the feature maps.
+        Raises ValueError for images with a side shorter than MIN_TILE pixels.
+        """
+        h, w = img.shape[:2]
+        if min(h, w) < MIN_TILE:
+            raise ValueError(f"Image {w}x{h} too small for tiled spectral features (minimum side {MIN_TILE} px)")
+        if tile is None:
+            side = int((max_tile_mb * 2**20 / DFT_BYTES_PER_PIXEL) ** 0.5)
+            tile = 1 << max(3, side.bit_length() - 1)
+        tile = min(max(tile, MIN_TILE), h, w)
+        step = max(1, int(tile * (1.0 - overlap)))
+
+        def origins(n):
+            last = n - tile
+            return sorted(set(list(range(0, last + 1, step)) + [last]))
+
+        ys, xs = origins(h), origins(w)
+        window = cv2.createHanningWindow((tile, tile), cv2.CV_32F)
+        # radius bins depend only on the tile size: computed once, reused for every tile
+        yy, xx = np.indices((tile, tile))
+        r = np.hypot(yy - tile // 2, xx - tile // 2)
+        idx = np.minimum((r / max(r.max(), 1.0) * bins).astype(np.int32), bins - 1).ravel()
+        counts = np.maximum(np.bincount(idx, minlength=bins), 1)
+        del yy, xx, r
+
+        profiles = np.empty((len(ys), len(xs), bins), dtype=np.float32)
+        for i, y0 in enumerate(ys):
+            for j, x0 in enumerate(xs):
+                patch = np.asarray(img[y0 : y0 + tile, x0 : x0 + tile], dtype=np.float32)
+                spectrum = self.magnitude_spectrum(patch * window)
+                profiles[i, j] = np.bincount(idx, weights=spectrum.ravel(), minlength=bins) / counts
+
+        means = profiles.mean(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            hf = np.where(means > 0, profiles[:, :, bins // 2 :].mean(axis=2) / means, 0.0)
+        return {
+            "tile": tile,
+            "step": step,
+            "origins": (ys, xs),
+            "profiles": profiles,
+            "high_freq_ratio": hf.astype(np.float32),
+            "mean_profile": profiles.reshape(-1, bins).mean(axis=0),
+        }
+    
+    def perform_dft(self, image_path: str, output_path: Optional[str] = None, max_tile_mb: Optional[float] = None):
         """
         Computes 2D Discrete Fourier Transform and Azimuthal Average.
         Saves a plot of the Magnitude Spectrum.
+        With max_tile_mb, the spectrum is computed per tile (see tiled_features) and the plot
+        shows the mean radial profile and the map of per-tile high-frequency ratios instead.
         """
+        import matplotlib.pyplot as plt
+
         image_path = Path(image_path)
         if not image_path.exists():
             raise FileNotFoundError(f"Image not found: {image_path}")
             
         # 1. Load as Grayscale
-        img = cv2.imread(str(image_path), 0)
+        with timed("decode"):
+            if max_tile_mb and image_path.suffix.lower() == ".npy":
+                img = np.load(image_path, mmap_mode="r")  # raw grayscale scans: read tile by tile
+            else:
+                img = cv2.imread(str(image_path), 0)
         if img is None:
             raise ValueError("Could not read image.")
             
-        # 2. DFT
-        dft = cv2.dft(np.float32(img), flags=cv2.DFT_COMPLEX_OUTPUT)
-        dft_shift = np.fft.fftshift(dft)
-        
-        # 3. Magnitude Spectrum (Log scale for visibility)
-        magnitude_spectrum = 20 * np.log(cv2.magnitude(dft_shift[:, :, 0], dft_shift[:, :, 1]) + 1)
+        if max_tile_mb:
+            return self._plot_tiled(self.tiled_features(img, max_tile_mb=max_tile_mb), output_path)
+            
+        # 2-3. DFT + Magnitude Spectrum
+        magnitude_spectrum = self.magnitude_spectrum(img)
         
         # 4. Azimuthal Average (1D profile)
         # Calculate radial average... (Simplified version for MVP: just spectrum plot)
@@ -54,6 +158,31 @@ class ForensicFrequency:
         else:
             plt.show()
 
+    @staticmethod
+    def _plot_tiled(features: Dict, output_path: Optional[str] = None) -> Dict:
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(10, 5))
+
+        plt.subplot(121)
+        plt.plot(features["mean_profile"])
+        plt.title(f'Mean Radial Profile ({features["tile"]}px tiles)')
+        plt.xlabel('Normalized radius bin')
+
+        plt.subplot(122)
+        plt.imshow(features["high_freq_ratio"], cmap='inferno')
+        plt.colorbar()
+        plt.title('High-Frequency Ratio per Tile')
+        plt.axis('off')
+
+        if output_path:
+            plt.savefig(output_path, bbox_inches='tight')
+            plt.close()
+            print(f"Spectrum saved to {output_path}")
+        else:
+            plt.show()
+        return features
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
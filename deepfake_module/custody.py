@@ -0,0 +1,168 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from ._profiling import timed
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from _profiling import timed
+
+
+MERKLE_SCHEME = "sha256-merkle-rfc6962"
+DEFAULT_CHUNK = 4 * 1024 * 1024
+# Domain separation (RFC 6962): a leaf hash can never be replayed as an inner node.
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def _workers(workers: Optional[int]) -> int:
+    return workers or min(8, os.cpu_count() or 1)
+
+
+def _leaf(view: memoryview) -> bytes:
+    h = hashlib.sha256(LEAF_PREFIX)
+    h.update(view)  # hashlib releases the GIL on large buffers: leaves hash in parallel
+    return h.digest()
+
+
+def leaf_hashes(
+    path: Path,
+    chunk_size: int = DEFAULT_CHUNK,
+    workers: Optional[int] = None,
+    indices: Optional[Iterable[int]] = None,
+) -> List[bytes]:
+    """
+    SHA-256 of fixed-size chunks of a file (LEAF_PREFIX + chunk), read through mmap and hashed
+    in a thread pool. With `indices`, only those chunks are hashed (segment re-verification).
+    An empty file has a single leaf, the hash of the empty chunk.
+    """
+    size = Path(path).stat().st_size
+    n = max(1, -(-size // chunk_size))
+    idx = list(range(n)) if indices is None else list(indices)
+    if size == 0:
+        return [_leaf(memoryview(b"")) for _ in idx]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            with ThreadPoolExecutor(max_workers=_workers(workers)) as ex:
+                return list(ex.map(lambda i: _leaf(view[i * chunk_size : (i + 1) * chunk_size]), idx))
+        finally:
+            view.release()
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    """
+    Root of the tree over `leaves`, pairing left to right and promoting an odd last node
+    unchanged to the next level (same root as the RFC 6962 Merkle Tree Hash).
+    """
+    level = list(leaves)
+    while len(level) > 1:
+        nxt = [hashlib.sha256(NODE_PREFIX + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0]
+
+
+def sha256_whole(path: Path, chunk_size: int = DEFAULT_CHUNK) -> str:
+    """Classic whole-file SHA-256 (inherently sequential), in large chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def custody_hash(
+    path: Path,
+    chunk_size: int = DEFAULT_CHUNK,
+    workers: Optional[int] = None,
+    whole_file: bool = True,
+) -> Dict:
+    """
+    Chain-of-custody record of a file: the Merkle tree over fixed-size chunks (root and every
+    leaf, so a segment can be re-verified and corruption localized without rehashing the whole
+    file) and, with whole_file, the classic SHA-256, computed concurrently with the leaves.
+    """
+    path = Path(path)
+    with timed("custody_hash"), ThreadPoolExecutor(max_workers=1) as ex:
+        whole = ex.submit(sha256_whole, path) if whole_file else None
+        leaves = leaf_hashes(path, chunk_size, workers)
+        record = {
+            "size": path.stat().st_size,
+            "merkle": {
+                "scheme": MERKLE_SCHEME,
+                "chunk_size": chunk_size,
+                "leaf_count": len(leaves),
+                "root": merkle_root(leaves).hex(),
+                "leaves": [h.hex() for h in leaves],
+            },
+        }
+        if whole is not None:
+            record["sha256"] = whole.result()
+    return record
+
+
+def verify_custody(
+    path: Path,
+    record: Dict,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Dict:
+    """
+    Re-verifies a file against a custody_hash() record. With a byte range [start, end), only the
+    chunks overlapping it are rehashed. Returns the mismatching leaf indices and their byte ranges;
+    the root is recomputed only on a full check.
+    """
+    path = Path(path)
+    m = record["merkle"]
+    cs, n = m["chunk_size"], m["leaf_count"]
+    size = path.stat().st_size
+    first = 0 if start is None else max(0, start // cs)
+    last = n if end is None else min(n, -(-end // cs))
+    idx = list(range(first, last))
+    with timed("custody_verify"):
+        leaves = leaf_hashes(path, cs, workers, indices=idx)
+    bad = [i for i, h in zip(idx, leaves) if h.hex() != m["leaves"][i]]
+    if size != record["size"]:
+        # truncated/extended file: every chunk from the first affected one on is suspect
+        tail = min(size, record["size"]) // cs
+        bad = sorted(set(bad) | set(range(max(first, tail), last)))
+    res = {
+        "ok": not bad and size == record["size"],
+        "size_ok": size == record["size"],
+        "checked": len(idx),
+        "bad_leaves": bad,
+        "bad_ranges": [[i * cs, min((i + 1) * cs, record["size"])] for i in bad],
+    }
+    if start is None and end is None and size == record["size"]:
+        res["root_ok"] = merkle_root(leaves).hex() == m["root"]
+        res["ok"] = res["ok"] and res["root_ok"]
+    return res
+
+
+def find_record(doc: Dict) -> Dict:
+    """Custody record inside a saved document: the record itself, {"custody": ...} or an extraction report."""
+    for holder in (doc, doc.get("source_video") or {}):
+        if "merkle" in holder:
+            return holder
+        if "merkle" in (holder.get("custody") or {}):
+            return holder["custody"]
+    raise ValueError("No Merkle custody record found in document")
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "verify":
+        rec = json.loads(Path(sys.argv[3]).read_text())
+        print(json.dumps(verify_custody(sys.argv[2], find_record(rec))))
+    elif len(sys.argv) > 1:
+        print(json.dumps(custody_hash(sys.argv[1]), indent=2))
+    else:
+        print("Usage: python custody.py <file>  |  python custody.py verify <file> <record.json>")
@@ -0,0 +1,282 @@
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from ._profiling import timed
+    from .analysis_blockiness import ForensicBlockiness
+    from .analysis_ela import ForensicELA
+    from .analysis_frequency import ForensicFrequency
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from _profiling import timed
+    from analysis_blockiness import ForensicBlockiness
+    from analysis_ela import ForensicELA
+    from analysis_frequency import ForensicFrequency
+
+
+# Crops start and end on the 8x8 grid, so ELA/blockiness see the frame's own JPEG blocks.
+CROP_ALIGN = 8
+
+
+def default_cascade() -> Optional[str]:
+    """Frontal-face Haar cascade shipped with opencv-python (OpenCV 4.x builds), if present."""
+    base = getattr(getattr(cv2, "data", None), "haarcascades", None)
+    path = Path(base or "") / "haarcascade_frontalface_default.xml"
+    return str(path) if base and path.exists() else None
+
+
+class ForensicFaceDetector:
+    """
+    Face ROI isolation for targeted analysis (offline models only, loaded from local files):
+    - Haar/LBP cascade (.xml) via cv2.CascadeClassifier (OpenCV 4.x; default: the bundled frontal cascade),
+    - YuNet (.onnx) via cv2.FaceDetectorYN,
+    - res10 SSD (.caffemodel + .prototxt) via cv2.dnn.
+    Detection runs on a copy downscaled to `detect_width`; in video, faces found on a
+    detection frame are followed by template matching in a small search window, and the
+    detector only runs again every `redetect_every` frames or when a track is lost.
+    Faces are cropped with a fixed relative margin, aligned to the 8x8 grid.
+    """
+
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        config_path: Optional[str] = None,
+        detect_width: int = 640,
+        margin: float = 0.25,
+        redetect_every: int = 15,
+        min_track_score: float = 0.6,
+        score_threshold: float = 0.7,
+        min_face: int = 24,
+    ):
+        self.detect_width = detect_width
+        self.margin = margin  # crop margin, fraction of the face box on each side
+        self.redetect_every = redetect_every
+        self.min_track_score = min_track_score  # template correlation below this = track lost
+        self.score_threshold = score_threshold
+        self.min_face = min_face  # in pixels of the downscaled frame
+        self.backend, self._model = self._load(model_path, config_path)
+
+    def _load(self, model_path: Optional[str], config_path: Optional[str]):
+        if model_path is None:
+            model_path = default_cascade()
+            if model_path is None:
+                raise FileNotFoundError(
+                    "No face model available: pass a Haar/LBP cascade (.xml), a YuNet model (.onnx) "
+                    "or a res10 SSD model (.caffemodel with its .prototxt)."
+                )
+        path = Path(model_path)
+        if not path.exists():
+            raise FileNotFoundError(f"Face model not found: {path}")
+        suffix = path.suffix.lower()
+        if suffix == ".xml":
+            if not hasattr(cv2, "CascadeClassifier"):
+                raise RuntimeError("This OpenCV build has no CascadeClassifier; use a DNN model (.onnx/.caffemodel).")
+            cascade = cv2.CascadeClassifier(str(path))
+            if cascade.empty():
+                raise ValueError(f"Could not load cascade: {path}")
+            return "cascade", cascade
+        if suffix == ".onnx":
+            return "yunet", cv2.FaceDetectorYN.create(str(path), "", (320, 320), self.score_threshold, 0.3, 5000)
+        if suffix == ".caffemodel":
+            if not config_path or not Path(config_path).exists():
+                raise FileNotFoundError("res10 SSD needs its .prototxt (config_path).")
+            return "ssd", cv2.dnn.readNetFromCaffe(str(config_path), str(path))
+        raise ValueError(f"Unsupported face model type: {path.suffix}")
+
+    def _detect_small(self, small: np.ndarray) -> List[Tuple[float, float, float, float, float]]:
+        """Boxes (x, y, w, h, score) in the coordinates of the downscaled BGR frame."""
+        h, w = small.shape[:2]
+        if self.backend == "cascade":
+            gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+            rects = self._model.detectMultiScale(gray, 1.1, 5, minSize=(self.min_face, self.min_face))
+            return [(x, y, bw, bh, 1.0) for x, y, bw, bh in (rects if len(rects) else [])]
+        if self.backend == "yunet":
+            self._model.setInputSize((w, h))
+            _, faces = self._model.detect(small)
+            return [tuple(f[:4]) + (float(f[-1]),) for f in (faces if faces is not None else [])]
+        blob = cv2.dnn.blobFromImage(cv2.resize(small, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self._model.setInput(blob)
+        out = self._model.forward().reshape(-1, 7)
+        out = out[out[:, 2] >= self.score_threshold]
+        return [
+            (x1 * w, y1 * h, (x2 - x1) * w, (y2 - y1) * h, float(s))
+            for _, _, s, x1, y1, x2, y2 in out
+        ]
+
+    def _downscale(self, frame: np.ndarray) -> Tuple[np.ndarray, float]:
+        w = frame.shape[1]
+        if w <= self.detect_width:
+            return frame, 1.0
+        s = self.detect_width / float(w)
+        return cv2.resize(frame, (self.detect_width, max(1, int(frame.shape[0] * s))), interpolation=cv2.INTER_AREA), s
+
+    def detect(self, frame: np.ndarray) -> List[Dict]:
+        """Faces in a full-resolution BGR frame: [{"box": [x, y, w, h], "score": s}] in frame pixels."""
+        small, s = self._downscale(frame)
+        with timed("face_detect"):
+            found = self._detect_small(small)
+        faces = []
+        for x, y, w, h, score in found:
+            if w < self.min_face or h < self.min_face:
+                continue
+            faces.append({"box": [int(x / s), int(y / s), int(w / s), int(h / s)], "score": round(float(score), 4)})
+        return faces
+
+    def track(self, frames: Iterable[np.ndarray]) -> Iterator[Dict]:
+        """
+        Face boxes for a sequence of frames with detection + tracking.
+        Yields {"frame": i, "detected": bool, "faces": [{"box", "score", "tracked"}]} per frame;
+        "detected" tells whether the detector ran on that frame.
+        """
+        for rec, _frame in self.track_frames(frames):
+            yield rec
+
+    def track_frames(self, frames: Iterable[np.ndarray]) -> Iterator[Tuple[Dict, np.ndarray]]:
+        """
+        Same records as track(), each paired with its frame: (record, frame). Lets a caller
+        crop the tracked faces from a single-pass frame stream (e.g. a video decoder).
+        """
+        tracks: List[Dict] = []  # box in frame pixels, template in downscaled gray
+        last_detect = None
+        for i, frame in enumerate(frames):
+            small, s = self._downscale(frame)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+            due = last_detect is None or i - last_detect >= self.redetect_every
+            if not due:
+                with timed("face_track"):
+                    for t in tracks:
+                        if not self._follow(t, gray, s):
+                            due = True  # one lost face is enough to re-detect the frame
+                            break
+            if due:
+                last_detect = i
+                tracks = []
+                for f in self.detect(frame):
+                    x, y, w, h = (int(round(v * s)) for v in f["box"])
+                    tmpl = gray[max(0, y) : y + h, max(0, x) : x + w]
+                    if tmpl.size:
+                        tracks.append({"box": f["box"], "score": f["score"], "template": tmpl.copy()})
+            yield {
+                "frame": i,
+                "detected": due,
+                "faces": [{"box": list(t["box"]), "score": t["score"], "tracked": not due} for t in tracks],
+            }, frame
+
+    def _follow(self, t: Dict, gray: np.ndarray, s: float) -> bool:
+        """Moves a track to the best template match around its last position."""
+        th, tw = t["template"].shape
+        x, y = int(round(t["box"][0] * s)), int(round(t["box"][1] * s))
+        pad_x, pad_y = tw // 2 + 1, th // 2 + 1
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        window = gray[y0 : y + th + pad_y, x0 : x + tw + pad_x]
+        if window.shape[0] < th or window.shape[1] < tw:
+            return False
+        res = cv2.matchTemplate(window, t["template"], cv2.TM_CCOEFF_NORMED)
+        _, best, _, (bx, by) = cv2.minMaxLoc(res)
+        if best < self.min_track_score:
+            return False
+        t["box"][0], t["box"][1] = int((x0 + bx) / s), int((y0 + by) / s)
+        return True
+
+    def crop_box(self, box: List[int], shape: Tuple[int, ...]) -> List[int]:
+        """Face box + margin as [x0, y0, x1, y1], expanded outwards to the 8x8 grid and clipped to the frame."""
+        x, y, w, h = box
+        mx, my = int(w * self.margin), int(h * self.margin)
+        H, W = shape[:2]
+        x0 = max(0, x - mx) // CROP_ALIGN * CROP_ALIGN
+        y0 = max(0, y - my) // CROP_ALIGN * CROP_ALIGN
+        x1 = min(W, -(-(x + w + mx) // CROP_ALIGN) * CROP_ALIGN)
+        y1 = min(H, -(-(y + h + my) // CROP_ALIGN) * CROP_ALIGN)
+        return [x0, y0, x1, y1]
+
+    def analyze_faces(
+        self,
+        frame: np.ndarray,
+        faces: List[Dict],
+        ela: Optional[ForensicELA] = None,
+        freq: Optional[ForensicFrequency] = None,
+        blockiness: Optional[ForensicBlockiness] = None,
+        bins: int = 32,
+    ) -> List[Dict]:
+        """
+        Runs ELA, DFT and blockiness on the face crops only (not on the whole frame).
+        Returns one dict per face with its crop box and the metrics.
+        """
+        ela = ela or ForensicELA()
+        freq = freq or ForensicFrequency()
+        blockiness = blockiness or ForensicBlockiness()
+        out = []
+        for f in faces:
+            x0, y0, x1, y1 = self.crop_box(f["box"], frame.shape)
+            crop = frame[y0:y1, x0:x1]
+            if crop.shape[0] < 16 or crop.shape[1] < 16:
+                continue
+            gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+            ela_image, max_diff = ela.ela_from_array(np.ascontiguousarray(crop))
+            max_diff = float(max_diff)
+            profile = freq.radial_profile(freq.magnitude_spectrum(gray), bins=bins)
+            mean = float(profile.mean()) or 1.0
+            blk = blockiness.analyze_array(gray)
+            out.append({
+                **f,
+                "crop": [x0, y0, x1, y1],
+                "ela": {
+                    "max_diff": max_diff,
+                    "mean_diff": round(float(ela_image.mean()) * max_diff / 255.0, 4) if max_diff else 0.0,
+                },
+                "dft": {"high_freq_ratio": round(float(profile[bins // 2 :].mean()) / mean, 6)},
+                "blockiness": {"grid": blk["grid"], "block_strength_mean": blk["block_strength_mean"]},
+            })
+        return out
+
+    def analyze_video(self, video_path: str, step: int = 1, max_frames: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Face-restricted analysis of a video: every `step`-th frame is tracked and its face
+        crops analyzed. Yields one record per processed frame.
+        """
+        cap = cv2.VideoCapture(str(video_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        ela, freq, blk = ForensicELA(), ForensicFrequency(), ForensicBlockiness()
+
+        def frames():
+            idx = kept = 0
+            while max_frames is None or kept < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                if idx % step == 0:
+                    kept += 1
+                    yield frame
+                idx += 1
+
+        try:
+            for rec, frame in self.track_frames(frames()):
+                rec["frame_index"] = rec["frame"] * step
+                with timed("face_analysis"):
+                    rec["faces"] = self.analyze_faces(frame, rec["faces"], ela, freq, blk)
+                yield rec
+        finally:
+            cap.release()
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    if len(sys.argv) > 1:
+        try:
+            det = ForensicFaceDetector(model_path=sys.argv[2] if len(sys.argv) > 2 else None,
+                                       config_path=sys.argv[3] if len(sys.argv) > 3 else None)
+            target = sys.argv[1]
+            img = cv2.imread(target) if Path(target).suffix.lower() in (".jpg", ".jpeg", ".png", ".bmp") else None
+            if img is not None:
+                print(json.dumps(det.analyze_faces(img, det.detect(img))))
+            else:
+                for rec in det.analyze_video(target):
+                    print(json.dumps(rec))
+        except Exception as e:
+            print(f"Error: {e}")
+    else:
+        print("Usage: python face_detector.py <image_or_video> [model.xml|model.onnx|model.caffemodel] [deploy.prototxt]")
@@ -3,8 +3,16 @@ import hashlib
 import json
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 
+try:
+    from .custody import DEFAULT_CHUNK, custody_hash
+    from .perceptual_hash import NearDuplicateIndex, hash_hex
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from custody import DEFAULT_CHUNK, custody_hash
+    from perceptual_hash import NearDuplicateIndex, hash_hex
+
 class ForensicFrameExtractor:
     """
     Extracts frames from video evidence for forensic analysis.
@@ -18,14 +26,27 @@ class ForensicFrameExtractor:
         """Calculates SHA-256 hash of a file."""
         sha256_hash = hashlib.sha256()
         with open(filepath, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
+            for byte_block in iter(lambda: f.read(1024 * 1024), b""):
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
 
-    def extract_frames(self, video_path: str, case_id: str, max_frames: int = 50) -> Dict:
+    def extract_frames(
+        self,
+        video_path: str,
+        case_id: str,
+        max_frames: int = 50,
+        near_dup_radius: Optional[int] = 6,
+        merkle_chunk: Optional[int] = DEFAULT_CHUNK,
+    ) -> Dict:
         """
         Extracts I-frames (or regular interval frames) from video.
         Returns a report with hashes.
+        With near_dup_radius, frames are also grouped by perceptual hash (pHash, Hamming
+        distance <= radius): every frame is still saved and hashed, but only the first frame
+        of each group is marked as representative for analysis (see representative_frames).
+        With merkle_chunk, the input video also gets a Merkle custody record (SHA-256 leaves
+        over merkle_chunk-byte chunks, see custody.py), computed in the background together
+        with the whole-file SHA-256 while frames are extracted.
         """
         video_path = Path(video_path)
         if not video_path.exists():
@@ -35,19 +56,25 @@ class ForensicFrameExtractor:
         case_dir = self.output_base / case_id / "frames"
         os.makedirs(case_dir, exist_ok=True)
         
-        # 2. Hash Input Video (Chain of Custody)
+        # 2. Hash Input Video (Chain of Custody), in the background: extraction does not wait for it
         print(f"Hashing input video: {video_path.name}...")
-        input_hash = self.calculate_file_hash(video_path)
+        hasher = ThreadPoolExecutor(max_workers=1)
+        if merkle_chunk:
+            input_custody = hasher.submit(custody_hash, video_path, merkle_chunk)
+        else:
+            input_custody = hasher.submit(lambda: {"sha256": self.calculate_file_hash(video_path)})
         
         # 3. Open Video
         cap = cv2.VideoCapture(str(video_path))
         if not cap.isOpened():
+            hasher.shutdown(wait=False, cancel_futures=True)
             raise ValueError(f"Could not open video: {video_path}")
             
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         fps = cap.get(cv2.CAP_PROP_FPS)
         
         extracted_frames = []
+        near_dup = NearDuplicateIndex(radius=near_dup_radius) if near_dup_radius is not None else None
         frame_count = 0
         saved_count = 0 
         
@@ -72,17 +99,32 @@ class ForensicFrameExtractor:
                 # Hash Extracted Frame
                 frame_hash = self.calculate_file_hash(output_path)
                 
-                extracted_frames.append({
+                record = {
                     "frame_index": frame_count,
                     "filename": frame_filename,
                     "path": str(output_path),
                     "sha256": frame_hash
-                })
+                }
+                
+                # Group near-duplicates (hash of the decoded frame, before JPEG encoding)
+                if near_dup is not None:
+                    phash = near_dup.hash(frame)
+                    match = near_dup.add(frame_filename, h=phash)
+                    record["phash"] = hash_hex(phash)
+                    record["cluster"] = match[0] if match else frame_filename
+                    record["representative"] = match is None
+                    if match:
+                        record["hamming_to_representative"] = match[1]
+                
+                extracted_frames.append(record)
                 saved_count += 1
                 
             frame_count += 1
             
         cap.release()
+        custody = input_custody.result()
+        hasher.shutdown()
+        input_hash = custody.pop("sha256")
         
         report = {
             "case_id": case_id,
@@ -99,6 +141,16 @@ class ForensicFrameExtractor:
                 "frames": extracted_frames
             }
         }
+        if merkle_chunk:
+            report["source_video"]["custody"] = custody
+        if near_dup is not None:
+            clusters = [{"representative": rep, "members": members} for rep, members in near_dup.clusters()]
+            report["extraction"]["near_duplicates"] = {
+                "method": near_dup.method,
+                "radius": near_dup.radius,
+                "representative_count": len(clusters),
+                "clusters": clusters,
+            }
         
         # Save Extraction Report
         report_path = self.output_base / case_id / "extraction_report.json"
@@ -107,6 +159,12 @@ class ForensicFrameExtractor:
             
         return report
 
+    @staticmethod
+    def representative_frames(report: Dict) -> List[str]:
+        """Paths of the frames to analyze: one per near-duplicate group (all frames if not grouped)."""
+        frames = report["extraction"]["frames"]
+        return [f["path"] for f in frames if f.get("representative", True)]
+
 if __name__ == "__main__":
     # Test if run directly
     import sys
@@ -114,7 +172,8 @@ if __name__ == "__main__":
         extractor = ForensicFrameExtractor()
         try:
             rep = extractor.extract_frames(sys.argv[1], sys.argv[2])
-            print(f"Success! extracted {rep['extraction']['extracted_count']} frames.")
+            print(f"Success! extracted {rep['extraction']['extracted_count']} frames, "
+                  f"{len(extractor.representative_frames(rep))} to analyze after near-duplicate grouping.")
         except Exception as e:
             print(f"Error: {e}")
     else:
@@ -0,0 +1,147 @@
+import cv2
+import numpy as np
+from threading import Lock
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel().astype(np.uint8)).tobytes(), "big")
+
+
+def _gray(img: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def dhash(img: np.ndarray, size: int = 8) -> int:
+    """
+    Difference hash: sign of the horizontal gradient on a (size+1) x size thumbnail.
+    size*size bits (64 by default). Very cheap; robust to rescaling and recompression.
+    """
+    small = cv2.resize(_gray(img), (size + 1, size), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(img: np.ndarray, size: int = 8, factor: int = 4) -> int:
+    """
+    DCT hash: the size x size lowest frequencies of a (size*factor)^2 thumbnail, thresholded
+    at their median (DC excluded from the median). 64 bits by default; more robust than
+    dHash to gamma, contrast and small local edits.
+    """
+    n = size * factor
+    small = cv2.resize(_gray(img), (n, n), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:size, :size]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def hash_hex(h: int, bits: int = 64) -> str:
+    """Fixed-width hex form for reports (JSON has no 64-bit unsigned integers)."""
+    return f"{h:0{bits // 4}x}"
+
+
+class MultiIndexHash:
+    """
+    Hamming-radius search by multi-index hashing. The `bits`-bit hash is cut into
+    radius + 1 disjoint chunks, each with its own exact-match table: by the pigeonhole
+    principle, any hash within `radius` bits agrees with the query on at least one chunk.
+    A query is radius + 1 dict lookups plus a popcount check of the few candidates found,
+    instead of a comparison with every stored hash.
+    """
+
+    def __init__(self, radius: int, bits: int = 64):
+        self.radius = radius
+        m = min(radius + 1, bits)
+        edges = [bits * i // m for i in range(m + 1)]
+        self._chunks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._chunks]
+        self._hashes: List[int] = []
+        self._items: List[Hashable] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, h: int, item: Hashable) -> None:
+        i = len(self._hashes)
+        self._hashes.append(h)
+        self._items.append(item)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((h >> shift) & mask, []).append(i)
+
+    def search(self, h: int) -> List[Tuple[int, Hashable]]:
+        """All (distance, item) within `radius` of h, closest first (ties in insertion order)."""
+        seen = set()
+        found = []
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for i in table.get((h >> shift) & mask, ()):
+                if i not in seen:
+                    seen.add(i)
+                    d = hamming(h, self._hashes[i])
+                    if d <= self.radius:
+                        found.append((d, i))
+        found.sort()
+        return [(d, self._items[i]) for d, i in found]
+
+
+class NearDuplicateIndex:
+    """
+    Groups near-identical images/frames incrementally by perceptual hash.
+    The first image of a group is its representative; add() returns
+    (representative, distance) when the new image is within `radius` bits of an existing
+    representative, else None (the image becomes a representative). Only representatives
+    need the expensive analyses. Thread-safe: add() may be called from a worker pool.
+    """
+
+    def __init__(self, radius: int = 6, method: str = "phash"):
+        if method not in HASHES:
+            raise ValueError(f"Unknown hash method: {method} (available: {', '.join(HASHES)})")
+        self.radius = radius
+        self.method = method
+        self._hash = HASHES[method]
+        self._index = MultiIndexHash(radius)
+        self._members: Dict[Hashable, List[Hashable]] = {}
+        self._lock = Lock()
+
+    def hash(self, img: np.ndarray) -> int:
+        return self._hash(img)
+
+    def add(self, key: Hashable, img: Optional[np.ndarray] = None, h: Optional[int] = None) -> Optional[Tuple[Hashable, int]]:
+        """Registers an image by its pixels (or a precomputed hash `h`)."""
+        if h is None:
+            h = self._hash(img)
+        with self._lock:
+            found = self._index.search(h)
+            if found:
+                d, rep = found[0]
+                self._members[rep].append(key)
+                return rep, d
+            self._index.add(h, key)
+            self._members[key] = [key]
+            return None
+
+    def clusters(self) -> Iterator[Tuple[Hashable, List[Hashable]]]:
+        """(representative, members including itself), in insertion order."""
+        return iter(self._members.items())
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    if len(sys.argv) > 1:
+        radius = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+        index = NearDuplicateIndex(radius=radius)
+        exts = (".jpg", ".jpeg", ".png", ".bmp")
+        for p in sorted(q for q in Path(sys.argv[1]).rglob("*") if q.suffix.lower() in exts):
+            img = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                index.add(str(p), img)
+        for rep, members in index.clusters():
+            print(f"{rep}: {len(members)} image(s)")
+    else:
+        print("Usage: python perceptual_hash.py <directory> [radius]")
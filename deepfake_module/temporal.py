@@ -0,0 +1,358 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from ._profiling import timed
+    from .analysis_blockiness import ForensicBlockiness
+    from .analysis_ela import ForensicELA
+    from .analysis_frequency import ForensicFrequency
+except ImportError:  # standalone use, run from inside deepfake_module/
+    from _profiling import timed
+    from analysis_blockiness import ForensicBlockiness
+    from analysis_ela import ForensicELA
+    from analysis_frequency import ForensicFrequency
+
+
+SPECTRUM_BINS = 16
+FEATURE_NAMES = (
+    ["ela_mean", "ela_block_std", "ela_block_p95", "ela_max"]
+    + [f"spec_{i:02d}" for i in range(SPECTRUM_BINS)]
+    + ["spec_high_ratio", "blk_strength"]
+)
+
+
+def timecode(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, rem = divmod(ms, 3_600_000)
+    m, rem = divmod(rem, 60_000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def frame_features(
+    img: np.ndarray,
+    ela: Optional[ForensicELA] = None,
+    freq: Optional[ForensicFrequency] = None,
+    blockiness: Optional[ForensicBlockiness] = None,
+) -> np.ndarray:
+    """
+    Feature vector of one frame (or face crop), in FEATURE_NAMES order: ELA error statistics over
+    8x8 blocks, the radial log-spectrum (shape only: its mean is removed, so global brightness
+    or contrast changes do not count) plus its high-frequency ratio, and the block-edge strength.
+    """
+    ela = ela or ForensicELA()
+    freq = freq or ForensicFrequency()
+    blockiness = blockiness or ForensicBlockiness()
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    ela_image, max_diff = ela.ela_from_array(np.ascontiguousarray(img))
+    err = ela_image.astype(np.float32) * (float(max_diff) / 255.0)
+    if err.ndim == 3:
+        err = err.mean(axis=2)
+    h, w = (err.shape[0] // 8) * 8, (err.shape[1] // 8) * 8
+    blocks = err[:h, :w].reshape(h // 8, 8, w // 8, 8).mean(axis=(1, 3)) if h and w else err
+    profile = freq.radial_profile(freq.magnitude_spectrum(gray), bins=SPECTRUM_BINS)
+    mean = float(profile.mean()) or 1.0
+    blk = blockiness.analyze_array(gray)["block_strength_mean"] or 0.0
+    return np.concatenate([
+        [err.mean(), blocks.std(), np.percentile(blocks, 95), float(max_diff)],
+        profile - mean,
+        [profile[SPECTRUM_BINS // 2 :].mean() / mean, blk],
+    ]).astype(np.float64)
+
+
+class RollingStats:
+    """
+    Exponentially weighted mean and variance of a feature vector: O(d) time per update and
+    O(d) memory, however long the stream. `halflife` is in samples; until enough samples
+    have been seen, the weight falls back to 1/n (the plain running mean), so early
+    estimates are not biased towards the first frame.
+    """
+
+    def __init__(self, dim: int, halflife: float = 30.0, rel_floor: float = 0.05, abs_floor: float = 1e-3):
+        self.alpha = 1.0 - 0.5 ** (1.0 / halflife)
+        self.rel_floor = rel_floor
+        self.abs_floor = abs_floor
+        self.n = 0
+        self.mean = np.zeros(dim)
+        self.var = np.zeros(dim)
+
+    @property
+    def std(self) -> np.ndarray:
+        # floor: a feature that never moved (static scene) must not turn noise into huge z-scores
+        return np.maximum(np.sqrt(self.var), self.rel_floor * np.abs(self.mean) + self.abs_floor)
+
+    def zscore(self, x: np.ndarray) -> np.ndarray:
+        return (x - self.mean) / self.std
+
+    def update(self, x: np.ndarray, clip: Optional[float] = None) -> None:
+        """Adds one sample. With clip, it is first winsorized to mean +/- clip*std, so an
+        anomalous burst barely moves the baseline it is being compared against."""
+        self.n += 1
+        if self.n == 1:
+            self.mean = x.astype(np.float64).copy()
+            return
+        if clip is not None:
+            s = self.std
+            x = np.clip(x, self.mean - clip * s, self.mean + clip * s)
+        a = max(self.alpha, 1.0 / self.n)
+        d = x - self.mean
+        inc = a * d
+        self.mean += inc
+        self.var = (1.0 - a) * (self.var + d * inc)
+
+
+class TemporalAnalyzer:
+    """
+    Streaming temporal-consistency detector over per-frame feature vectors.
+
+    Two rolling baselines are kept: the feature levels and their frame-to-frame differences
+    (flicker). Each frame is scored against the baselines as they were before it arrived:
+    per feature group, the RMS of the z-scores; the frame score is the largest group score
+    over both streams. Segments open when the score reaches `enter`, and close after `gap`
+    consecutive frames below `exit` (hysteresis). Memory is constant: the two baselines,
+    the previous vector and the open segment; closed segments are returned as they close.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str] = FEATURE_NAMES,
+        fps: float = 25.0,
+        halflife: float = 50.0,
+        warmup: int = 25,
+        enter: float = 4.0,
+        exit: float = 2.5,
+        gap: int = 3,
+        min_frames: int = 2,
+        clip: float = 3.0,
+    ):
+        self.names = list(names)
+        self.fps = fps or 25.0
+        self.warmup = warmup
+        self.enter, self.exit, self.gap, self.min_frames, self.clip = enter, exit, gap, min_frames, clip
+        self.level = RollingStats(len(self.names), halflife)
+        self.delta = RollingStats(len(self.names), halflife)
+        # features are scored per name-prefix group (ela, spec, blk), so 16 spectrum bins
+        # do not outvote the 4 ELA statistics
+        groups = [n.split("_", 1)[0] for n in self.names]
+        self._groups = [(g, np.array([k for k, x in enumerate(groups) if x == g])) for g in dict.fromkeys(groups)]
+        self._prev: Optional[np.ndarray] = None
+        self._open: Optional[Dict] = None
+        self._below = 0
+        self.frames = 0
+        self.scored = 0
+        self.flagged = 0
+        self.max_score = 0.0
+
+    def _score(self, z: np.ndarray) -> Tuple[float, str]:
+        best, group = 0.0, ""
+        for g, idx in self._groups:
+            s = float(np.sqrt(np.mean(z[idx] ** 2)))
+            if s > best:
+                best, group = s, g
+        return best, group
+
+    def update(self, frame_index: int, x: np.ndarray, time_s: Optional[float] = None) -> Optional[Dict]:
+        """Feeds one frame. Returns the segment that this frame closed, if any."""
+        t = frame_index / self.fps if time_s is None else time_s
+        self.frames += 1
+        d = None if self._prev is None else x - self._prev
+        closed = None
+        if d is not None and self.level.n >= max(self.warmup, 2):
+            self.scored += 1
+            z_level, z_delta = self.level.zscore(x), self.delta.zscore(d)
+            s_level, g_level = self._score(z_level)
+            s_delta, g_delta = self._score(z_delta)
+            if s_delta >= s_level:
+                score, stream, group, z = s_delta, "flicker", g_delta, z_delta
+            else:
+                score, stream, group, z = s_level, "level", g_level, z_level
+            self.max_score = max(self.max_score, score)
+            # inside a segment, a flicker on a frame whose level is back at the baseline is
+            # the jump out of the anomaly: the segment ended on the previous frame
+            falling = self._open is not None and stream == "flicker" and s_level < self.exit
+            if score >= self.enter and not falling:
+                self._extend(frame_index, t, score, stream, group, z)
+            if self._open is not None and score >= self.exit and not falling:
+                self._below = 0
+                self._open["end_frame"], self._open["end_time_s"] = frame_index, round(t, 3)
+            elif self._open is not None:
+                self._below += 1
+                if self._below >= self.gap:
+                    closed = self._close()
+        self._learn(self.level, x)
+        if d is not None:
+            self._learn(self.delta, d)
+        self._prev = x
+        return closed
+
+    def _learn(self, stats: RollingStats, x: np.ndarray) -> None:
+        # winsorizing against a baseline that has not settled (variance still 0, std at the
+        # floor) would clip every later sample to the floor and freeze the variance there:
+        # the first `warmup` samples are taken as they are
+        stats.update(x, clip=self.clip if stats.n >= self.warmup else None)
+
+    def _extend(self, frame_index: int, t: float, score: float, stream: str, group: str, z: np.ndarray) -> None:
+        # the open segment is all the state a detection keeps; frames are not buffered
+        self.flagged += 1
+        seg = self._open
+        if seg is None:
+            seg = self._open = {
+                "start_frame": frame_index,
+                "start_time_s": round(t, 3),
+                "end_frame": frame_index,
+                "end_time_s": round(t, 3),
+                "flagged_frames": 0,
+                "peak_score": 0.0,
+            }
+        seg["flagged_frames"] += 1
+        if score > seg["peak_score"]:
+            top = np.argsort(-np.abs(z))[:3]
+            seg.update({
+                "peak_score": round(score, 3),
+                "peak_frame": frame_index,
+                "peak_time_s": round(t, 3),
+                "stream": stream,
+                "group": group,
+                "top_features": {self.names[k]: round(float(z[k]), 2) for k in top},
+            })
+
+    def _close(self) -> Optional[Dict]:
+        seg, self._open, self._below = self._open, None, 0
+        if seg is None or seg["flagged_frames"] < self.min_frames:
+            return None
+        seg["start_timecode"] = timecode(seg["start_time_s"])
+        seg["end_timecode"] = timecode(seg["end_time_s"])
+        return seg
+
+    def finish(self) -> Optional[Dict]:
+        """Closes the segment still open at the end of the stream, if any."""
+        return self._close()
+
+    def summary(self) -> Dict:
+        return {
+            "frames": self.frames,
+            "scored_frames": self.scored,
+            "flagged_frames": self.flagged,
+            "max_score": round(self.max_score, 3),
+            "params": {
+                "halflife": round(np.log(0.5) / np.log(1.0 - self.level.alpha), 2),
+                "warmup": self.warmup, "enter": self.enter, "exit": self.exit,
+                "gap": self.gap, "min_frames": self.min_frames, "clip": self.clip,
+            },
+        }
+
+
+def iter_video_features(
+    video_path: str,
+    step: int = 1,
+    face_detector=None,
+    max_frames: Optional[int] = None,
+) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """
+    (frame_index, time_s, features) for every `step`-th frame, decoded one at a time.
+    With a ForensicFaceDetector, features come from the largest tracked face crop only;
+    frames without a face are skipped.
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    ela, freq, blk = ForensicELA(), ForensicFrequency(), ForensicBlockiness()
+
+    def frames():
+        idx = kept = 0
+        while max_frames is None or kept < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            if idx % step == 0:
+                kept += 1
+                yield idx, frame
+            idx += 1
+
+    try:
+        if face_detector is None:
+            for idx, frame in frames():
+                with timed("temporal_features"):
+                    yield idx, idx / fps, frame_features(frame, ela, freq, blk)
+            return
+        for rec, frame in face_detector.track_frames(frame for _, frame in frames()):
+            idx = rec["frame"] * step
+            if not rec["faces"]:
+                continue
+            face = max(rec["faces"], key=lambda f: f["box"][2] * f["box"][3])
+            x0, y0, x1, y1 = face_detector.crop_box(face["box"], frame.shape)
+            if y1 - y0 < 16 or x1 - x0 < 16:
+                continue
+            with timed("temporal_features"):
+                yield idx, idx / fps, frame_features(frame[y0:y1, x0:x1], ela, freq, blk)
+    finally:
+        cap.release()
+
+
+def analyze_video_temporal(
+    video_path: str,
+    step: int = 1,
+    face_detector=None,
+    max_frames: Optional[int] = None,
+    **analyzer_kw,
+) -> Dict:
+    """
+    Temporal consistency analysis of a whole video in constant memory: frames are decoded,
+    reduced to a feature vector and fed to a TemporalAnalyzer one at a time.
+    Returns the summary and the anomalous segments (with timestamps).
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    analyzer = TemporalAnalyzer(fps=fps, **analyzer_kw)
+    segments = []
+    for idx, t, x in iter_video_features(video_path, step, face_detector, max_frames):
+        seg = analyzer.update(idx, x, t)
+        if seg:
+            segments.append(seg)
+    seg = analyzer.finish()
+    if seg:
+        segments.append(seg)
+    return {
+        "method": "ewm_zscore_hysteresis",
+        "region": "face" if face_detector is not None else "frame",
+        "features": list(analyzer.names),
+        "fps": fps,
+        "step": step,
+        **analyzer.summary(),
+        "segments": segments,
+    }
+
+
+def record_in_case_report(report_path: str, temporal: Dict) -> Dict:
+    """
+    Stores a temporal analysis under "temporal_analysis" in a case report (e.g. the
+    extraction_report.json written by ForensicFrameExtractor), creating it if missing.
+    The file is replaced atomically.
+    """
+    report_path = Path(report_path)
+    report = json.loads(report_path.read_text()) if report_path.exists() else {}
+    report["temporal_analysis"] = temporal
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = report_path.with_name(report_path.name + ".tmp")
+    tmp.write_text(json.dumps(report, indent=2))
+    os.replace(tmp, report_path)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        res = analyze_video_temporal(sys.argv[1])
+        if len(sys.argv) > 2:
+            record_in_case_report(sys.argv[2], res)
+        print(json.dumps(res, indent=2))
+    else:
+        print("Usage: python temporal.py <video_path> [extraction_report.json]")
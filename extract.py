@@ -1,16 +1,19 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import io
+import struct
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
 
+from .profiling import timed
 from .utils import sha256_text, flatten_8x8
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class JPEGMeta:
     progressive: Optional[bool] = None
     subsampling: Optional[str] = None  # "444" | "422" | "420" | None
@@ -27,7 +30,18 @@ def extract_jpeg_meta(jpeg_path: Path) -> JPEGMeta:
 
     Nao depende de bibliotecas externas.
     """
-    data = jpeg_path.read_bytes()
+    with timed("read"):
+        data = Path(jpeg_path).read_bytes()
+    return parse_jpeg_meta(data)
+
+
+def parse_jpeg_meta(data: bytes) -> JPEGMeta:
+    """Mesmo que extract_jpeg_meta, mas sobre bytes ja lidos (evita reler o arquivo)."""
+    with timed("header_parse"):
+        return _parse_jpeg_meta(data)
+
+
+def _parse_jpeg_meta(data: bytes) -> JPEGMeta:
     if len(data) < 4 or data[0:2] != b"\xFF\xD8":
         return JPEGMeta()
 
@@ -107,6 +121,190 @@ def extract_jpeg_meta(jpeg_path: Path) -> JPEGMeta:
     return JPEGMeta(progressive=progressive, subsampling=subsampling, width=width, height=height)
 
 
+# indice, na sequencia zigue-zague do DQT, de cada posicao natural (linha*8+coluna) da tabela 8x8
+_ZIGZAG_ORDER = sorted(
+    ((r, c) for r in range(8) for c in range(8)),
+    key=lambda p: (p[0] + p[1], p[0] if (p[0] + p[1]) % 2 else p[1]),
+)
+ZIGZAG_INDEX = np.empty(64, dtype=np.intp)
+ZIGZAG_INDEX[[r * 8 + c for r, c in _ZIGZAG_ORDER]] = np.arange(64)
+
+# SOF0..SOF15, exceto DHT (C4), JPG (C8) e DAC (CC)
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+# prefixo do corpo do APPn -> tipo da imagem embutida (outros APPn saem como "appN")
+EMBEDDED_KINDS = {
+    (0xE0, b"JFXX\x00"): "jfxx_thumbnail",
+    (0xE1, b"Exif\x00"): "exif_thumbnail",
+    (0xE2, b"MPF\x00"): "mpf",
+    (0xED, b"Photoshop 3.0\x00"): "photoshop_thumbnail",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class EmbeddedJPEG:
+    """Miniatura/preview codificado a parte dentro de um JPEG (EXIF, JFXX, Photoshop, MPF)."""
+
+    kind: str
+    start: int  # offset do SOI embutido, relativo ao buffer
+    qtables: Dict[str, Any]
+    meta: JPEGMeta
+
+
+@dataclass(frozen=True, slots=True)
+class JPEGHeader:
+    """Cabecalho de um JPEG dentro de um buffer maior (offsets relativos ao buffer)."""
+
+    start: int  # offset do SOI
+    sos: int  # offset do marcador SOS (fim do cabecalho; dados entropicos comecam depois)
+    qtables: Dict[str, Any]
+    meta: JPEGMeta
+    embedded: Tuple[EmbeddedJPEG, ...] = ()
+
+
+def _embedded_kind(marker: int, body: memoryview) -> str:
+    head = bytes(body[:14])
+    for (m, prefix), kind in EMBEDDED_KINDS.items():
+        if m == marker and head.startswith(prefix):
+            return kind
+    return f"app{marker - 0xE0}"
+
+
+def _mpf_offsets(view: memoryview, tiff: int, seg_end: int) -> Iterator[int]:
+    """Offsets absolutos das imagens listadas no MP Index IFD (APP2 "MPF"), exceto a primaria.
+
+    Os offsets do MP Entry sao relativos ao cabecalho TIFF do MPF (logo apos "MPF\\0");
+    as imagens ficam depois do EOI da primaria.
+    """
+    order = bytes(view[tiff : tiff + 2])
+    if order not in (b"II", b"MM"):
+        return
+    e = "<" if order == b"II" else ">"
+    try:
+        ifd = tiff + struct.unpack_from(e + "I", view, tiff + 4)[0]
+        n = struct.unpack_from(e + "H", view, ifd)[0]
+        if ifd + 2 + 12 * n > seg_end:
+            return
+        for k in range(n):
+            tag, _, cnt, val = struct.unpack_from(e + "HHII", view, ifd + 2 + 12 * k)
+            if tag != 0xB002:  # MP Entry: 16 bytes por imagem (atributo, tamanho, offset, dependencias)
+                continue
+            for j in range(cnt // 16):
+                offset = struct.unpack_from(e + "I", view, tiff + val + 16 * j + 8)[0]
+                if offset:
+                    yield tiff + offset
+    except struct.error:
+        return
+
+
+def _find_embedded(view: memoryview, segments: List[Tuple[int, int, int]], end: int) -> Tuple[EmbeddedJPEG, ...]:
+    """JPEGs completos dentro dos segmentos APPn (busca vetorizada de SOI) e imagens do MPF."""
+    out: List[EmbeddedJPEG] = []
+    for marker, a, b in segments:
+        kind = _embedded_kind(marker, view[a:b])
+        if kind == "mpf":
+            starts: Any = _mpf_offsets(view, a + 4, b)
+            limit = end
+        else:
+            arr = np.frombuffer(view[a:b], dtype=np.uint8)
+            starts = np.flatnonzero((arr[:-2] == 0xFF) & (arr[1:-1] == 0xD8) & (arr[2:] == 0xFF)) + a
+            limit = b
+        nxt = a
+        for p in starts:
+            if p < nxt:  # SOI dentro de uma miniatura ja lida
+                continue
+            hdr = parse_jpeg_header(view, int(p), limit, embedded=False)
+            if hdr is not None:
+                out.append(EmbeddedJPEG(kind=kind, start=hdr.start, qtables=hdr.qtables, meta=hdr.meta))
+                nxt = hdr.sos
+    return tuple(out)
+
+
+def parse_jpeg_header(buf: Any, start: int = 0, end: Optional[int] = None, embedded: bool = True) -> Optional[JPEGHeader]:
+    """Le DQT/SOF de um JPEG que comeca em buf[start], sem copiar o buffer.
+
+    buf pode ser bytes, mmap ou memoryview (um memoryview de um mmap nao copia nada).
+    Percorre os segmentos ate o SOS, sem passar de `end`. Devolve None se a estrutura
+    nao fecha (SOI ausente, byte fora de marcador, comprimento estourando o limite,
+    sem SOS, sem SOF ou sem DQT): e o filtro de falsos positivos do carving.
+    As tabelas saem no mesmo formato de parse_qtables (ordem natural, indices 0/1 do DQT).
+    Com embedded, miniaturas/previews dos segmentos APPn (EXIF, JFXX, Photoshop) e as
+    imagens do MPF (ate `end`) tambem sao lidas, so pelo cabecalho, em .embedded.
+    """
+    end = len(buf) if end is None else min(end, len(buf))
+    if start + 4 > end or buf[start] != 0xFF or buf[start + 1] != 0xD8:
+        return None
+    view = memoryview(buf)
+    try:
+        tables: Dict[int, np.ndarray] = {}
+        apps: List[Tuple[int, int, int]] = []  # (marcador, inicio, fim) dos APPn
+        sof = False
+        i = start + 2
+        while i + 4 <= end:
+            if view[i] != 0xFF:
+                return None
+            while i < end and view[i] == 0xFF:  # FFs de preenchimento
+                i += 1
+            if i + 3 > end:
+                return None
+            marker, m = view[i], i
+            seg_len = (view[i + 1] << 8) | view[i + 2]
+            body = i + 3
+            i = body + seg_len - 2
+            if seg_len < 2 or i > end or marker in (0x00, 0xD8, 0xD9) or 0xD0 <= marker <= 0xD7:
+                return None
+            if marker == 0xDB:
+                j = body
+                while j < i:
+                    pq, tq = view[j] >> 4, view[j] & 0x0F
+                    n = 64 * (pq + 1)
+                    if pq > 1 or j + 1 + n > i:
+                        return None
+                    zz = np.frombuffer(view[j + 1 : j + 1 + n], dtype=">u2" if pq else np.uint8)
+                    tables[tq] = zz[ZIGZAG_INDEX].astype(np.int32)
+                    j += 1 + n
+            elif marker in SOF_MARKERS:
+                sof = True
+            elif embedded and 0xE0 <= marker <= 0xEF:
+                apps.append((marker, body, i))
+            elif marker == 0xDA:
+                if not (sof and tables):
+                    return None
+                qtables: Dict[str, Any] = {}
+                if 0 in tables:
+                    qtables["Y"] = tables[0].reshape((8, 8)).tolist()
+                if 1 in tables:
+                    chroma = tables[1].reshape((8, 8)).tolist()
+                    qtables["Cb"] = chroma
+                    qtables["Cr"] = chroma
+                sos = m - 1
+                return JPEGHeader(
+                    start=start,
+                    sos=sos,
+                    qtables=qtables,
+                    meta=_parse_jpeg_meta(view[start:sos]),
+                    embedded=_find_embedded(view, apps, end) if apps else (),
+                )
+        return None
+    finally:
+        view.release()
+
+
+def embedded_fingerprints(data: Any, with_tables: bool = False) -> List[Dict[str, Any]]:
+    """Fingerprints das miniaturas/previews embutidos (ver parse_jpeg_header), na mesma leitura
+    do arquivo usada para a imagem primaria. Lista vazia se nao ha nenhum."""
+    with timed("header_parse"):
+        hdr = parse_jpeg_header(data)
+    out = []
+    for e in hdr.embedded if hdr is not None else ():
+        rec: Dict[str, Any] = {"kind": e.kind, "offset": e.start, "qhash": qhash_from_tables(e.qtables), "jpeg_meta": asdict(e.meta)}
+        if with_tables:
+            rec["qtables"] = e.qtables
+        out.append(rec)
+    return out
+
+
 def extract_qtables(jpeg_path: Path) -> Dict[str, Any]:
     """Extrai tabelas de quantizacao via Pillow.
 
@@ -119,7 +317,17 @@ def extract_qtables(jpeg_path: Path) -> Dict[str, Any]:
 
     Observacao: Pillow expose qtables por indice (0=luma, 1=chroma).
     """
-    img = Image.open(jpeg_path)
+    with timed("pillow_open"):
+        return _qtables_from_image(Image.open(jpeg_path))
+
+
+def parse_qtables(data: bytes) -> Dict[str, Any]:
+    """Mesmo que extract_qtables, mas sobre bytes ja lidos (evita reler o arquivo)."""
+    with timed("pillow_open"):
+        return _qtables_from_image(Image.open(io.BytesIO(data)))
+
+
+def _qtables_from_image(img: Image.Image) -> Dict[str, Any]:
     qtables = getattr(img, "quantization", None)
     if not qtables:
         return {}
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+import tempfile
+import zlib
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from .attribution import LEVELS, evidence_keys
+from .carve import MAX_HEADER
+from .db import SCHEMA_V2, iter_items
+from .db_sqlite import SqliteQuantDB, open_db
+from .extract import parse_jpeg_header, qhash_from_tables
+from .prefilter import BloomFilter
+from .profiling import count, timed
+from .scan import scan_jpegs
+from .utils import imap_bounded
+
+# Primeira leitura do cabecalho; so arquivos com APPn grandes (EXIF com preview, ICC) leem ate MAX_HEADER.
+HEAD_BYTES = 64 * 1024
+# Linhas (chave, caminho) mantidas em memoria por lado antes de particionar em disco.
+DEFAULT_MAX_ROWS = 2_000_000
+DEFAULT_PARTITIONS = 64
+
+Row = Tuple[str, str]  # (chave de join, caminho)
+
+
+def file_fingerprint(path: Path) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]:
+    """(qhash, jpeg_meta) lidos so do cabecalho (DQT/SOF ate o SOS), sem ler a imagem inteira."""
+    with open(path, "rb") as f:
+        with timed("read"):
+            head = f.read(HEAD_BYTES)
+        with timed("header_parse"):
+            hdr = parse_jpeg_header(head, embedded=False)
+        if hdr is None and len(head) == HEAD_BYTES:
+            with timed("read"):
+                head += f.read(MAX_HEADER - HEAD_BYTES)
+            with timed("header_parse"):
+                hdr = parse_jpeg_header(head, embedded=False)
+    if hdr is None:
+        return None
+    return qhash_from_tables(hdr.qtables), asdict(hdr.meta)
+
+
+def join_key(qhash: Dict[str, str], meta: Optional[Dict[str, Any]], level: str = LEVELS[0]) -> Optional[str]:
+    """Chave do fingerprint no nivel pedido (mesmas chaves do modelo de atribuicao); None se faltar hash."""
+    return dict(evidence_keys(qhash, meta)).get(level)
+
+
+def iter_side_rows(source: Path, level: str = LEVELS[0], workers: int = 1, stats: Optional[Dict[str, int]] = None) -> Iterator[Row]:
+    """Linhas (chave, caminho) de um lado do join.
+
+    Diretorio: JPEGs (pelo conteudo) com fingerprint extraido em paralelo (imap_bounded).
+    Arquivo: DB do qext (JSON ou SQLite), cujos itens ja trazem qhash/jpeg_meta.
+    Arquivos sem cabecalho valido ou sem o hash exigido pelo nivel entram em stats["skipped"].
+    """
+    source = Path(source)
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("skipped", 0)
+
+    if source.is_dir():
+        def work(p: Path) -> Tuple[Path, Optional[Tuple[Dict[str, str], Dict[str, Any]]]]:
+            try:
+                return p, file_fingerprint(p)
+            except OSError:
+                return p, None
+
+        pairs: Iterable[Tuple[str, Optional[Dict[str, str]], Optional[Dict[str, Any]]]] = (
+            (str(p.resolve()), *(fp or (None, None)))
+            for p, fp in imap_bounded(work, scan_jpegs(source), workers=workers)
+        )
+    else:
+        def db_pairs() -> Iterator[Tuple[str, Optional[Dict[str, str]], Optional[Dict[str, Any]]]]:
+            db = open_db(source)
+            try:
+                if isinstance(db, SqliteQuantDB):
+                    items: Iterable[Dict[str, Any]] = db.iter_items()
+                else:
+                    items = db.get("items", []) if db.get("schema") == SCHEMA_V2 else iter_items(db)  # v2: qhash ja no item
+                for it in items:
+                    yield it.get("path") or it.get("filename"), it.get("qhash"), it.get("jpeg_meta")
+            finally:
+                if isinstance(db, SqliteQuantDB):
+                    db.close()
+
+        pairs = db_pairs()
+
+    for path, qhash, meta in pairs:
+        key = join_key(qhash, meta, level) if qhash else None
+        if key is None:
+            stats["skipped"] += 1
+            continue
+        stats["rows"] += 1
+        count("join_rows")
+        yield key, path
+
+
+def _bloom_key(key: str) -> str:
+    # BloomFilter tira as posicoes dos 128 primeiros bits: a chave composta e hasheada inteira
+    return hashlib.sha256(key.encode("ascii")).hexdigest()
+
+
+class _SpillSide:
+    """Um lado do join: chave -> caminhos em memoria ate max_rows linhas; dai em diante,
+    particionado em disco (JSONL, uma particao por crc32(chave) % partitions).
+
+    Com track_keys, as chaves gravadas em disco vao tambem para um BloomFilter (might_have),
+    para o outro lado descartar linhas sem par antes de gravar.
+    """
+
+    def __init__(self, name: str, tmpdir: Path, partitions: int, max_rows: int, track_keys: bool = False):
+        self.name = name
+        self.tmpdir = tmpdir
+        self.partitions = partitions
+        self.max_rows = max_rows
+        self.track_keys = track_keys
+        self.rows: Dict[str, List[str]] = {}
+        self.n = 0
+        self.keys: Optional[BloomFilter] = None
+        self._seen: set = set()  # chaves ja no filtro (exato, ate max_rows chaves distintas)
+        self._files: Optional[List[IO[str]]] = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._files is not None
+
+    def _part(self, key: str) -> int:
+        return zlib.crc32(key.encode("ascii")) % self.partitions
+
+    def might_have(self, key: str) -> bool:
+        """False = chave certamente ausente deste lado (falso positivo possivel depois do spill)."""
+        if self._files is None:
+            return key in self.rows
+        return self.keys is None or key in self._seen or _bloom_key(key) in self.keys
+
+    def add(self, key: str, path: str) -> None:
+        if self._files is not None:
+            if self.keys is not None and key not in self._seen:
+                self.keys.add(_bloom_key(key))
+                if len(self._seen) < self.max_rows:
+                    self._seen.add(key)
+            self._files[self._part(key)].write(json.dumps([key, path], ensure_ascii=False) + "\n")
+            return
+        self.rows.setdefault(key, []).append(path)
+        self.n += 1
+        if self.n > self.max_rows:
+            self.spill()
+
+    def spill(self) -> None:
+        if self._files is not None:
+            return
+        count(f"join_spill_{self.name}")
+        self._files = [
+            open(self.tmpdir / f"{self.name}_{i:04d}.jsonl", "w", encoding="utf-8")
+            for i in range(self.partitions)
+        ]
+        if self.track_keys:
+            self.keys = BloomFilter.for_capacity(self.max_rows, fp_rate=1e-3)
+        rows, self.rows = self.rows, {}
+        with timed("join_spill"):
+            for key, paths in rows.items():
+                for p in paths:
+                    self.add(key, p)
+
+    def partition(self, i: int) -> Dict[str, List[str]]:
+        """Particao i carregada em memoria (o lado precisa ter sido particionado)."""
+        assert self._files is not None
+        out: Dict[str, List[str]] = {}
+        f = self._files[i]
+        f.close()
+        with open(f.name, "r", encoding="utf-8") as fh:
+            for line in fh:
+                key, path = json.loads(line)
+                out.setdefault(key, []).append(path)
+        return out
+
+    def close(self) -> None:
+        for f in self._files or ():
+            f.close()
+
+
+def _groups(a: Dict[str, List[str]], b: Dict[str, List[str]], level: str, max_paths: Optional[int]) -> Iterator[Dict[str, Any]]:
+    # itera o menor lado e sonda o maior
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    for key in small:
+        if key not in large:
+            continue
+        pa, pb = a[key], b[key]
+        yield {
+            "level": level,
+            "key": key,
+            "a_count": len(pa),
+            "b_count": len(pb),
+            "a": pa if max_paths is None else pa[:max_paths],
+            "b": pb if max_paths is None else pb[:max_paths],
+        }
+
+
+def hash_join(
+    rows_a: Iterable[Row],
+    rows_b: Iterable[Row],
+    level: str = LEVELS[0],
+    max_rows: int = DEFAULT_MAX_ROWS,
+    partitions: int = DEFAULT_PARTITIONS,
+    max_paths: Optional[int] = None,
+    tmpdir: Optional[Path] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Hash join (Grace) de dois fluxos (chave, caminho): um grupo por chave presente nos dois lados.
+
+    O lado A e consumido primeiro; linhas de B sem chave em A sao descartadas na hora
+    (semi-join: exato com A em memoria, por BloomFilter das chaves de A depois do spill),
+    entao um B enorme sem relacao com A nao ocupa memoria nem disco. Se algum lado passar de max_rows linhas, ambos sao particionados
+    em disco pela mesma funcao de hash e o join roda particao a particao; a memoria fica
+    limitada a uma particao (uma chave muito repetida ainda precisa caber inteira).
+    Grupos trazem as contagens completas; com max_paths, so os primeiros caminhos de cada lado.
+    """
+    stats = stats if stats is not None else {}
+    work = Path(tempfile.mkdtemp(prefix="qext-join-", dir=tmpdir))
+    a = _SpillSide("a", work, partitions, max_rows, track_keys=True)
+    b = _SpillSide("b", work, partitions, max_rows)
+    try:
+        with timed("join_build"):
+            for key, path in rows_a:
+                a.add(key, path)
+        with timed("join_probe"):
+            for key, path in rows_b:
+                if a.might_have(key):
+                    b.add(key, path)
+        stats["spilled"] = a.spilled or b.spilled
+        stats.setdefault("groups", 0)
+        stats.setdefault("a_matched", 0)
+        stats.setdefault("b_matched", 0)
+        if stats["spilled"]:
+            a.spill()
+            b.spill()
+            parts = ((a.partition(i), b.partition(i)) for i in range(partitions))
+        else:
+            parts = iter([(a.rows, b.rows)])
+        for pa, pb in parts:
+            with timed("join_match"):
+                groups = list(_groups(pa, pb, level, max_paths))
+            for g in groups:
+                stats["groups"] += 1
+                stats["a_matched"] += g["a_count"]
+                stats["b_matched"] += g["b_count"]
+                yield g
+    finally:
+        a.close()
+        b.close()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def join_collections(
+    source_a: Path,
+    source_b: Path,
+    level: str = LEVELS[0],
+    workers: int = 1,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    partitions: int = DEFAULT_PARTITIONS,
+    max_paths: Optional[int] = None,
+    tmpdir: Optional[Path] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Quais arquivos de A compartilham fingerprint de encoder com arquivos de B.
+
+    Cada lado (diretorio de JPEGs ou DB do qext) e lido uma vez; o custo e O(|A| + |B|),
+    nao um match_against_db por arquivo. `level` e um dos niveis do modelo de atribuicao:
+    "Y+C+sub+prog" (tabelas + estrutura, padrao) ou "Y+C"/"Y"/"C" (so tabelas).
+    stats (se dado) recebe as contagens de cada lado e do join ao final.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"Nivel invalido: {level} (use um de {', '.join(LEVELS)})")
+    stats = stats if stats is not None else {}
+    stats["a"], stats["b"] = {}, {}
+    rows_a = iter_side_rows(source_a, level, workers=workers, stats=stats["a"])
+    rows_b = iter_side_rows(source_b, level, workers=workers, stats=stats["b"])
+    yield from hash_join(rows_a, rows_b, level, max_rows=max_rows, partitions=partitions,
+                         max_paths=max_paths, tmpdir=tmpdir, stats=stats)
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import hashlib
+import heapq
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from .extract import extract_qtables, qhash_from_tables
-from .db import load_db_json
-from .utils import sha256_file
+import numpy as np
 
+from .attribution import AttributionModel
+from .columnar import ColumnarDB
+from .db_sqlite import SqliteQuantDB, open_db
+from .dedup import DuplicateIndex
+from .extract import embedded_fingerprints, parse_jpeg_meta, parse_qtables, qhash_from_tables
+from .prefilter import BloomFilter, load_prefilter_for_db
+from .profiling import count, timed
 
-@dataclass
+
+@dataclass(slots=True)
 class MatchHit:
     software: str
     quality: Optional[int]
@@ -18,62 +26,387 @@ class MatchHit:
     score: float
 
 
-def match_against_db(db: Dict[str, Any], input_path: Path, topk: int = 10) -> Dict[str, Any]:
-    """Match por igualdade de qhash (Y e/ou C).
+class LazyDB:
+    """Adia a abertura do DB ate o primeiro input que passar pelo prefiltro.
+
+    DB JSON e convertido para ColumnarDB (colunas NumPy) ao abrir.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._db: Union[ColumnarDB, SqliteQuantDB, None] = None
+
+    def get(self) -> Union[ColumnarDB, SqliteQuantDB]:
+        if self._db is None:
+            db = open_db(self.db_path)
+            if isinstance(db, dict):
+                with timed("columnar_build"):
+                    db = ColumnarDB.from_db(db)
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        if isinstance(self._db, SqliteQuantDB):
+            self._db.close()
+        self._db = None
+
+
+DBLike = Union[Dict[str, Any], ColumnarDB, SqliteQuantDB, LazyDB]
+
+
+def _candidate_items(db: DBLike, qhash: Dict[str, str]) -> Iterable[Dict[str, Any]]:
+    """Itens a comparar: todos (DB JSON em memoria) ou so os do indice (SQLite)."""
+    if isinstance(db, SqliteQuantDB):
+        return db.candidates(qhash)
+    return db.get("items", [])
+
+
+def _embedded_candidates(db: DBLike, qhash: Dict[str, str]) -> Iterable[Dict[str, Any]]:
+    """Miniaturas do DB como itens (qhash = o da miniatura): indice (SQLite/ColumnarDB) ou todas (dict)."""
+    if isinstance(db, (SqliteQuantDB, ColumnarDB)):
+        return db.embedded_candidates(qhash)
+    return (
+        dict(it, qhash=e.get("qhash") or {}, embedded_kind=e.get("kind"))
+        for it in db.get("items", [])
+        for e in it.get("embedded", ())
+    )
+
+
+@dataclass(slots=True)
+class MatchGroup:
+    """Hits agregados por (software, quality): score maximo e quantidade de arquivos."""
+
+    software: str
+    quality: Optional[int]
+    score: float
+    count: int
+
+
+@dataclass(slots=True)
+class MatchSummary:
+    hits: List[MatchHit]
+    groups: List[MatchGroup]
+    total: int
+
+
+def _score(qhash: Dict[str, str], it_q: Dict[str, str]) -> float:
+    """1.0 Y+C, 0.7 so Y, 0.6 so C, 0.0 sem match."""
+    y_ok = ("Y" in qhash and it_q.get("Y") == qhash.get("Y"))
+    c_ok = ("C" in qhash and it_q.get("C") == qhash.get("C"))
+    if y_ok and c_ok:
+        return 1.0
+    if y_ok:
+        return 0.7
+    if c_ok:
+        return 0.6
+    return 0.0
+
+
+def _summary_items(items: Iterable[Dict[str, Any]], qhash: Dict[str, str], topk: int) -> MatchSummary:
+    """Uma passada: heap de tamanho topk para os hits e contadores por (software, quality).
+
+    Memoria O(topk + grupos), independente de quantos itens casam (ex.: IJG Q75,
+    comum a muitos encoders). So os vencedores viram MatchHit.
+    """
+    groups: Dict[Tuple[str, Optional[int]], List[Any]] = {}
+    total = 0
+
+    def scored() -> Iterator[Tuple[Tuple[float, str, int], float, Dict[str, Any]]]:
+        nonlocal total
+        for it in items:
+            score = _score(qhash, it.get("qhash", {}))
+            if not score:
+                continue
+            total += 1
+            sw, q = it.get("software", "?"), it.get("quality")
+            g = groups.setdefault((sw, q), [score, 0])
+            g[0] = max(g[0], score)
+            g[1] += 1
+            yield (-score, sw, q or 10**9), score, it
+
+    # nsmallest = sorted(...)[:topk] (estavel), mas com heap de tamanho topk
+    winners = heapq.nsmallest(max(topk, 0), scored(), key=lambda e: e[0])
+    if topk <= 0:
+        for _ in scored():  # nsmallest(0, ...) nao consome; total/groups ainda sao contados
+            pass
+    hits = [
+        MatchHit(
+            software=it.get("software", "?"),
+            quality=it.get("quality"),
+            filename=it.get("filename") or "?",
+            sha256=it.get("sha256", "?"),
+            score=score,
+        )
+        for _, score, it in winners
+    ]
+    top_groups = heapq.nsmallest(
+        topk, groups.items(), key=lambda kv: (-kv[1][0], kv[0][0], kv[0][1] or 10**9, kv[0][1] is None)
+    )
+    return MatchSummary(
+        hits=hits,
+        groups=[MatchGroup(software=sw, quality=q, score=g[0], count=g[1]) for (sw, q), g in top_groups],
+        total=total,
+    )
+
+
+def _summary_columnar(db: ColumnarDB, qhash: Dict[str, str], topk: int) -> MatchSummary:
+    """Versao vetorizada: argpartition para o top-k e bincount para os grupos (sem ordenar tudo)."""
+    y_ok, c_ok = db.match_mask(qhash)
+    rows = np.flatnonzero(y_ok | c_ok)
+    if rows.size == 0 or topk <= 0:
+        return MatchSummary(hits=[], groups=[], total=int(rows.size))
+    # rank 0/1/2 = score 1.0/0.7/0.6
+    rank = np.where(y_ok[rows] & c_ok[rows], 0, np.where(y_ok[rows], 1, 2)).astype(np.uint64)
+    quality = db.quality[rows].astype(np.int64)
+    quality[quality <= 0] = 0xFFFF  # mesmo criterio de (quality or 10**9)
+    sw = db.software[rows].astype(np.uint64)
+    # chave unica (rank, software, quality, linha) num uint64: mesma ordem do caminho dict
+    group_key = (rank << np.uint64(62)) | (sw << np.uint64(48)) | (quality.astype(np.uint64) << np.uint64(32))
+    key = group_key | rows.astype(np.uint64)
+
+    k = min(topk, rows.size)
+    top = np.argpartition(key, k - 1)[:k] if k < rows.size else np.arange(rows.size)
+    top = top[np.argsort(key[top])]
+    scores = _RANK_SCORE[rank.astype(np.int64)]
+    hits = [
+        MatchHit(
+            software=db.software_names[db.software[i]],
+            quality=None if db.quality[i] < 0 else int(db.quality[i]),
+            filename=db.filename[i] or "?",
+            sha256=db.sha256[i].tobytes().hex() if db.sha256[i].any() else "?",
+            score=float(scores[j]),
+        )
+        for j, i in ((int(j), int(rows[j])) for j in top)
+    ]
+
+    # grupos (software, quality): o score do grupo e o do seu melhor arquivo (menor rank)
+    sq = (sw << np.uint64(16)) | db.quality[rows].astype(np.uint16).astype(np.uint64)
+    uniq, inv, counts = np.unique(sq, return_inverse=True, return_counts=True)
+    best = np.full(uniq.size, 3, dtype=np.uint64)
+    np.minimum.at(best, inv, rank)
+    gq = (uniq & np.uint64(0xFFFF)).astype(np.uint16).view(np.int16).astype(np.int64)
+    # quality 0 e None empatam em (quality or 10**9); None por ultimo, como no caminho dict
+    gq_key = np.where(gq < 0, 0xFFFF, np.where(gq == 0, 0xFFFE, gq)).astype(np.uint64)
+    gkey = (best << np.uint64(62)) | ((uniq >> np.uint64(16)) << np.uint64(48)) | (gq_key << np.uint64(32))
+    g = min(topk, uniq.size)
+    gtop = np.argpartition(gkey, g - 1)[:g] if g < uniq.size else np.arange(uniq.size)
+    gtop = gtop[np.argsort(gkey[gtop])]
+    groups = [
+        MatchGroup(
+            software=db.software_names[int(uniq[j] >> np.uint64(16))],
+            quality=None if gq[j] < 0 else int(gq[j]),
+            score=float(_RANK_SCORE[int(best[j])]),
+            count=int(counts[j]),
+        )
+        for j in gtop
+    ]
+    return MatchSummary(hits=hits, groups=groups, total=int(rows.size))
+
+
+_RANK_SCORE = np.array([1.0, 0.7, 0.6])
+
+
+def match_summary(db: DBLike, qhash: Dict[str, str], topk: int = 10) -> MatchSummary:
+    """Top-k hits, top-k grupos (software, quality) com contagem e o total de itens que casaram.
+
+    Sem ordenar a lista inteira de hits: heap de tamanho topk (dict/SQLite) ou
+    argpartition (ColumnarDB). Scores em match_qhash.
+    """
+    if isinstance(db, LazyDB):
+        db = db.get()
+    with timed("match_scan"):
+        if isinstance(db, ColumnarDB):
+            return _summary_columnar(db, qhash, topk)
+        return _summary_items(_candidate_items(db, qhash), qhash, topk)
+
+
+def match_qhash(db: DBLike, qhash: Dict[str, str], topk: int = 10) -> List[MatchHit]:
+    """Match por igualdade de qhash (Y e/ou C) de um fingerprint ja extraido.
 
     score:
       - 1.0 match perfeito Y+C
       - 0.7 match so Y
       - 0.6 match so C
     """
-    input_path = Path(input_path)
-    qtables = extract_qtables(input_path)
-    qhash = qhash_from_tables(qtables)
+    return match_summary(db, qhash, topk=topk).hits
 
-    hits: List[MatchHit] = []
 
-    for it in db.get("items", []):
-        it_q = it.get("qhash", {})
-        y_ok = ("Y" in qhash and it_q.get("Y") == qhash.get("Y"))
-        c_ok = ("C" in qhash and it_q.get("C") == qhash.get("C"))
+def attribute_qhash(
+    db: DBLike, qhash: Dict[str, str], meta: Optional[Dict[str, Any]] = None, topk: int = 10
+) -> Dict[str, Any]:
+    """Posterior P(software, quality | Y, C, subsampling, progressive) do DB (ver attribution.py).
 
-        if not (y_ok or c_ok):
-            continue
+    Dict JSON sem LazyDB/ColumnarDB recalcula o modelo a cada chamada; para lotes
+    use LazyDB ou ColumnarDB, que guardam o modelo carregado.
+    """
+    if isinstance(db, LazyDB):
+        db = db.get()
+    with timed("attribution"):
+        if isinstance(db, ColumnarDB):
+            return db.attribution.attribute(qhash, meta, topk=topk)
+        if isinstance(db, SqliteQuantDB):
+            return db.attribute(qhash, meta, topk=topk)
+        return AttributionModel.from_db(db).attribute(qhash, meta, topk=topk)
 
-        if y_ok and c_ok:
-            score = 1.0
-        elif y_ok:
-            score = 0.7
-        else:
-            score = 0.6
-
-        hits.append(
-            MatchHit(
-                software=it.get("software", "?"),
-                quality=it.get("quality"),
-                filename=it.get("filename", "?"),
-                sha256=it.get("sha256", "?"),
-                score=score,
-            )
-        )
 
-    hits.sort(key=lambda x: (-x.score, x.software, (x.quality or 10**9)))
-    hits = hits[:topk]
+def match_embedded(
+    db: DBLike, embedded: List[Dict[str, Any]], topk: int = 10, prefilter: Optional[BloomFilter] = None
+) -> List[Dict[str, Any]]:
+    """Match de cada miniatura/preview embutido (ver extract.embedded_fingerprints).
+
+    "hits"/"groups"/"total_hits": imagens primarias do DB com as mesmas tabelas (a miniatura
+    foi gerada por aquele software). "embedded_hits"/...: itens do DB cuja miniatura tem as
+    mesmas tabelas (ex.: a camera original, mesmo que o editor tenha re-salvo a primaria).
+    Com prefilter (que tem tambem as tabelas das miniaturas do DB), miniaturas negativas
+    saem sem hits e o DB so e aberto se alguma passar.
+    """
+    out = []
+    for e in embedded:
+        if prefilter is not None:
+            with timed("prefilter"):
+                negative = not prefilter.might_match(e["qhash"])
+            if negative:
+                count("prefilter_negative")
+                out.append({
+                    **e, "hits": [], "groups": [], "total_hits": 0,
+                    "embedded_hits": [], "embedded_groups": [], "embedded_total_hits": 0,
+                    "prefilter": "negative",
+                })
+                continue
+        if isinstance(db, LazyDB):
+            db = db.get()
+        primary = match_summary(db, e["qhash"], topk=topk)
+        with timed("match_scan"):
+            thumbs = _summary_items(_embedded_candidates(db, e["qhash"]), e["qhash"], topk)
+        out.append({
+            **e,
+            "hits": [asdict(h) for h in primary.hits],
+            "groups": [asdict(g) for g in primary.groups],
+            "total_hits": primary.total,
+            "embedded_hits": [asdict(h) for h in thumbs.hits],
+            "embedded_groups": [asdict(g) for g in thumbs.groups],
+            "embedded_total_hits": thumbs.total,
+            **({"prefilter": "candidate"} if prefilter is not None else {}),
+        })
+    return out
+
 
-    return {
+def match_against_db(
+    db: DBLike, input_path: Path, topk: int = 10, prefilter: Optional[BloomFilter] = None
+) -> Dict[str, Any]:
+    """Match por igualdade de qhash (Y e/ou C). Scores em match_qhash.
+
+    db pode ser o dict carregado do JSON, um ColumnarDB (colunas NumPy), um
+    SqliteQuantDB (consulta indexada) ou um LazyDB. Com prefilter, inputs cujas
+    tabelas nao existem no DB saem sem hits e sem tocar no DB ("prefilter": "negative").
+
+    "hits" traz os topk arquivos; "groups" agrega todos os hits por
+    (software, quality) com contagem, e "total_hits" conta os itens que casaram.
+    A saida fica limitada por topk mesmo para tabelas muito comuns.
+    "attribution" ranqueia familias de encoder e (software, quality) por
+    probabilidade, usando tambem subsampling/progressive do input.
+    Miniaturas/previews embutidos (EXIF, JFXX, Photoshop, MPF) saem em "embedded", cada um
+    com o proprio match (match_embedded), tambem triado pelo prefilter.
+    """
+    input_path = Path(input_path)
+    with timed("read"):
+        data = input_path.read_bytes()
+    qtables = parse_qtables(data)
+    qhash = qhash_from_tables(qtables)
+    meta = asdict(parse_jpeg_meta(data))
+    embedded = embedded_fingerprints(data)
+    with timed("hash"):
+        sha256 = hashlib.sha256(data).hexdigest()
+
+    res: Dict[str, Any] = {
         "input": {
             "path": str(input_path.resolve()),
-            "sha256": sha256_file(input_path),
+            "sha256": sha256,
             "qhash": qhash,
+            "jpeg_meta": meta,
         },
-        "hits": [h.__dict__ for h in hits],
+    }
+    res.update(match_fingerprint(db, qhash, meta, topk=topk, prefilter=prefilter))
+    if embedded:
+        res["embedded"] = match_embedded(db, embedded, topk=topk, prefilter=prefilter)
+    return res
+
+
+def match_fingerprint(
+    db: DBLike,
+    qhash: Dict[str, str],
+    meta: Optional[Dict[str, Any]] = None,
+    topk: int = 10,
+    prefilter: Optional[BloomFilter] = None,
+) -> Dict[str, Any]:
+    """Parte de match_against_db que so depende do fingerprint (qhash + jpeg_meta).
+
+    Para fontes que nao sao arquivos JPEG soltos (carving, frames MJPEG): o chamador
+    monta o proprio "input" e junta este resultado.
+    """
+    screened_out = False
+    if prefilter is not None:
+        with timed("prefilter"):
+            screened_out = not prefilter.might_match(qhash)
+    if screened_out:
+        count("prefilter_negative")
+        summary = MatchSummary(hits=[], groups=[], total=0)
+        attribution: Dict[str, Any] = {"level": None, "n": 0, "families": [], "posterior": []}
+    else:
+        summary = match_summary(db, qhash, topk=topk)
+        attribution = attribute_qhash(db, qhash, meta, topk=topk)
+
+    res = {
+        "hits": [asdict(h) for h in summary.hits],
+        "groups": [asdict(g) for g in summary.groups],
+        "total_hits": summary.total,
+        "attribution": attribution,
         "notes": [
             "Match baseado em igualdade de tabela de quantizacao (fingerprint forte, mas nao prova absoluta).",
             "Para laudo: documente encoder family, subsampling/progressive, e cadeias de custodia.",
         ],
     }
+    if prefilter is not None:
+        res["prefilter"] = "negative" if screened_out else "candidate"
+    return res
+
+
+def match_paths(
+    db: DBLike, paths: Iterable[Path], topk: int = 10, prefilter: Optional[BloomFilter] = None
+) -> Iterator[Dict[str, Any]]:
+    """Match em lote. Arquivos de conteudo identico sao comparados uma unica vez.
+
+    A duplicata recebe o resultado do canonico com o proprio path e "alias_of". So ficam
+    em memoria os resultados de canonicos cujo tamanho colidiu (os unicos que podem ganhar
+    copias); se um canonico de tamanho unico ganhar copia depois, o match e refeito nela.
+    """
+    idx = DuplicateIndex()
+    done: Dict[Path, Dict[str, Any]] = {}
+    for p in paths:
+        p = Path(p)
+        canon = idx.add(p)
+        if canon is None:
+            res = match_against_db(db, p, topk=topk, prefilter=prefilter)
+            if idx.size_collided(p):
+                done[p] = res
+            yield res
+            continue
+        base = done.get(canon)
+        if base is None:
+            count("dedup_rematch")
+            base = done[canon] = match_against_db(db, p, topk=topk, prefilter=prefilter)  # mesmo conteudo
+        res = dict(base)
+        res["input"] = dict(base["input"], path=str(p.resolve()), alias_of=str(canon.resolve()))
+        yield res
 
 
-def match_db_file(db_json_path: Path, input_path: Path, topk: int = 10) -> Dict[str, Any]:
-    db = load_db_json(db_json_path)
-    return match_against_db(db, input_path=input_path, topk=topk)
+def match_db_file(db_path: Path, input_path: Path, topk: int = 10, use_prefilter: bool = True) -> Dict[str, Any]:
+    """Match de um arquivo contra o DB em disco; usa <db>.bloom quando disponivel."""
+    prefilter = load_prefilter_for_db(db_path) if use_prefilter else None
+    db = LazyDB(db_path)
+    try:
+        return match_against_db(db, input_path=input_path, topk=topk, prefilter=prefilter)
+    finally:
+        db.close()
+        if prefilter is not None:
+            prefilter.close()
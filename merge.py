@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .attribution import AttributionModel
+from .db import SCHEMA_V2, iter_items, load_db_json, pack_item, save_db_json
+from .db_sqlite import SCHEMA, SQLITE_SUFFIXES, SqliteQuantDB, connect_db_sqlite, insert_items, is_sqlite_file
+from .prefilter import prefilter_path, write_prefilter_for_db
+from .profiling import count, timed
+
+
+def _merge_key(it: Dict[str, Any]) -> Tuple[str, str]:
+    return it.get("sha256") or "", it.get("path") or ""
+
+
+def _db_info(path: Path) -> Dict[str, Any]:
+    """dataset_root e shard ("i/n" -> (i, n)) gravados num DB parcial."""
+    if is_sqlite_file(path):
+        with SqliteQuantDB(path) as sdb:
+            meta = dict(sdb.conn.execute("SELECT key, value FROM meta").fetchall())
+        shard = tuple(int(v) for v in meta["shard"].split("/")) if meta.get("shard") else None
+        return {"dataset_root": meta.get("dataset_root"), "shard": shard}
+    db = load_db_json(path)
+    return {"dataset_root": db.get("dataset_root"), "shard": tuple(db["shard"]) if db.get("shard") else None}
+
+
+def iter_sorted_items(path: Path) -> Iterator[Dict[str, Any]]:
+    """Itens v1 (com qtables) de um DB em ordem de (sha256, path).
+
+    SQLite: em streaming, pelo indice de sha256. JSON: o arquivo ja e carregado inteiro,
+    entao os itens sao ordenados em memoria.
+    """
+    path = Path(path)
+    if is_sqlite_file(path):
+        with SqliteQuantDB(path) as sdb:
+            yield from sdb.iter_items(with_tables=True, by_sha256=True)
+        return
+    with timed("merge_sort"):
+        items = sorted(iter_items(load_db_json(path)), key=_merge_key)
+    yield from items
+
+
+def _as_alias(it: Dict[str, Any], canon: Dict[str, Any]) -> Dict[str, Any]:
+    # mesmo formato de db._alias_item: tabelas ficam so no canonico (mesmo qhash)
+    out = {k: v for k, v in it.items() if k != "qtables"}
+    out["alias_of"] = canon["path"]
+    if out.get("embedded"):
+        out["embedded"] = [{k: v for k, v in e.items() if k != "qtables"} for e in out["embedded"]]
+    return out
+
+
+def merge_items(streams: Sequence[Iterable[Dict[str, Any]]], stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """Merge k-way de fluxos ordenados por (sha256, path), com dedup por sha256.
+
+    So um grupo de mesmo sha256 fica em memoria por vez. Dentro do grupo:
+      - registro repetido (mesmo path e sha256, ex.: shards sobrepostos ou DB mesclado de novo) sai uma vez;
+      - o primeiro registro que nao e alias vira o canonico; os demais (copias vindas de outros
+        shards e aliases de canonicos rebaixados) passam a apontar para ele com "alias_of".
+    Itens sem sha256 (DBs legados) passam sem dedup.
+
+    O canonico sai da ordem de path, nao da ordem de varredura como no build-db monolitico:
+    o conjunto de registros e o mesmo, mas quando ha copias o "alias_of" pode apontar para
+    outra copia (de conteudo identico) que a escolhida pelo build monolitico.
+    """
+    stats = stats if stats is not None else {}
+    for k in ("items_in", "items_out", "duplicates", "aliased"):
+        stats.setdefault(k, 0)
+    merged = heapq.merge(*streams, key=_merge_key)
+    for sha, group in itertools.groupby(merged, key=lambda it: it.get("sha256")):
+        if sha is None:
+            for it in group:
+                stats["items_in"] += 1
+                stats["items_out"] += 1
+                yield it
+            continue
+        records: List[Dict[str, Any]] = []
+        seen_paths = set()
+        for it in group:
+            stats["items_in"] += 1
+            if it.get("path") in seen_paths:
+                stats["duplicates"] += 1
+                continue
+            seen_paths.add(it.get("path"))
+            records.append(it)
+        canon = next((it for it in records if not it.get("alias_of")), records[0])
+        canon = {k: v for k, v in canon.items() if k != "alias_of"}
+        yield canon
+        for it in records:
+            if it.get("path") == canon.get("path"):
+                continue
+            if not it.get("alias_of"):
+                stats["aliased"] += 1
+                count("merge_aliased")
+            yield _as_alias(it, canon)
+        stats["items_out"] += len(records)
+
+
+def _replace_db(tmp: Path, out: Path) -> None:
+    for suffix in ("-wal", "-shm"):
+        Path(f"{out}{suffix}").unlink(missing_ok=True)
+    os.replace(tmp, out)
+
+
+def merge_databases(inputs: Sequence[Path], out_path: Path, batch_size: int = 500) -> Dict[str, Any]:
+    """Junta DBs parciais (shards de build-db --shard ou DBs quaisquer, JSON/SQLite) em um DB.
+
+    Merge k-way em streaming (merge_items) e reconstrucao do que depende do conjunto inteiro:
+    modelo de atribuicao, dicionario de tabelas (JSON) ou indices (SQLite: criados depois
+    da carga, num passo so) e o prefiltro <out>.bloom. A saida e escrita num arquivo
+    temporario e trocada no fim. Devolve contagens; "missing_shards" lista os indices
+    que faltam quando as entradas sao shards de um mesmo n.
+    """
+    inputs = [Path(p) for p in inputs]
+    out_path = Path(out_path)
+    if any(p.resolve() == out_path.resolve() for p in inputs):
+        raise ValueError(f"Saida {out_path} tambem e entrada do merge")
+    infos = [_db_info(p) for p in inputs]
+    roots = {i["dataset_root"] for i in infos}
+    shards = [i["shard"] for i in infos if i["shard"]]
+    stats: Dict[str, Any] = {"inputs": len(inputs), "missing_shards": []}
+    if shards and len({n for _, n in shards}) == 1:
+        n = shards[0][1]
+        stats["missing_shards"] = sorted(set(range(n)) - {i for i, _ in shards})
+    dataset_root = roots.pop() if len(roots) == 1 else None
+
+    streams = [iter_sorted_items(p) for p in inputs]
+    merged = merge_items(streams, stats)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if out_path.suffix.lower() in SQLITE_SUFFIXES:
+        tmp.unlink(missing_ok=True)
+        conn = connect_db_sqlite(tmp)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                    [("schema", "qext.quantdb.sqlite.v1"), ("dataset_root", dataset_root)],
+                )
+                # carga sem indices secundarios; recriados de uma vez no fim (SCHEMA e idempotente)
+                for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+                    conn.execute(f"DROP INDEX {name}")
+            with timed("merge_write"):
+                insert_items(conn, merged, batch_size=batch_size)
+            with timed("merge_index"), conn:
+                conn.executescript(SCHEMA)
+                conn.execute("ANALYZE")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        _replace_db(tmp, out_path)
+        stats["prefilter"] = str(write_prefilter_for_db(out_path))
+    else:
+        db: Dict[str, Any] = {"schema": SCHEMA_V2, "dataset_root": dataset_root, "tables": {}, "items": []}
+        model = AttributionModel()
+        with timed("merge_write"):
+            for it in merged:
+                model.add(it)
+                db["items"].append(pack_item(it, db["tables"]))
+        db["attribution"] = model.to_dict()
+        save_db_json(db, tmp)
+        os.replace(tmp, out_path)
+        stats["prefilter"] = str(write_prefilter_for_db(out_path, db))
+    return stats
+
+
+def shard_paths(out_path: Path, n: int, shard_dir: Optional[Path] = None) -> List[Path]:
+    """Nomes dos DBs parciais: <stem>.shard-003-of-008<sufixo>, ao lado da saida (ou em shard_dir)."""
+    out_path = Path(out_path)
+    d = Path(shard_dir) if shard_dir else out_path.parent
+    return [d / f"{out_path.stem}.shard-{i:03d}-of-{n:03d}{out_path.suffix}" for i in range(n)]
+
+
+def _subprocess_env() -> Dict[str, str]:
+    """Ambiente dos subprocessos `python -m <pacote>.cli`: o do coordenador, com o diretorio
+    que expoe o pacote pelo nome no inicio do PYTHONPATH (quando o checkout tem esse nome;
+    senao vale o PYTHONPATH recebido)."""
+    env = dict(os.environ)
+    pkg_dir = Path(__file__).resolve().parent
+    if pkg_dir.name == __package__:
+        paths = [p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p]
+        env["PYTHONPATH"] = os.pathsep.join([str(pkg_dir.parent)] + paths)
+    return env
+
+
+def build_sharded(
+    dataset_dir: Path,
+    out_path: Path,
+    shards: int,
+    jobs: Optional[int] = None,
+    workers: int = 4,
+    dedup: bool = True,
+    shard_dir: Optional[Path] = None,
+    keep_shards: bool = False,
+) -> Dict[str, Any]:
+    """Coordenador local: `qext build-db --shard i/n` para cada shard em subprocessos
+    (ate `jobs` ao mesmo tempo), depois merge_databases dos parciais.
+
+    Cada shard e um processo independente que so precisa do dataset e do diretorio de
+    saida: com um sistema de arquivos compartilhado, os mesmos comandos rodam um por no.
+    Um shard que falha interrompe o build (os parciais ja prontos ficam em disco).
+    Os subprocessos rodam no diretorio dos parciais, com caminhos absolutos e ambiente
+    explicito (_subprocess_env): nao dependem do cwd de quem chamou.
+    """
+    parts = [p.resolve() for p in shard_paths(out_path, shards, shard_dir)]
+    parts[0].parent.mkdir(parents=True, exist_ok=True)
+    dataset_dir = Path(dataset_dir).resolve()
+    env = _subprocess_env()
+    jobs = max(1, jobs or min(shards, os.cpu_count() or 1))
+    todo = list(range(shards))
+    running: Dict[int, subprocess.Popen] = {}
+    t0 = time.perf_counter()
+    with timed("shard_build"):
+        try:
+            while todo or running:
+                while todo and len(running) < jobs:
+                    i = todo.pop(0)
+                    parts[i].unlink(missing_ok=True)
+                    cmd = [
+                        sys.executable, "-m", f"{__package__}.cli", "build-db",
+                        "--dataset", str(dataset_dir), "--out", str(parts[i]),
+                        "--workers", str(workers), "--shard", f"{i}/{shards}",
+                    ] + ([] if dedup else ["--no-dedup"])
+                    running[i] = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, env=env, cwd=parts[i].parent)
+                for i, proc in list(running.items()):
+                    rc = proc.poll()
+                    if rc is None:
+                        continue
+                    del running[i]
+                    if rc != 0:
+                        raise RuntimeError(f"Shard {i}/{shards} falhou (codigo {rc})")
+                if running:
+                    time.sleep(0.05)
+        finally:
+            for proc in running.values():
+                proc.terminate()
+    build_s = time.perf_counter() - t0
+    stats = merge_databases(parts, out_path)
+    stats["shard_build_s"] = round(build_s, 3)
+    if not keep_shards:
+        for p in parts:
+            for f in (p, prefilter_path(p), Path(f"{p}-wal"), Path(f"{p}-shm")):
+                f.unlink(missing_ok=True)
+    return stats
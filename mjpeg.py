@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .carve import MAX_HEADER, carve_jpegs
+from .extract import JPEGMeta, parse_jpeg_header, qhash_from_tables
+from .match import match_fingerprint
+from .profiling import count, timed
+
+# Codecs QuickTime/MP4 cujas amostras sao JPEGs completos (mjpb nao tem marcadores e fica de fora)
+MOV_JPEG_CODECS = frozenset({b"jpeg", b"mjpa", b"AVDJ", b"dmb1"})
+# Atomos conteineres percorridos ate chegar a stbl
+_MOV_CONTAINERS = frozenset({b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts"})
+
+
+@dataclass(slots=True)
+class MJPEGFrame:
+    index: int
+    offset: int  # offset absoluto do JPEG do frame no arquivo
+    length: int
+    qhash: Optional[Dict[str, str]]  # None = frame sem DQT/SOF validos (corrompido)
+    meta: Optional[JPEGMeta]
+
+
+def detect_container(head: bytes) -> str:
+    """"avi", "mov" (QuickTime/MP4) ou "raw" (JPEGs concatenados, ex.: stream HTTP de camera IP)."""
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    if head[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"):
+        return "mov"
+    return "raw"
+
+
+def _avi_chunks(mm: mmap.mmap, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(fourcc, offset dos dados, tamanho) dos chunks RIFF em [start, end); LISTs viram fourcc = tipo."""
+    i = start
+    while i + 8 <= end:
+        fourcc = mm[i : i + 4]
+        size = struct.unpack_from("<I", mm, i + 4)[0]
+        if fourcc in (b"LIST", b"RIFF"):
+            yield mm[i + 8 : i + 12], i + 12, size - 4
+        else:
+            yield fourcc, i + 8, size
+        i += 8 + size + (size & 1)  # chunks alinhados em 2 bytes
+
+
+def iter_avi_frames(mm: mmap.mmap) -> Iterator[Tuple[int, int]]:
+    """(offset, tamanho) dos chunks de video (##dc/##db) das listas movi, inclusive
+    nas extensoes AVIX do OpenDML (AVI > 1 GB) e nas listas 'rec '."""
+    size = len(mm)
+
+    def walk(a: int, b: int, in_movi: bool) -> Iterator[Tuple[int, int]]:
+        for fourcc, data, length in _avi_chunks(mm, a, b):
+            if fourcc in (b"movi", b"rec "):
+                yield from walk(data, min(data + length, size), True)
+            elif in_movi and fourcc[2:4] in (b"dc", b"db") and length > 0:
+                yield data, min(length, size - data)  # ultimo frame de gravacao interrompida
+
+    for kind, off, n in _avi_chunks(mm, 0, size):
+        if kind in (b"AVI ", b"AVIX"):
+            yield from walk(off, min(off + n, size), False)
+
+
+def _mov_atoms(mm: mmap.mmap, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(tipo, offset do corpo, fim) dos atomos em [start, end); trata largesize e size == 0."""
+    i = start
+    while i + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", mm, i)
+        body = i + 8
+        if size == 1:
+            size = struct.unpack_from(">Q", mm, i + 8)[0]
+            body = i + 16
+        elif size == 0:
+            size = end - i
+        if size < body - i:
+            return
+        yield kind, body, min(i + size, end)
+        i += size
+
+
+def _table(mm: mmap.mmap, fmt: str, n: int, off: int, end: int) -> Tuple[int, ...]:
+    """n entradas `fmt` a partir de off, truncadas ao que cabe no atomo: contagem corrompida nao estoura."""
+    n = max(0, min(n, (end - off) // struct.calcsize(">" + fmt)))  # fmt: um codigo so (I/Q)
+    return struct.unpack_from(f">{n}{fmt}", mm, off)
+
+
+def _stbl_samples(mm: mmap.mmap, body: int, end: int) -> Optional[List[Tuple[int, int]]]:
+    """(offset, tamanho) de cada amostra de uma stbl de video JPEG; None se o codec nao e JPEG.
+
+    As contagens das tabelas vem do arquivo: sao limitadas ao tamanho de cada atomo e as
+    amostras param no fim do arquivo, entao uma stbl corrompida da uma lista parcial.
+    """
+    atoms = {kind: (b, e) for kind, b, e in _mov_atoms(mm, body, end)}
+    if b"stsd" not in atoms or b"stsz" not in atoms or b"stsc" not in atoms:
+        return None
+    sd, sd_end = atoms[b"stsd"]
+    if sd + 16 > sd_end or struct.unpack_from(">I", mm, sd + 4)[0] < 1 or mm[sd + 12 : sd + 16] not in MOV_JPEG_CODECS:
+        return None
+
+    sz, sz_end = atoms[b"stsz"]
+    if sz + 12 > sz_end:
+        return None
+    fixed, n = struct.unpack_from(">II", mm, sz + 4)
+    sizes = None if fixed else _table(mm, "I", n, sz + 12, sz_end)
+    if sizes is not None:
+        n = len(sizes)
+
+    for kind, fmt in ((b"stco", "I"), (b"co64", "Q")):
+        if kind in atoms:
+            co, co_end = atoms[kind]
+            if co + 8 > co_end:
+                return None
+            chunk_offsets = _table(mm, fmt, struct.unpack_from(">I", mm, co + 4)[0], co + 8, co_end)
+            break
+    else:
+        return None
+
+    # stsc: (primeiro chunk, amostras por chunk, descricao), valido ate a proxima entrada
+    sc, sc_end = atoms[b"stsc"]
+    if sc + 8 > sc_end:
+        return None
+    flat = _table(mm, "I", 3 * struct.unpack_from(">I", mm, sc + 4)[0], sc + 8, sc_end)
+    runs = [(flat[k], flat[k + 1]) for k in range(0, len(flat) - 2, 3)]
+    out: List[Tuple[int, int]] = []
+    s = 0
+    for k, (first, per_chunk) in enumerate(runs):
+        last = runs[k + 1][0] - 1 if k + 1 < len(runs) else len(chunk_offsets)
+        for c in range(max(first, 1) - 1, min(last, len(chunk_offsets))):
+            off = chunk_offsets[c]
+            for _ in range(per_chunk):
+                if s >= n:
+                    return out
+                if off >= len(mm):
+                    break
+                size = fixed or sizes[s]
+                out.append((off, size))
+                off += size
+                s += 1
+    return out
+
+
+def iter_mov_frames(mm: mmap.mmap) -> Iterator[Tuple[int, int]]:
+    """(offset, tamanho) das amostras das trilhas de video JPEG (jpeg/mjpa) de um QuickTime/MP4,
+    pela tabela de amostras (stsz/stsc/stco|co64): sem varrer o mdat."""
+    def walk(a: int, b: int) -> Iterator[Tuple[int, int]]:
+        for kind, body, end in _mov_atoms(mm, a, b):
+            if kind == b"stbl":
+                yield from _stbl_samples(mm, body, end) or ()
+            elif kind in _MOV_CONTAINERS:
+                yield from walk(body, end)
+
+    return walk(0, len(mm))
+
+
+def read_mjpeg_frames(path: Path) -> Iterator[MJPEGFrame]:
+    """Fingerprint de cada frame de um video MJPEG direto do conteiner, sem decodificar pixels.
+
+    AVI (RIFF/OpenDML) e QuickTime/MP4 sao percorridos pelos chunks/tabela de amostras;
+    qualquer outra coisa e tratada como stream de JPEGs concatenados (carving).
+    Cada frame so tem o cabecalho (DQT/SOF, via mmap) lido.
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        container = detect_container(f.read(12))
+    if container == "raw":
+        for k, c in enumerate(carve_jpegs(path, hash_carved=False)):
+            yield MJPEGFrame(index=k, offset=c.offset, length=c.length or 0, qhash=c.qhash, meta=c.meta)
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            frames = iter_avi_frames(mm) if container == "avi" else iter_mov_frames(mm)
+            for k, (off, length) in enumerate(frames):
+                with timed("header_parse"):
+                    hdr = parse_jpeg_header(view, off, off + min(length, MAX_HEADER), embedded=False)
+                count("mjpeg_frames")
+                if hdr is None:
+                    count("mjpeg_bad_frames")
+                    yield MJPEGFrame(index=k, offset=off, length=length, qhash=None, meta=None)
+                else:
+                    yield MJPEGFrame(index=k, offset=off, length=length, qhash=qhash_from_tables(hdr.qtables), meta=hdr.meta)
+        finally:
+            view.release()
+
+
+def _fingerprint(fr: MJPEGFrame) -> Optional[Tuple[Any, ...]]:
+    if fr.qhash is None:
+        return None
+    return fr.qhash.get("Y"), fr.qhash.get("C"), fr.meta.subsampling, fr.meta.progressive, fr.meta.width, fr.meta.height
+
+
+def table_segments(frames: Iterator[MJPEGFrame], errors: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Agrupa frames consecutivos com o mesmo fingerprint (tabelas + subsampling/progressive/dimensoes).
+
+    Um stream de um unico encoder da um segmento so; cada fronteira entre segmentos e uma
+    troca de tabela no meio do video (re-encode ou emenda). Frames sem cabecalho valido
+    nao abrem segmento (nao sao troca de tabela): vao para `errors` ({"frame", "offset"}),
+    se dada, e o segmento em curso continua depois deles ("frames" conta so os validos).
+    """
+    segments: List[Dict[str, Any]] = []
+    prev: Any = object()
+    for fr in frames:
+        key = _fingerprint(fr)
+        if key is None:
+            if errors is not None:
+                errors.append({"frame": fr.index, "offset": fr.offset})
+            continue
+        if key != prev:
+            segments.append({
+                "first_frame": fr.index,
+                "last_frame": fr.index,
+                "frames": 0,
+                "offset": fr.offset,
+                "qhash": fr.qhash,
+                "jpeg_meta": asdict(fr.meta),
+            })
+            prev = key
+        seg = segments[-1]
+        seg["last_frame"] = fr.index
+        seg["frames"] += 1
+    return segments
+
+
+def match_mjpeg(db: Any, path: Path, topk: int = 10, prefilter: Any = None) -> Dict[str, Any]:
+    """Match de um video MJPEG: um resultado por segmento de tabela, nao por frame.
+
+    Cada fingerprint distinto consulta o DB uma unica vez (match_fingerprint), entao um
+    video de 100k frames com tabela fixa custa um match. "table_changes" lista os frames
+    em que a tabela muda; com db None so os segmentos sao devolvidos. Frames corrompidos
+    ficam em "errors" (indice e offset), fora dos segmentos. Sem nenhum frame JPEG valido
+    (ex.: video de outro codec) o resultado traz "error": "no JPEG samples".
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        container = detect_container(f.read(12))
+    errors: List[Dict[str, Any]] = []
+    segments = table_segments(read_mjpeg_frames(path), errors)
+    cache: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    if db is not None:
+        for seg in segments:
+            meta = seg["jpeg_meta"]
+            key = (seg["qhash"].get("Y"), seg["qhash"].get("C"), meta["subsampling"], meta["progressive"])
+            if key not in cache:
+                cache[key] = match_fingerprint(db, seg["qhash"], meta, topk=topk, prefilter=prefilter)
+            seg["match"] = cache[key]
+    fingerprints = {(s["qhash"].get("Y"), s["qhash"].get("C")) for s in segments}
+    res: Dict[str, Any] = {
+        "input": {
+            "path": str(path.resolve()),
+            "container": container,
+            "frames": sum(s["frames"] for s in segments) + len(errors),
+            "distinct_fingerprints": len(fingerprints),
+        },
+        "segments": segments,
+        "table_changes": [s["first_frame"] for s in segments[1:]],
+        "errors": errors,
+    }
+    if not segments:
+        # ex.: MP4 H.264: o conteiner abriu, mas nenhuma trilha tem amostras JPEG
+        res["error"] = "no JPEG samples"
+    return res
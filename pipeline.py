@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from dataclasses import asdict
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Set
+
+from tqdm import tqdm
+
+from .extract import JPEGMeta, embedded_fingerprints, parse_jpeg_meta, parse_qtables, qhash_from_tables
+from .profiling import count, timed
+from .scan import IMAGE_MAGICS, scan_files
+from .utils import imap_bounded
+
+
+DEFAULT_STAGES = ("dqt", "ela", "dft")
+# estagios que so leem o header: continuam rodando em quase-duplicatas
+HEADER_STAGES = ("dqt",)
+
+
+class AnalysisContext:
+    """Estado compartilhado entre os estagios de UM arquivo.
+
+    O arquivo e lido uma unica vez; header (DQT/SOF) e pixels sao decodificados
+    sob demanda e reaproveitados por todos os estagios.
+    """
+
+    def __init__(self, path: Path, options: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.options: Dict[str, Any] = options or {}
+        with timed("read"):
+            self.data = self.path.read_bytes()
+
+    @cached_property
+    def is_jpeg(self) -> bool:
+        return self.data[:2] == b"\xFF\xD8"
+
+    @cached_property
+    def meta(self) -> JPEGMeta:
+        return parse_jpeg_meta(self.data)
+
+    @cached_property
+    def qtables(self) -> Dict[str, Any]:
+        return parse_qtables(self.data) if self.is_jpeg else {}
+
+    @cached_property
+    def pixels(self):
+        """Pixels BGR (OpenCV) decodificados a partir dos bytes ja lidos."""
+        import cv2
+        import numpy as np
+
+        with timed("decode"):
+            img = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Nao foi possivel decodificar: {self.path}")
+        return img
+
+    @cached_property
+    def luma(self):
+        """Plano Y decodificado direto do JPEG (sem passar por BGR), para analises no dominio DCT."""
+        import cv2
+        import numpy as np
+
+        with timed("decode"):
+            img = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Nao foi possivel decodificar: {self.path}")
+        return img
+
+    @cached_property
+    def gray(self):
+        import cv2
+
+        return cv2.cvtColor(self.pixels, cv2.COLOR_BGR2GRAY)
+
+
+def stage_dqt(ctx: AnalysisContext) -> Dict[str, Any]:
+    qtables = ctx.qtables
+    res = {
+        "qtables": qtables,
+        "qhash": qhash_from_tables(qtables),
+        "jpeg_meta": asdict(ctx.meta),
+    }
+    embedded = embedded_fingerprints(ctx.data) if ctx.is_jpeg else []
+    if embedded:
+        res["embedded"] = embedded
+    return res
+
+
+def stage_ela(ctx: AnalysisContext) -> Dict[str, Any]:
+    from .deepfake_module.analysis_ela import ForensicELA
+
+    quality = int(ctx.options.get("ela_quality", 95))
+    max_tile_mb = ctx.options.get("max_tile_mb")
+    ela = ForensicELA(quality=quality)
+    if max_tile_mb:
+        # mesmo resultado, mas sem as copias de tamanho cheio (resaved/diff) da versao direta
+        ela_image, max_diff = ela.ela_tiled(ctx.pixels, max_tile_mb=float(max_tile_mb))
+    else:
+        ela_image, max_diff = ela.ela_from_array(ctx.pixels)
+    max_diff = float(max_diff)
+    # ela_image esta escalado para 0-255; desfaz a escala para reportar o nivel medio real
+    mean_diff = float(ela_image.mean()) * max_diff / 255.0 if max_diff else 0.0
+    return {"quality": quality, "max_diff": max_diff, "mean_diff": round(mean_diff, 4)}
+
+
+def stage_dft(ctx: AnalysisContext) -> Dict[str, Any]:
+    from .deepfake_module.analysis_frequency import ForensicFrequency
+
+    bins = int(ctx.options.get("dft_bins", 32))
+    max_tile_mb = ctx.options.get("max_tile_mb")
+    freq = ForensicFrequency()
+    if max_tile_mb:
+        # espectro por tile com janela de Hann: memoria limitada a um tile
+        feats = freq.tiled_features(ctx.gray, bins=bins, max_tile_mb=float(max_tile_mb))
+        profile = feats["mean_profile"]
+    else:
+        profile = freq.radial_profile(freq.magnitude_spectrum(ctx.gray), bins=bins)
+    mean = float(profile.mean()) or 1.0
+    res = {
+        "radial_profile": [round(float(v), 4) for v in profile],
+        "high_freq_ratio": round(float(profile[bins // 2 :].mean()) / mean, 6),
+    }
+    if max_tile_mb:
+        res["tiles"] = {
+            "tile": feats["tile"],
+            "step": feats["step"],
+            "high_freq_ratio": [[round(float(v), 4) for v in row] for row in feats["high_freq_ratio"]],
+        }
+    return res
+
+
+def stage_djpeg(ctx: AnalysisContext) -> Dict[str, Any]:
+    from .deepfake_module.analysis_double_jpeg import ForensicDoubleJPEG
+
+    if not ctx.is_jpeg or "Y" not in ctx.qtables:
+        return {"double_compressed": None, "reason": "sem tabela de quantizacao Y (nao e JPEG)"}
+    return ForensicDoubleJPEG().analyze_array(ctx.luma, ctx.qtables["Y"])
+
+
+def stage_blockiness(ctx: AnalysisContext) -> Dict[str, Any]:
+    from .deepfake_module.analysis_blockiness import ForensicBlockiness
+
+    # ctx.gray vem do mesmo decode BGR usado pelo ELA (ctx.pixels)
+    res = ForensicBlockiness().analyze_array(ctx.gray)
+    res.pop("block_map")  # (H/8, W/8): grande demais para o JSONL; resumido nas estatisticas
+    res["tile_map"] = res["tile_map"].tolist()
+    return res
+
+
+def stage_copymove(ctx: AnalysisContext) -> Dict[str, Any]:
+    from .deepfake_module.analysis_copymove import ForensicCopyMove
+
+    res = ForensicCopyMove().analyze_array(ctx.gray)
+    res.pop("mask")  # mascara do tamanho da imagem: resumida em "shifts" e "matched_fraction"
+    res["shifts"] = res["shifts"][:10]
+    return res
+
+
+_FACE_DETECTORS = threading.local()
+
+
+def _face_detector(options: Dict[str, Any]):
+    """Um detector por thread (os modelos do OpenCV nao sao thread-safe), carregado uma vez."""
+    from .deepfake_module.face_detector import ForensicFaceDetector
+
+    key = (options.get("face_model"), options.get("face_config"))
+    cache = getattr(_FACE_DETECTORS, "cache", None)
+    if cache is None:
+        cache = _FACE_DETECTORS.cache = {}
+    if key not in cache:
+        cache[key] = ForensicFaceDetector(model_path=key[0], config_path=key[1])
+    return cache[key]
+
+
+def stage_face(ctx: AnalysisContext) -> Dict[str, Any]:
+    # ELA/DFT/blockiness so nos recortes de rosto (margem fixa, alinhados a grade 8x8)
+    det = _face_detector(ctx.options)
+    faces = det.detect(ctx.pixels)
+    return {"backend": det.backend, "faces": det.analyze_faces(ctx.pixels, faces)}
+
+
+# Registro de estagios: nome -> funcao(ctx) -> dict serializavel.
+STAGES: Dict[str, Callable[[AnalysisContext], Dict[str, Any]]] = {
+    "dqt": stage_dqt,
+    "ela": stage_ela,
+    "dft": stage_dft,
+    "djpeg": stage_djpeg,
+    "blockiness": stage_blockiness,
+    "copymove": stage_copymove,
+    "face": stage_face,
+}
+
+
+def resolve_stages(stages: Sequence[str]) -> tuple[str, ...]:
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Estagio(s) desconhecido(s): {', '.join(unknown)} (disponiveis: {', '.join(STAGES)})")
+    return tuple(stages)
+
+
+def analyze_file(
+    path: Path,
+    stages: Sequence[str] = DEFAULT_STAGES,
+    options: Optional[Dict[str, Any]] = None,
+    near_dup: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """Roda os estagios sobre um arquivo e devolve um registro JSON unico.
+
+    Falhas de um estagio ficam em "errors" e nao impedem os demais.
+    Com `near_dup` (NearDuplicateIndex), o pHash do arquivo vai no registro; se ele
+    for quase-duplicata de um representativo ja visto, so os HEADER_STAGES rodam
+    e o registro aponta o representativo em "near_duplicate_of".
+    """
+    path = Path(path)
+    rec: Dict[str, Any] = {"path": str(path.resolve()), "stages": {}, "errors": {}}
+    try:
+        ctx = AnalysisContext(path, options)
+    except OSError as e:
+        rec["errors"]["read"] = f"{type(e).__name__}: {e}"
+        return rec
+
+    with timed("hash"):
+        rec["sha256"] = hashlib.sha256(ctx.data).hexdigest()
+    rec["size"] = len(ctx.data)
+    count("files")
+    if near_dup is not None:
+        try:
+            with timed("phash"):
+                h = near_dup.hash(ctx.gray)  # mesmo decode que ELA/DFT reaproveitam
+            rec["phash"] = f"{h:016x}"
+            match = near_dup.add(rec["path"], h=h)
+        except Exception as e:
+            rec["errors"]["phash"] = f"{type(e).__name__}: {e}"
+            match = None
+        if match:
+            rec["near_duplicate_of"], rec["hamming"] = match
+            count("near_duplicates")
+            stages = [s for s in stages if s in HEADER_STAGES]
+    for name in stages:
+        try:
+            with timed(f"stage:{name}"):
+                rec["stages"][name] = STAGES[name](ctx)
+        except Exception as e:
+            rec["errors"][name] = f"{type(e).__name__}: {e}"
+    return rec
+
+
+def iter_input_files(input_path: Path) -> Iterator[Path]:
+    """Arquivo unico ou varredura recursiva em streaming (JPEG/PNG detectados pelo conteudo)."""
+    return scan_files(Path(input_path), magics=IMAGE_MAGICS)
+
+
+def load_checkpoint(out_path: Path) -> Set[str]:
+    """Le um JSONL de resultados e devolve os paths ja concluidos.
+
+    Linhas truncadas (processo interrompido no meio da escrita) sao ignoradas.
+    """
+    out_path = Path(out_path)
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["path"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+def seed_near_duplicates(out_path: Path, near_dup: Any) -> int:
+    """Recoloca no indice os representativos ja gravados no JSONL (retomada com --near-dup)."""
+    out_path = Path(out_path)
+    n = 0
+    if not out_path.exists():
+        return n
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and rec.get("phash") and not rec.get("near_duplicate_of"):
+                near_dup.add(rec["path"], h=int(rec["phash"], 16))
+                n += 1
+    return n
+
+
+def run_analysis(
+    input_path: Path,
+    out_path: Path,
+    stages: Sequence[str] = DEFAULT_STAGES,
+    workers: int = 4,
+    resume: bool = True,
+    options: Optional[Dict[str, Any]] = None,
+) -> Dict[str, int]:
+    """Analisa um arquivo ou diretorio inteiro e grava um registro JSON por linha.
+
+    O proprio JSONL de saida e o checkpoint: com resume=True os arquivos ja
+    presentes nele sao pulados, entao uma execucao interrompida pode ser retomada.
+
+    options["near_dup_radius"] liga o agrupamento de quase-duplicatas (pHash,
+    distancia de Hamming <= raio): so o primeiro arquivo de cada grupo passa
+    pelos estagios de pixels. Com varias threads, qual arquivo do grupo chega
+    primeiro (e vira representativo) depende da ordem de conclusao.
+    """
+    stages = resolve_stages(stages)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    done = load_checkpoint(out_path) if resume else set()
+    todo = (p for p in iter_input_files(input_path) if str(p.resolve()) not in done)
+
+    mode = "a" if resume else "w"
+    if mode == "a" and out_path.exists() and out_path.stat().st_size:
+        with open(out_path, "rb") as f:
+            f.seek(-1, 2)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    near_dup = None
+    if options and options.get("near_dup_radius") is not None:
+        from .deepfake_module.perceptual_hash import NearDuplicateIndex
+
+        near_dup = NearDuplicateIndex(radius=int(options["near_dup_radius"]))
+        if resume:
+            seed_near_duplicates(out_path, near_dup)
+
+    stats = {"analyzed": 0, "with_errors": 0, "skipped": len(done), "near_duplicates": 0}
+    with open(out_path, mode, encoding="utf-8") as f:
+        if needs_newline:
+            f.write("\n")
+        results = imap_bounded(lambda p: analyze_file(p, stages, options, near_dup), todo, workers=workers)
+        for rec in tqdm(results, desc="[analyze]", unit="file"):
+            with timed("json_serialize"):
+                line = json.dumps(rec, ensure_ascii=False)
+            f.write(line + "\n")
+            f.flush()
+            stats["analyzed"] += 1
+            if rec.get("near_duplicate_of"):
+                stats["near_duplicates"] += 1
+            if rec["errors"]:
+                stats["with_errors"] += 1
+    return stats
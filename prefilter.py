@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+from .db_sqlite import SqliteQuantDB, is_sqlite_file, open_db
+
+
+MAGIC = b"QXBLOOM1"
+# magic, m (bits), k (hashes), n (itens), tamanho do carimbo da fonte
+_HEADER = struct.Struct("<8sQIQH")
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre qhashes (SHA-256 hex) de tabelas de quantizacao.
+
+    Como o qhash ja e um hash uniforme, as k posicoes saem direto dele
+    (enhanced double hashing sobre os 128 primeiros bits), sem hashear de novo.
+    Falso negativo nao existe: "nao esta" e definitivo.
+    """
+
+    def __init__(self, m_bits: int, k: int, bits: Union[bytearray, memoryview, None] = None, n: int = 0, stamp: str = ""):
+        self.m = int(m_bits)
+        self.k = int(k)
+        self.n = n
+        self.stamp = stamp
+        self.bits = bits if bits is not None else bytearray((self.m + 7) // 8)
+        self._mmap: Optional[mmap.mmap] = None
+
+    @classmethod
+    def for_capacity(cls, n: int, fp_rate: float = 1e-4) -> "BloomFilter":
+        n = max(int(n), 1)
+        # piso de 1024 bits: com m muito pequeno o double hashing fica correlacionado
+        m = max(1024, math.ceil(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+        k = max(1, min(round(m / n * math.log(2)), math.ceil(-math.log2(fp_rate))))
+        return cls(m, k)
+
+    def _positions(self, qhash_hex: str) -> Iterable[int]:
+        h1 = int(qhash_hex[0:16], 16)
+        h2 = int(qhash_hex[16:32], 16) | 1
+        m = self.m
+        # enhanced double hashing (Dillinger & Manolios): termo cubico evita posicoes repetidas
+        return ((h1 + i * h2 + (i * i * i - i) // 6) % m for i in range(self.k))
+
+    def add(self, qhash_hex: str) -> None:
+        for pos in self._positions(qhash_hex):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.n += 1
+
+    def __contains__(self, qhash_hex: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(qhash_hex):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def might_match(self, qhash: Dict[str, str]) -> bool:
+        """True se algum dos hashes (Y/C) do input pode estar no DB."""
+        return any(h in self for h in qhash.values())
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        stamp = self.stamp.encode("utf-8")
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, self.m, self.k, self.n, len(stamp)))
+            f.write(stamp)
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path, use_mmap: bool = True) -> "BloomFilter":
+        """Carrega o filtro; com use_mmap=True o vetor de bits fica mapeado (sem copiar)."""
+        with open(path, "rb") as f:
+            if use_mmap:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                buf: Union[mmap.mmap, bytes] = mm
+            else:
+                mm = None
+                buf = f.read()
+        magic, m, k, n, slen = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Arquivo nao e um filtro qext: {path}")
+        start = _HEADER.size + slen
+        stamp = bytes(buf[_HEADER.size : start]).decode("utf-8")
+        bits = memoryview(buf)[start : start + (m + 7) // 8]
+        bf = cls(m, k, bits=bits, n=n, stamp=stamp)
+        bf._mmap = mm
+        return bf
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self.bits.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+def prefilter_path(db_path: Path) -> Path:
+    """O filtro fica ao lado do DB: quant_db.json -> quant_db.json.bloom."""
+    db_path = Path(db_path)
+    return db_path.with_name(db_path.name + ".bloom")
+
+
+def _source_stamp(db_path: Path) -> str:
+    """Identifica a versao do DB de origem, para nao usar um filtro desatualizado.
+
+    JSON: tamanho+mtime do arquivo. SQLite: geracao gravada em meta a cada insercao
+    (insert_items; um DB refeito ganha outra) mais contagem/maior id de itens e contagem de
+    tabelas, para edicoes feitas fora do qext. Escritas em WAL nem sempre mudam o mtime.
+    """
+    db_path = Path(db_path)
+    if is_sqlite_file(db_path):
+        with SqliteQuantDB(db_path) as sdb:
+            gen = sdb.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            n_items, last_id = sdb.conn.execute("SELECT COUNT(*), MAX(id) FROM items").fetchone()
+            n_tables = sdb.conn.execute("SELECT COUNT(*) FROM qtables").fetchone()[0]
+        return f"sqlite:gen={gen[0] if gen else ''}:items={n_items}:{last_id}:qtables={n_tables}"
+    st = os.stat(db_path)
+    return f"json:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _iter_db_hashes(db: Union[Dict[str, Any], SqliteQuantDB]) -> Iterable[str]:
+    if isinstance(db, SqliteQuantDB):
+        return (row[0] for row in db.conn.execute("SELECT hash FROM qtables"))
+    if "tables" in db:
+        return db["tables"].keys()
+    return {
+        h for it in db.get("items", []) for rec in (it, *it.get("embedded", ())) for h in (rec.get("qhash") or {}).values()
+    }
+
+
+def build_prefilter(db: Union[Dict[str, Any], SqliteQuantDB], fp_rate: float = 1e-4) -> BloomFilter:
+    """Filtro com todos os hashes Y e C do DB (dimensionado pelo numero de tabelas distintas)."""
+    hashes = list(_iter_db_hashes(db))
+    bf = BloomFilter.for_capacity(len(hashes), fp_rate=fp_rate)
+    for h in hashes:
+        bf.add(h)
+    return bf
+
+
+def write_prefilter_for_db(db_path: Path, db: Union[Dict[str, Any], SqliteQuantDB, None] = None, fp_rate: float = 1e-4) -> Path:
+    """Gera e grava <db>.bloom. Se db (ja em memoria) nao vier, o DB e aberto do disco."""
+    db_path = Path(db_path)
+    own = db is None
+    if own:
+        db = open_db(db_path)
+    try:
+        bf = build_prefilter(db, fp_rate=fp_rate)
+    finally:
+        if own and isinstance(db, SqliteQuantDB):
+            db.close()
+    bf.stamp = _source_stamp(db_path)
+    out = prefilter_path(db_path)
+    bf.save(out)
+    return out
+
+
+def load_prefilter_for_db(db_path: Path) -> Optional[BloomFilter]:
+    """Abre (mmap) o filtro do DB; None se nao existir ou se estiver desatualizado."""
+    path = prefilter_path(db_path)
+    if not path.exists():
+        return None
+    bf = BloomFilter.load(path)
+    if bf.stamp != _source_stamp(db_path):
+        bf.close()
+        return None
+    return bf
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+
+class Profiler:
+    """Acumula tempo e numero de chamadas por estagio (thread-safe).
+
+    Opcionalmente guarda cada span como evento "X" do formato Chrome Trace
+    (abrir em chrome://tracing ou https://ui.perfetto.dev).
+    """
+
+    def __init__(self, trace: bool = False):
+        self._lock = threading.Lock()
+        self._t0 = perf_counter()
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.events: Optional[List[Dict[str, Any]]] = [] if trace else None
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            end = perf_counter()
+            with self._lock:
+                self.totals[name] += end - start
+                self.calls[name] += 1
+                if self.events is not None:
+                    self.events.append(
+                        {
+                            "name": name,
+                            "ph": "X",
+                            "ts": (start - self._t0) * 1e6,
+                            "dur": (end - start) * 1e6,
+                            "pid": os.getpid(),
+                            "tid": threading.get_ident(),
+                        }
+                    )
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def report(self) -> str:
+        """Tabela por estagio: chamadas, tempo total, media e % do tempo de parede.
+
+        Com workers>1 os estagios rodam em paralelo, entao a soma pode passar de 100%.
+        """
+        wall = perf_counter() - self._t0
+        lines = [f"{'estagio':<16} {'chamadas':>9} {'total_s':>10} {'media_ms':>10} {'%wall':>7}"]
+        for name, total in sorted(self.totals.items(), key=lambda kv: -kv[1]):
+            n = self.calls[name]
+            lines.append(f"{name:<16} {n:>9} {total:>10.3f} {1000 * total / n:>10.3f} {100 * total / wall:>6.1f}%")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:<16} {n:>9}")
+        lines.append(f"{'wall':<16} {'':>9} {wall:>10.3f}")
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": self.events or [], "displayTimeUnit": "ms"}), encoding="utf-8")
+
+
+# Profiler global; None = desligado. Com None, timed() devolve um contexto nulo
+# pre-alocado, entao o custo da instrumentacao desligada e um teste de None.
+_active: Optional[Profiler] = None
+_NULL = nullcontext()
+
+
+def enable(trace: bool = False) -> Profiler:
+    global _active
+    _active = Profiler(trace=trace)
+    return _active
+
+
+def disable() -> Optional[Profiler]:
+    global _active
+    prof, _active = _active, None
+    return prof
+
+
+def active() -> Optional[Profiler]:
+    return _active
+
+
+def timed(name: str) -> ContextManager[None]:
+    """Mede o bloco sob o nome do estagio: `with timed("hash"): ...`."""
+    if _active is None:
+        return _NULL
+    return _active.span(name)
+
+
+def count(name: str, n: int = 1) -> None:
+    if _active is not None:
+        _active.count(name, n)
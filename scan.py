@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+# Sem imports relativos de proposito: scripts/extrator_dqt_categorico.py importa
+# este modulo direto da raiz do repositorio.
+
+import os
+from pathlib import Path
+from typing import Iterator, Sequence
+
+JPEG_MAGIC = b"\xFF\xD8\xFF"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+IMAGE_MAGICS = (JPEG_MAGIC, PNG_MAGIC)
+
+
+def has_magic(path: Path, magics: Sequence[bytes] = (JPEG_MAGIC,)) -> bool:
+    """Confere a assinatura do arquivo (independe de extensao/maiusculas)."""
+    n = max(len(m) for m in magics)
+    try:
+        with open(path, "rb") as f:
+            head = f.read(n)
+    except OSError:
+        return False
+    return any(head.startswith(m) for m in magics)
+
+
+def iter_tree(root: Path, recursive: bool = True) -> Iterator[os.DirEntry]:
+    """Percorre a arvore com os.scandir, em streaming (sem listar/ordenar tudo antes).
+
+    Usa uma pilha explicita (sem recursao) e nao segue symlinks de diretorio.
+    Diretorios ilegiveis sao ignorados.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            subdirs = []
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+                except OSError:
+                    continue
+        if recursive:
+            # ordem reversa na pilha = subdiretorios visitados na ordem em que apareceram
+            stack.extend(reversed(subdirs))
+
+
+def scan_files(
+    root: Path,
+    recursive: bool = True,
+    magics: Sequence[bytes] = (JPEG_MAGIC,),
+    by_magic: bool = True,
+    suffixes: Sequence[str] = (".jpg", ".jpeg", ".jpe", ".jfif"),
+) -> Iterator[Path]:
+    """Gera os arquivos de imagem sob root (ou o proprio root, se for arquivo).
+
+    by_magic=True detecta pelo conteudo (le alguns bytes de cada arquivo);
+    by_magic=False filtra so pela extensao, sem abrir os arquivos.
+    """
+    root = Path(root)
+    if root.is_file():
+        yield root
+        return
+    sfx = {s.lower() for s in suffixes}
+    for entry in iter_tree(root, recursive=recursive):
+        if by_magic:
+            if has_magic(Path(entry.path), magics):
+                yield Path(entry.path)
+        elif os.path.splitext(entry.name)[1].lower() in sfx:
+            yield Path(entry.path)
+
+
+def scan_jpegs(root: Path, recursive: bool = True, by_magic: bool = True) -> Iterator[Path]:
+    return scan_files(root, recursive=recursive, magics=(JPEG_MAGIC,), by_magic=by_magic)
+
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Benchmark de memoria e latencia de match: DB em dicts (v1/v2) vs ColumnarDB.
+
+Uso:
+    python scripts/bench_memoria_db.py --items 200000
+    python scripts/bench_memoria_db.py --db output/quant_db.json
+
+Sem --db, gera itens sinteticos (softwares x qualidades x tabelas) no formato
+do build-db. A memoria e medida com tracemalloc (bytes alocados pela estrutura).
+"""
+import argparse
+import gc
+import hashlib
+import importlib
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+try:
+    qext = importlib.import_module("quantization_extend")
+except ImportError:
+    # rodando do checkout: o pacote e a propria raiz do repositorio
+    sys.path.append(str(ROOT.parent))
+    qext = importlib.import_module(ROOT.name)
+
+columnar = importlib.import_module(qext.__name__ + ".columnar")
+dbmod = importlib.import_module(qext.__name__ + ".db")
+extract = importlib.import_module(qext.__name__ + ".extract")
+match = importlib.import_module(qext.__name__ + ".match")
+
+
+def itens_sinteticos(n, n_softwares=12, n_tabelas=2000, seed=0):
+    """Itens v1 (com qtables 8x8 proprias, como saem do JSON v1)."""
+    rnd = random.Random(seed)
+    tabelas = []
+    for _ in range(n_tabelas):
+        t = [rnd.randint(1, 255) for _ in range(64)]
+        tabelas.append((t, hashlib.sha256(",".join(map(str, t)).encode()).hexdigest()))
+    softwares = [f"software_{i:02d}" for i in range(n_softwares)]
+    for i in range(n):
+        sw = rnd.choice(softwares)
+        q = rnd.randint(1, 100)
+        (ty, hy), (tc, hc) = rnd.choice(tabelas), rnd.choice(tabelas)
+        yield {
+            "software": sw,
+            "filename": f"{q}.jpg",
+            "path": f"/dataset/{sw}/lote_{i // 1000:05d}/{q}_{i}.jpg",
+            "sha256": hashlib.sha256(str(i).encode()).hexdigest(),
+            "quality": q,
+            "qtables": {"Y": [ty[r * 8 : r * 8 + 8] for r in range(8)], "Cb": [tc[r * 8 : r * 8 + 8] for r in range(8)],
+                        "Cr": [tc[r * 8 : r * 8 + 8] for r in range(8)]},
+            "qhash": {"Y": hy, "C": hc},
+            "jpeg_meta": {"progressive": False, "subsampling": "420", "width": 1920, "height": 1080},
+        }
+
+
+def medir(construir):
+    """Retorna (objeto, bytes que continuam alocados, segundos) para construir().
+
+    Constroi duas vezes: o tempo e medido sem tracemalloc (que deixa tudo ~10x mais lento).
+    """
+    t0 = time.perf_counter()
+    construir()
+    dt = time.perf_counter() - t0
+    gc.collect()
+    tracemalloc.start()
+    obj = construir()
+    atual, _pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, atual, dt
+
+
+def latencia_match(db, consultas, topk=10):
+    t0 = time.perf_counter()
+    for q in consultas:
+        match.match_qhash(db, q, topk=topk)
+    return (time.perf_counter() - t0) / len(consultas)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Memoria/latencia: dict v1, dict v2 e ColumnarDB")
+    ap.add_argument("--items", type=int, default=100000, help="Itens sinteticos (ignorado com --db)")
+    ap.add_argument("--db", help="DB JSON real (v1/v2/legado) em vez de dados sinteticos")
+    ap.add_argument("--queries", type=int, default=50, help="Consultas de match por representacao")
+    args = ap.parse_args()
+
+    # as tres representacoes partem do mesmo texto JSON v1, como o build-db/match o leriam
+    if args.db:
+        texto = json.dumps(dbmod.unpack_db(dbmod.load_db_json(Path(args.db))))
+    else:
+        texto = json.dumps({"schema": dbmod.SCHEMA_V1, "items": list(itens_sinteticos(args.items))})
+
+    v1, mem_v1, t_v1 = medir(lambda: json.loads(texto))
+    v2, mem_v2, t_v2 = medir(lambda: dbmod.pack_db(json.loads(texto)))
+    col, mem_col, t_col = medir(lambda: columnar.ColumnarDB.from_db(json.loads(texto)))
+    del texto
+    n = len(v1["items"])
+
+    rnd = random.Random(1)
+    consultas = [rnd.choice(v2["items"])["qhash"] for _ in range(args.queries)]
+
+    print(f"itens: {n}  tabelas distintas: {len(col.table_hashes)}  softwares: {len(col.software_names)}")
+    print(f"{'representacao':<14} {'memoria':>12} {'bytes/item':>11} {'montagem':>10} {'match/consulta':>15}")
+    for nome, db, mem, t in (("dict v1", v1, mem_v1, t_v1), ("dict v2", v2, mem_v2, t_v2), ("ColumnarDB", col, mem_col, t_col)):
+        lat = latencia_match(db, consultas)
+        print(f"{nome:<14} {mem / 2**20:>9.1f} MB {mem / max(n, 1):>11.0f} {t:>9.2f}s {lat * 1e3:>12.2f} ms")
+    print(f"ColumnarDB.nbytes (so colunas): {col.nbytes / 2**20:.1f} MB")
+
+    # registros individuais: dataclass com __slots__ vs dict
+    meta = extract.JPEGMeta(progressive=False, subsampling="420", width=1920, height=1080)
+    hit = match.MatchHit(software="gimp", quality=75, filename="75.jpg", sha256="0" * 64, score=1.0)
+    for nome, rec in (("JPEGMeta", meta), ("MatchHit", hit)):
+        d = dict((k, getattr(rec, k)) for k in rec.__slots__)
+        print(f"{nome}: {sys.getsizeof(rec)} B com __slots__ vs {sys.getsizeof(d)} B como dict (sem contar valores)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ Descrição: Extrai tabelas de quantização de arquivos JPEG de forma categóri
 """
 
 import os
+import sys
+import copy
 import json
 import hashlib
 from pathlib import Path
@@ -23,11 +25,18 @@ except ImportError:
 
 from dataclasses import dataclass, asdict
 
+# Deduplicação por conteúdo (tamanho -> hash parcial -> SHA-256), a mesma usada pelo qext
+sys.path.append(str(Path(__file__).parent.parent))
+from dedup import DuplicateIndex
+from scan import scan_jpegs
+
 class ExtratorDQTCategorico:
     """Extrator categórico de DQTs - FOCADO NO SEU OBJETIVO"""
     
     def __init__(self):
         self.resultados = []
+        self.indice_duplicatas = DuplicateIndex()
+        self.extraidos = {}  # caminho canônico -> resultado
     
     def extrair_dqt_direto_header(self, caminho_arquivo: str) -> Optional[Dict]:
         """
@@ -326,21 +335,49 @@ class ExtratorDQTCategorico:
             print(f"ERRO: Diretório não existe: {diretorio}")
             return []
         
-        # Listar todos os JPEGs
-        arquivos_jpeg = list(diretorio_path.glob("*.jpg")) + list(diretorio_path.glob("*.jpeg"))
+        # Listar todos os JPEGs (detectados pelo conteudo: pega .JPG, .jpe, sem extensao...)
+        arquivos_jpeg = list(scan_jpegs(diretorio_path, recursive=False))
         
         print(f"Encontrados {len(arquivos_jpeg)} arquivos JPEG em {diretorio}")
         
         resultados = []
         for arquivo in sorted(arquivos_jpeg, key=lambda x: x.name):
-            print(f"Processando: {arquivo.name}")
-            
-            resultado = self.processar_arquivo(str(arquivo), software_info)
+            canonico = self.indice_duplicatas.add(arquivo)
+            if canonico is not None and canonico in self.extraidos:
+                print(f"Duplicata: {arquivo.name} == {canonico.name} (reaproveitando extração)")
+                resultado = self.registrar_alias(self.extraidos[canonico], arquivo, software_info)
+            else:
+                print(f"Processando: {arquivo.name}")
+                resultado = self.processar_arquivo(str(arquivo), software_info)
+                if resultado:
+                    self.extraidos[arquivo] = resultado
             if resultado:
                 resultados.append(resultado)
         
         return resultados
     
+    def registrar_alias(self, original: Dict, arquivo: Path, info_adicional: Dict = None) -> Dict:
+        """
+        Registra uma cópia idêntica (mesmo SHA-256) sem reextrair as DQTs.
+        Os rótulos (nome, qualidade) vêm do próprio arquivo; as tabelas, do original.
+        """
+        resultado = copy.deepcopy(original)
+        params_nome = self.extrair_parametros_nome(arquivo.name)
+        info = resultado["informacoes_categoricas"]
+        if params_nome['software'] and not params_nome['software'].isdigit():
+            info["software"] = params_nome['software']
+        elif info_adicional:
+            info["software"] = info_adicional.get('software', info["software"])
+        info["fator_qualidade"] = params_nome['qualidade']
+        info["categoria_forense"] = f"{info['software']}_Q{info['fator_qualidade']}"
+        resultado["arquivo"].update({
+            "nome": arquivo.name,
+            "caminho": str(arquivo),
+            "alias_de": original["arquivo"]["caminho"],
+        })
+        self.resultados.append(resultado)
+        return resultado
+    
     def salvar_resultados_json(self, caminho_saida: str = "resultados_dqt_categoricos.json"):
         """Salva todos os resultados em JSON formatado"""
         with open(caminho_saida, 'w', encoding='utf-8') as f:
@@ -21,14 +21,18 @@ def run_verification():
     if not base_path.exists():
         base_path = Path(".")
         
-    image_path = Path(r"c:\Users\klavy\Downloads\make this IA project\dataset\pixlr\100.jpg")
+    # Imagem de teste pode vir por argumento: python verify_deepfake_module.py <imagem.jpg>
+    if len(sys.argv) > 1:
+        image_path = Path(sys.argv[1])
+    else:
+        image_path = Path(r"c:\Users\klavy\Downloads\make this IA project\dataset\pixlr\100.jpg")
     output_dir = base_path / "output/verification"
     os.makedirs(output_dir, exist_ok=True)
     
     if not image_path.exists():
         print(f"ERRO: Imagem de teste não encontrada em {image_path}")
         # Try to find any jpg in dataset/pixlr
-        alternatives = list(Path(r"c:\Users\klavy\Downloads\make this IA project\dataset\pixlr").glob("*.jpg"))
+        alternatives = list(image_path.parent.glob("*.jpg")) if image_path.parent.exists() else []
         if alternatives:
             image_path = alternatives[0]
             print(f"Usando alternativa: {image_path}")
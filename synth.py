@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import hashlib
+import io
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import Image, features
+
+from .attribution import SYNTHETIC_PREFIX, AttributionModel
+from .db import SCHEMA_V2, load_db_json, pack_db, pack_item, save_db_json, table_csv
+from .db_sqlite import SQLITE_SUFFIXES, connect_db_sqlite, insert_items, is_sqlite_file
+from .extract import parse_jpeg_meta, parse_qtables, qhash_from_tables
+from .prefilter import write_prefilter_for_db
+from .profiling import count, timed
+from .utils import imap_bounded
+
+# Tabelas de exemplo do padrao (ITU-T T.81, Anexo K), em ordem natural (linha a linha),
+# a mesma ordem das tabelas extraidas dos arquivos (parse_qtables).
+STD_LUMINANCE = [
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99],
+]
+STD_CHROMINANCE = [
+    [17, 18, 24, 47, 99, 99, 99, 99],
+    [18, 21, 26, 66, 99, 99, 99, 99],
+    [24, 26, 56, 99, 99, 99, 99, 99],
+    [47, 66, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+]
+
+# subsampling do Pillow (0/1/2) -> rotulo de JPEGMeta
+PILLOW_SUBSAMPLING = {0: "444", 1: "422", 2: "420"}
+SYNTH_PREFIX = SYNTHETIC_PREFIX
+
+
+def parse_qualities(spec: str) -> List[int]:
+    """ "1-100", "50,75,90" ou combinacoes ("10-20,75") -> lista ordenada de qualities em 1..100."""
+    out = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        a, _, b = part.partition("-")
+        lo, hi = int(a), int(b or a)
+        if not 1 <= lo <= hi <= 100:
+            raise ValueError(f"Faixa de quality invalida: {part!r} (use valores em 1..100)")
+        out.update(range(lo, hi + 1))
+    return sorted(out)
+
+
+def ijg_scale(quality: int) -> int:
+    """Fator de escala (%) do jpeg_quality_scaling da IJG: 5000/q abaixo de 50, 200 - 2q acima."""
+    q = min(max(int(quality), 1), 100)
+    return 5000 // q if q < 50 else 200 - 2 * q
+
+
+def scale_table(table: Sequence[Sequence[int]], scale: int, force_baseline: bool = True) -> List[List[int]]:
+    """jpeg_add_quant_table: (v * scale + 50) / 100, minimo 1; maximo 255 com force_baseline (8 bits)
+    ou 32767 sem (tabelas de 16 bits)."""
+    hi = 255 if force_baseline else 32767
+    return [[min(max((v * scale + 50) // 100, 1), hi) for v in row] for row in table]
+
+
+def ijg_tables(quality: int, force_baseline: bool = True) -> Dict[str, List[List[int]]]:
+    """Tabelas Y/Cb/Cr que a libjpeg (IJG/libjpeg-turbo) gera para `quality`, calculadas sem codificar."""
+    scale = ijg_scale(quality)
+    chroma = scale_table(STD_CHROMINANCE, scale, force_baseline)
+    return {"Y": scale_table(STD_LUMINANCE, scale, force_baseline), "Cb": chroma, "Cr": chroma}
+
+
+def synthetic_item(
+    family: str,
+    quality: Optional[int],
+    qtables: Dict[str, Any],
+    variant: str,
+    meta: Optional[Dict[str, Any]] = None,
+    generator: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Registro de referencia sintetico, no mesmo formato v1 de db._process_one.
+
+    Sem arquivo: path = "synthetic:<familia>/<variante>", filename = "<familia>/<variante>"
+    (rotulo exibido nos hits) e sha256 deterministico do rotulo +
+    tabelas, entao gerar de novo sobre o mesmo DB nao duplica (UNIQUE(path, sha256) no SQLite,
+    dedup por sha256 no merge-db). jpeg_meta vazio = fingerprint valido para qualquer
+    subsampling/progressive (casa nos niveis Y+C/Y/C da atribuicao).
+    """
+    qhash = qhash_from_tables(qtables)
+    label = f"{family}/{variant}"
+    path = f"{SYNTH_PREFIX}{label}"
+    digest = hashlib.sha256("|".join([path, table_csv(qtables["Y"]), table_csv(qtables["Cb"])]).encode("utf-8")).hexdigest()
+    return {
+        "software": family,
+        "filename": label,
+        "path": path,
+        "sha256": digest,
+        "quality": quality,
+        "qtables": qtables,
+        "qhash": qhash,
+        "jpeg_meta": meta or {"progressive": None, "subsampling": None, "width": None, "height": None},
+        "synthetic": generator or {"family": family},
+    }
+
+
+def iter_ijg_items(qualities: Iterable[int] = range(1, 101), family: str = "ijg") -> Iterator[Dict[str, Any]]:
+    """Varredura analitica da IJG: uma entrada por quality com force_baseline e, so onde as
+    tabelas mudam (qualities baixas, valores acima de 255), outra sem o clamp de 8 bits."""
+    for q in qualities:
+        with timed("synth_ijg"):
+            base = ijg_tables(q, force_baseline=True)
+            yield synthetic_item(family, q, base, f"baseline/q{q:03d}", generator={"family": family, "force_baseline": True})
+            ext = ijg_tables(q, force_baseline=False)
+            if ext != base:
+                yield synthetic_item(family, q, ext, f"extended/q{q:03d}", generator={"family": family, "force_baseline": False})
+        count("synth_items")
+
+
+def _pillow_tables(setting: Tuple[Any, int, bool]) -> Tuple[Tuple[Any, int, bool], Dict[str, Any], Dict[str, Any]]:
+    quality, subsampling, progressive = setting
+    buf = io.BytesIO()
+    with timed("synth_encode"):
+        Image.new("RGB", (8, 8), (128, 128, 128)).save(
+            buf, "JPEG", quality=quality, subsampling=subsampling, progressive=progressive
+        )
+    data = buf.getvalue()
+    return setting, parse_qtables(data), asdict(parse_jpeg_meta(data))
+
+
+def iter_pillow_items(
+    qualities: Iterable[int] = range(1, 101),
+    subsamplings: Sequence[int] = (0, 1, 2),
+    progressive: Sequence[bool] = (False, True),
+    presets: bool = True,
+    workers: int = 4,
+    family: str = "pillow",
+) -> Iterator[Dict[str, Any]]:
+    """Tabelas reais do Pillow/libjpeg colhidas codificando uma imagem 8x8 por configuracao
+    (quality x subsampling x progressive, mais os presets web_*/low/... do Pillow), em paralelo.
+
+    O encode de 8x8 custa microssegundos, e sai o fingerprint completo (tabelas + subsampling
+    + progressive) que os arquivos do encoder tem. Dimensoes nao sao gravadas.
+    """
+    settings: List[Tuple[Any, int, bool]] = [(q, s, p) for q in qualities for s in subsamplings for p in progressive]
+    if presets:
+        from PIL.JpegPresets import presets as pillow_presets
+
+        # presets ja fixam o subsampling; so progressive varia
+        settings += [(name, -1, p) for name in pillow_presets for p in progressive]
+    lib = features.version("jpg") or "?"
+    for (quality, subsampling, prog), qtables, meta in imap_bounded(_pillow_tables, settings, workers=workers):
+        if "Y" not in qtables or "Cb" not in qtables:
+            continue
+        meta["width"] = meta["height"] = None
+        sub = meta.get("subsampling") or PILLOW_SUBSAMPLING.get(subsampling, "?")
+        mode = "progressive" if prog else "baseline"
+        if isinstance(quality, str):
+            variant, q = f"preset-{quality}/{sub}/{mode}", None
+        else:
+            variant, q = f"q{quality:03d}/{sub}/{mode}", quality
+        count("synth_items")
+        yield synthetic_item(
+            family, q, qtables, variant, meta=meta,
+            generator={"family": family, "libjpeg": lib, "quality": quality, "subsampling": sub, "progressive": prog},
+        )
+
+
+SYNTH_FAMILIES = ("ijg", "pillow")
+
+
+def iter_synthetic_items(
+    families: Sequence[str] = SYNTH_FAMILIES, qualities: Iterable[int] = range(1, 101), workers: int = 4
+) -> Iterator[Dict[str, Any]]:
+    qualities = list(qualities)
+    for fam in families:
+        if fam == "ijg":
+            yield from iter_ijg_items(qualities)
+        elif fam == "pillow":
+            yield from iter_pillow_items(qualities, workers=workers)
+        else:
+            raise ValueError(f"Familia desconhecida: {fam} (use {', '.join(SYNTH_FAMILIES)})")
+
+
+def write_synthetic_db(
+    out_path: Path, families: Sequence[str] = SYNTH_FAMILIES, qualities: Iterable[int] = range(1, 101), workers: int = 4
+) -> Dict[str, Any]:
+    """Grava as entradas sinteticas direto no DB (criado se nao existir; senao, acrescentadas).
+
+    SQLite: insert_items (idempotente). JSON: carregado, acrescido so do que ainda nao esta
+    (path + sha256), com atribuicao e tabelas atualizadas. O prefiltro <db>.bloom e refeito.
+    """
+    out_path = Path(out_path)
+    items = iter_synthetic_items(families, qualities, workers=workers)
+    stats: Dict[str, Any] = {"generated": 0, "added": 0}
+
+    def counted(it: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for x in it:
+            stats["generated"] += 1
+            yield x
+
+    if is_sqlite_file(out_path) or (not out_path.exists() and out_path.suffix.lower() in SQLITE_SUFFIXES):
+        conn = connect_db_sqlite(out_path)
+        try:
+            before = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('schema', 'qext.quantdb.sqlite.v1')")
+            insert_items(conn, counted(items))
+            stats["added"] = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] - before
+        finally:
+            conn.close()
+        stats["prefilter"] = str(write_prefilter_for_db(out_path))
+        return stats
+
+    if out_path.exists():
+        db = pack_db(load_db_json(out_path))
+    else:
+        db = {"schema": SCHEMA_V2, "dataset_root": None, "tables": {}, "items": []}
+    model = AttributionModel.from_db(db)
+    present = {(it.get("path"), it.get("sha256")) for it in db["items"]}
+    for it in counted(items):
+        if (it["path"], it["sha256"]) in present:
+            continue
+        present.add((it["path"], it["sha256"]))
+        model.add(it)
+        db["items"].append(pack_item(it, db["tables"]))
+        stats["added"] += 1
+    db["attribution"] = model.to_dict()
+    save_db_json(db, out_path)
+    stats["prefilter"] = str(write_prefilter_for_db(out_path, db))
+    return stats
@@ -0,0 +1,51 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_package() -> None:
+    """A raiz do repositorio e o pacote quantization_extend (imports relativos): registra o
+    pacote pelo caminho, qualquer que seja o nome do diretorio do checkout."""
+    if "quantization_extend" in sys.modules:
+        return
+    spec = importlib.util.spec_from_file_location(
+        "quantization_extend", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)]
+    )
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules["quantization_extend"] = mod
+    spec.loader.exec_module(mod)
+
+
+_load_package()
+
+
+def _jpeg(path: Path, quality: int = 75, size=(64, 48), seed: int = 0, **kw) -> Path:
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    arr = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(arr).save(path, "JPEG", quality=quality, **kw)
+    return path
+
+
+@pytest.fixture
+def make_jpeg():
+    """make_jpeg(path, quality=75, size=(w, h), seed=0, **opcoes_do_Pillow) -> path"""
+    return _jpeg
+
+
+@pytest.fixture
+def dataset(tmp_path, make_jpeg):
+    """dataset/<software>/*.jpg pequeno, com uma copia identica (alias) entre softwares."""
+    root = tmp_path / "dataset"
+    for sw, qs in (("gimp", (50, 75, 90)), ("photoshop", (60, 80)), ("pixlr", (70, 95))):
+        for i, q in enumerate(qs):
+            make_jpeg(root / sw / f"img_{q}.jpg", quality=q, seed=i + q)
+    (root / "pixlr" / "copy_of_gimp_50.jpg").write_bytes((root / "gimp" / "img_50.jpg").read_bytes())
+    return root
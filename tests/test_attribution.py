@@ -0,0 +1,56 @@
+from quantization_extend.attribution import AttributionModel
+
+
+def _item(sw, q, y, c, sub="420", prog=False, **kw):
+    return {"software": sw, "quality": q, "qhash": {"Y": y, "C": c}, "jpeg_meta": {"subsampling": sub, "progressive": prog}, **kw}
+
+
+ITEMS = [
+    _item("gimp", 75, "y75", "c75"),
+    _item("gimp", 75, "y75", "c75"),
+    _item("photoshop", 8, "y75", "c75", sub="444"),
+    _item("pixlr", 90, "y90", "c90"),
+    _item("pixlr", 91, "y90", "cX"),
+]
+
+
+def test_backoff_uses_most_specific_level():
+    m = AttributionModel().add_items(ITEMS)
+    exact = m.attribute({"Y": "y75", "C": "c75"}, {"subsampling": "420", "progressive": False})
+    assert exact["level"] == "Y+C+sub+prog" and exact["n"] == 2
+    assert [(p["software"], p["quality"], p["p"]) for p in exact["posterior"]] == [("gimp", 75, 1.0)]
+
+    # sem o subsampling exato: cai para Y+C, que inclui o photoshop 4:4:4
+    yc = m.attribute({"Y": "y75", "C": "c75"}, {"subsampling": "422", "progressive": False})
+    assert yc["level"] == "Y+C" and yc["n"] == 3
+    assert [(f["software"], f["count"]) for f in yc["families"]] == [("gimp", 2), ("photoshop", 1)]
+
+    y = m.attribute({"Y": "y90", "C": "nunca_visto"})
+    assert y["level"] == "Y" and [(p["quality"], p["count"]) for p in y["posterior"]] == [(90, 1), (91, 1)]
+    c = m.attribute({"Y": "nunca_visto", "C": "cX"})
+    assert c["level"] == "C" and [p["quality"] for p in c["posterior"]] == [91]
+    assert m.attribute({"Y": "nada", "C": "nada"}) == {"level": None, "n": 0, "families": [], "posterior": []}
+
+
+def test_incremental_add_updates_counts():
+    m = AttributionModel().add_items(ITEMS[:1])
+    key = ({"Y": "y75", "C": "c75"}, {"subsampling": "420", "progressive": False})
+    assert m.lookup(*key) == ("Y+C+sub+prog", {("gimp", 75): 1})
+    for it in ITEMS[1:]:
+        m.add(it)
+    m.add(_item("gimp", 75, "y75", "c75"), n=3)
+    assert m.lookup(*key) == ("Y+C+sub+prog", {("gimp", 75): 5})
+    assert m.counts["Y"]["y75"] == {("gimp", 75): 5, ("photoshop", 8): 1}
+    assert m.counts["C"]["c90"] == {("pixlr", 90): 1}
+    # mesmas contagens que um modelo montado de uma vez, e ida e volta pelo JSON
+    batch = AttributionModel().add_items(ITEMS + [_item("gimp", 75, "y75", "c75")] * 3)
+    assert m.counts == batch.counts
+    assert AttributionModel.from_dict(m.to_dict()).counts == m.counts
+
+
+def test_synthetic_labels_count_once_per_key():
+    m = AttributionModel().add_items(ITEMS[:2])
+    for sub in ("420", "444"):
+        m.add(_item("libjpeg", 75, "y75", "c75", sub=sub, synthetic=True))
+    counts = m.lookup({"Y": "y75", "C": "c75"})[1]
+    assert counts == {("gimp", 75): 2, ("libjpeg", 75): 1}
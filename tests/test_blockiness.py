@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from quantization_extend.deepfake_module.analysis_blockiness import ForensicBlockiness
+
+
+@pytest.mark.parametrize("shape", [(7, 12), (100, 7), (7, 7), (9, 9), (1, 1)])
+def test_tiny_images_have_empty_maps(shape):
+    luma = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    res = ForensicBlockiness().analyze_array(luma)
+    if res["block_map"].size == 0:
+        assert res["block_strength_mean"] is None and res["block_strength_p95"] is None
+    assert res["tile_map"].size == 0 and res["shifted_tile_fraction"] is None
+
+
+def test_grid_offset_found():
+    rng = np.random.default_rng(1)
+    blocks = rng.integers(0, 255, (16, 16), dtype=np.uint8)
+    luma = np.kron(blocks, np.ones((8, 8), dtype=np.uint8))  # blocos 8x8 planos: bordas na fase 0
+    luma = np.roll(luma, (3, 5), axis=(0, 1))
+    grid = ForensicBlockiness().grid_offset(luma)
+    assert (grid["dy"], grid["dx"]) == (3, 5)
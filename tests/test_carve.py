@@ -0,0 +1,38 @@
+import mmap
+
+from quantization_extend.carve import carve_jpegs
+
+
+def _blob(tmp_path, make_jpeg, offsets, size):
+    """Fonte bruta de `size` bytes zerados com JPEGs gravados nos offsets dados."""
+    jpegs = [make_jpeg(tmp_path / f"src{i}.jpg", quality=60 + 10 * (i % 3), seed=i).read_bytes() for i in range(len(offsets))]
+    buf = bytearray(size)
+    for off, data in zip(offsets, jpegs):
+        buf[off : off + len(data)] = data
+    src = tmp_path / "disk.img"
+    src.write_bytes(bytes(buf))
+    return src, [len(d) for d in jpegs]
+
+
+def test_offsets_across_windows(tmp_path, make_jpeg):
+    gran = mmap.ALLOCATIONGRANULARITY
+    max_size = 8 * 1024
+    # janela minima (max_size + gran): cada janela so trata `gran` inicios, entao os JPEGs
+    # caem em janelas diferentes, colados nas bordas e atravessando-as
+    offsets = [0, gran - 1, 2 * gran + 7, 3 * gran - 300, 5 * gran, 5 * gran + 4000, 9 * gran - 5]
+    src, lengths = _blob(tmp_path, make_jpeg, offsets, 12 * gran)
+    assert max(lengths) < max_size and max(lengths) < 4000
+
+    small = [(c.offset, c.length, c.sha256) for c in carve_jpegs(src, window=0, max_size=max_size)]
+    whole = [(c.offset, c.length, c.sha256) for c in carve_jpegs(src, max_size=max_size)]
+    assert small == whole
+    assert [o for o, _, _ in small] == offsets
+    assert [n for _, n, _ in small] == lengths
+
+
+def test_start_end_range(tmp_path, make_jpeg):
+    gran = mmap.ALLOCATIONGRANULARITY
+    offsets = [100, gran + 50, 3 * gran + 9]
+    src, _ = _blob(tmp_path, make_jpeg, offsets, 5 * gran)
+    got = [c.offset for c in carve_jpegs(src, start=gran, end=3 * gran + 10, window=0, max_size=8 * 1024)]
+    assert got == offsets[1:]
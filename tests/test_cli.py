@@ -0,0 +1,22 @@
+import pytest
+
+from quantization_extend.cli import build_parser
+
+
+def test_build_db_shard_and_shards_are_exclusive(capsys):
+    p = build_parser()
+    with pytest.raises(SystemExit):
+        p.parse_args(["build-db", "--dataset", "d", "--out", "o.json", "--shards", "4", "--shard", "0/4"])
+    assert "not allowed with argument" in capsys.readouterr().err
+    args = p.parse_args(["build-db", "--dataset", "d", "--out", "o.json", "--shard", "1/4"])
+    assert args.shard == (1, 4) and args.shards is None
+
+
+def test_match_missing_input_errors(tmp_path, dataset):
+    from quantization_extend.db import build_database, save_db_json
+
+    db_path = tmp_path / "quant_db.json"
+    save_db_json(build_database(dataset), db_path)
+    args = build_parser().parse_args(["match", "--db", str(db_path), "--input", str(tmp_path / "nao_existe")])
+    with pytest.raises(FileNotFoundError):
+        args.func(args)
@@ -0,0 +1,39 @@
+import itertools
+from dataclasses import asdict
+
+import pytest
+
+from quantization_extend.columnar import ColumnarDB
+from quantization_extend.db import build_database
+from quantization_extend.match import match_against_db, match_summary
+
+
+@pytest.fixture
+def dbs(dataset):
+    db = build_database(dataset)
+    return db, ColumnarDB.from_db(db)
+
+
+def _queries(db):
+    # fingerprints completos do DB, so Y, so C e Y/C de itens diferentes (mistura de scores)
+    ys = sorted({it["qhash"]["Y"] for it in db["items"]})
+    cs = sorted({it["qhash"]["C"] for it in db["items"]})
+    yield from ({"Y": y} for y in ys)
+    yield from ({"C": c} for c in cs)
+    yield from ({"Y": y, "C": c} for y, c in itertools.product(ys, cs))
+    yield {"Y": "nao_existe", "C": "nao_existe"}
+
+
+@pytest.mark.parametrize("topk", [0, 1, 2, 3, 10])
+def test_columnar_summary_matches_dict(dbs, topk):
+    db, col = dbs
+    for qhash in _queries(db):
+        assert asdict(match_summary(col, qhash, topk=topk)) == asdict(match_summary(db, qhash, topk=topk)), qhash
+
+
+def test_columnar_match_against_db_matches_dict(dbs, dataset):
+    db, col = dbs
+    for p in sorted(dataset.rglob("*.jpg")):
+        a, b = match_against_db(db, p, topk=3), match_against_db(col, p, topk=3)
+        assert (a["hits"], a["groups"], a["total_hits"]) == (b["hits"], b["groups"], b["total_hits"])
+        assert a["total_hits"] >= 1
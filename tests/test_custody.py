@@ -0,0 +1,85 @@
+import hashlib
+
+import pytest
+
+from quantization_extend.deepfake_module.custody import _leaf, custody_hash, merkle_root, verify_custody
+
+# Vetores de teste do Certificate Transparency para a Merkle Tree Hash da RFC 6962:
+# raiz das n primeiras folhas de RFC6962_LEAVES.
+RFC6962_LEAVES = [b"", b"\x00", b"\x10", b"\x20\x21", b"\x30\x31", b"\x40\x41\x42\x43",
+                  bytes(range(0x50, 0x58)), bytes(range(0x60, 0x70))]
+RFC6962_ROOTS = {
+    1: "6e340b9cffb37a989ca544e6bb780a2c78901d3fb33738768511a30617afa01d",
+    2: "fac54203e7cc696cf0dfcb42c92a1d9dbaf70ad9e621f4bd8d98662f00e3c125",
+    3: "aeb6bcfe274b70a14fb067a5e5578264db0fa9b51af5e0ba159158f329e06e77",
+    4: "d37ee418976dd95753c1c73862b9398fa2a2cf9b4ff0fdfe8b30cd95209614b7",
+    5: "4e3bbb1f7b478dcfe71fb631631519a3bca12c9aefca1612bfce4c13a86264d4",
+    6: "76e67dadbcdf1e10e1b74ddc608abd2f98dfb16fbce75277b5232a127f2087ef",
+    7: "ddb89be403809e325750d3d263cd78929c2942b7942a34b77e122c9594a74c8c",
+    8: "5dc9da79a70659a9ad559cb701ded9a2ab9d823aad2f4960cfe370eff4604328",
+}
+CHUNK = 1024
+
+
+@pytest.mark.parametrize("n", sorted(RFC6962_ROOTS))
+def test_merkle_root_matches_rfc6962_vectors(n):
+    leaves = [_leaf(memoryview(d)) for d in RFC6962_LEAVES[:n]]
+    assert merkle_root(leaves).hex() == RFC6962_ROOTS[n]
+
+
+def test_empty_file_root(tmp_path):
+    p = tmp_path / "empty.bin"
+    p.write_bytes(b"")
+    rec = custody_hash(p, chunk_size=CHUNK)
+    assert rec["merkle"]["leaf_count"] == 1
+    assert rec["merkle"]["root"] == RFC6962_ROOTS[1]
+    assert rec["sha256"] == hashlib.sha256(b"").hexdigest()
+
+
+@pytest.fixture
+def evidence(tmp_path):
+    p = tmp_path / "evidence.bin"
+    p.write_bytes(bytes(range(256)) * 21)  # 5376 bytes: 5 folhas cheias + 1 parcial
+    return p
+
+
+def test_file_root_is_tree_over_chunks(evidence):
+    data = evidence.read_bytes()
+    rec = custody_hash(evidence, chunk_size=CHUNK, workers=3)
+    leaves = [_leaf(memoryview(data[i : i + CHUNK])) for i in range(0, len(data), CHUNK)]
+    assert rec["merkle"]["leaf_count"] == 6
+    assert rec["merkle"]["root"] == merkle_root(leaves).hex()
+    assert rec["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_untouched_file_verifies(evidence):
+    rec = custody_hash(evidence, chunk_size=CHUNK)
+    full = verify_custody(evidence, rec)
+    assert full["ok"] and full["root_ok"] and full["size_ok"]
+    assert full["checked"] == 6 and full["bad_leaves"] == []
+    part = verify_custody(evidence, rec, start=1500, end=3000)
+    assert part["ok"] and part["checked"] == 2 and "root_ok" not in part
+
+
+def test_single_byte_change_localized(evidence):
+    rec = custody_hash(evidence, chunk_size=CHUNK)
+    data = bytearray(evidence.read_bytes())
+    data[3 * CHUNK + 17] ^= 0x01
+    evidence.write_bytes(bytes(data))
+
+    full = verify_custody(evidence, rec)
+    assert not full["ok"] and not full["root_ok"] and full["size_ok"]
+    assert full["bad_leaves"] == [3]
+    assert full["bad_ranges"] == [[3 * CHUNK, 4 * CHUNK]]
+    # so os segmentos pedidos sao rehasheados: fora do byte alterado, tudo confere
+    assert verify_custody(evidence, rec, start=0, end=3 * CHUNK)["ok"]
+    assert verify_custody(evidence, rec, start=3 * CHUNK + 17, end=3 * CHUNK + 18)["bad_leaves"] == [3]
+
+
+def test_truncation_flags_tail(evidence):
+    rec = custody_hash(evidence, chunk_size=CHUNK)
+    evidence.write_bytes(evidence.read_bytes()[: 4 * CHUNK + 10])
+    res = verify_custody(evidence, rec)
+    assert not res["ok"] and not res["size_ok"] and "root_ok" not in res
+    assert res["bad_leaves"] == [4, 5]
+    assert res["bad_ranges"] == [[4 * CHUNK, 5 * CHUNK], [5 * CHUNK, 21 * 256]]
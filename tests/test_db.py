@@ -0,0 +1,53 @@
+import pytest
+
+from quantization_extend import db as db_mod
+from quantization_extend.db import build_database, iter_database_items, iter_items
+
+
+def _aliases(items):
+    return {it["path"]: it.get("alias_of") for it in items}
+
+
+def test_iter_database_items_aliases(dataset):
+    items = list(iter_database_items(dataset))
+    by_path = {it["path"]: it for it in items}
+    copy = str((dataset / "pixlr" / "copy_of_gimp_50.jpg").resolve())
+    orig = str((dataset / "gimp" / "img_50.jpg").resolve())
+    canon, alias = (orig, copy) if by_path[copy].get("alias_of") else (copy, orig)
+    assert by_path[alias]["alias_of"] == canon
+    assert "qtables" not in by_path[alias] and by_path[canon]["qtables"]
+    assert sum(1 for it in items if it.get("alias_of")) == 1
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_unique_size_canonical_is_not_retained(tmp_path, make_jpeg, monkeypatch, workers):
+    root = tmp_path / "dataset"
+    a = make_jpeg(root / "gimp" / "a_75.jpg", quality=75, seed=1)
+    make_jpeg(root / "gimp" / "b_90.jpg", quality=90, size=(80, 60), seed=2)
+    order = [("gimp", a), ("gimp", root / "gimp" / "b_90.jpg")]
+    copies = []
+    for i in range(3):  # copias de a chegando depois que a ja saiu
+        c = root / "photoshop" / f"copy{i}.jpg"
+        c.parent.mkdir(parents=True, exist_ok=True)
+        c.write_bytes(a.read_bytes())
+        copies.append(("photoshop", c))
+    monkeypatch.setattr(db_mod, "_iter_dataset_files", lambda d, shard=None: iter(order + copies))
+
+    processed = []
+    real = db_mod._process_one
+    monkeypatch.setattr(db_mod, "_process_one", lambda sw, p, sha256=None: processed.append(p.name) or real(sw, p, sha256))
+    items = list(iter_database_items(root, workers=workers))
+
+    # em serie, a ja saiu (tamanho unico, resumo descartado) quando as copias chegam: a primeira
+    # e extraida, as seguintes reaproveitam; no pool, a ainda esta em voo e as copias esperam
+    extra = ["copy0.jpg"] if workers == 1 else []
+    assert sorted(processed) == ["a_75.jpg", "b_90.jpg", *extra]
+    al = _aliases(items)
+    assert [al[str(c.resolve())] for _, c in copies] == [str(a.resolve())] * 3
+    assert al[str(a.resolve())] is None
+
+
+def test_build_database_counts(dataset):
+    db = build_database(dataset)
+    assert len(db["items"]) == 8
+    assert len(list(iter_items(db))) == 8
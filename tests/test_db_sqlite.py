@@ -0,0 +1,56 @@
+from quantization_extend.db import _process_one
+from quantization_extend.db_sqlite import connect_db_sqlite, insert_items
+
+
+def _item_with_thumbnail(make_jpeg, tmp_path):
+    it = _process_one("gimp", make_jpeg(tmp_path / "gimp" / "a_75.jpg", quality=75))
+    it["embedded"] = [{"kind": "exif_thumbnail", "qhash": it["qhash"], "qtables": it["qtables"], "jpeg_meta": it["jpeg_meta"]}]
+    return it
+
+
+def _counts(conn):
+    return (
+        conn.execute("SELECT COUNT(*) FROM items").fetchone()[0],
+        conn.execute("SELECT COUNT(*) FROM embedded").fetchone()[0],
+        conn.execute("SELECT MAX(count) FROM attribution").fetchone()[0],
+    )
+
+
+def test_insert_items_duplicate_within_batch(tmp_path, make_jpeg):
+    it = _item_with_thumbnail(make_jpeg, tmp_path)
+    conn = connect_db_sqlite(tmp_path / "db.sqlite")
+    insert_items(conn, [it, dict(it)])
+    assert _counts(conn) == (1, 1, 1)
+
+
+def test_insert_items_idempotent_across_batches(tmp_path, make_jpeg):
+    it = _item_with_thumbnail(make_jpeg, tmp_path)
+    conn = connect_db_sqlite(tmp_path / "db.sqlite")
+    insert_items(conn, [it])
+    insert_items(conn, [dict(it)], batch_size=1)
+    assert _counts(conn) == (1, 1, 1)
+
+
+def test_iter_items_streams_embedded_per_batch(tmp_path, make_jpeg):
+    from quantization_extend.db_sqlite import SqliteQuantDB
+
+    items = []
+    for i, q in enumerate((40, 50, 60, 70, 80)):
+        it = _process_one("gimp", make_jpeg(tmp_path / "gimp" / f"x_{q}.jpg", quality=q, seed=i))
+        thumb = _process_one("gimp", make_jpeg(tmp_path / "t" / f"t_{q}.jpg", quality=q + 5, size=(16, 16)))
+        if i % 2 == 0:  # so alguns itens tem miniatura
+            it["embedded"] = [{"kind": "exif_thumbnail", **{k: thumb[k] for k in ("qhash", "qtables", "jpeg_meta")}}]
+        items.append(it)
+    conn = connect_db_sqlite(tmp_path / "db.sqlite")
+    insert_items(conn, items)
+    conn.close()
+
+    expected = {it["path"]: [e["qhash"] for e in it.get("embedded", ())] for it in items}
+    with SqliteQuantDB(tmp_path / "db.sqlite") as sdb:
+        for by_sha256 in (False, True):
+            got = list(sdb.iter_items(with_tables=True, by_sha256=by_sha256, batch_size=2))
+            assert {it["path"]: [e["qhash"] for e in it.get("embedded", ())] for it in got} == expected
+            for it in got:
+                for e in it.get("embedded", ()):
+                    assert e["qtables"]["Y"] and e["qtables"]["Cb"]
+        assert [it["sha256"] for it in sdb.iter_items(by_sha256=True, batch_size=2)] == sorted(it["sha256"] for it in items)
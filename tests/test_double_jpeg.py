@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+from PIL import Image
+
+from quantization_extend.deepfake_module.analysis_double_jpeg import DEFAULT_FREQS, ForensicDoubleJPEG
+
+
+def _natural(seed, size=256):
+    # ondas suaves + ruido borrado + retangulos chapados: histogramas DCT parecidos com fotos
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+    img = np.empty((size, size, 3), np.float32)
+    for c in range(3):
+        img[..., c] = 128 + 50 * np.sin(xx / rng.uniform(10, 40) + rng.uniform(0, 6)) * np.cos(yy / rng.uniform(10, 40))
+    img += cv2.GaussianBlur(rng.normal(0, 40, img.shape).astype(np.float32), (0, 0), 2) + rng.normal(0, 3, img.shape)
+    for _ in range(6):
+        x0, y0 = (int(v) for v in rng.integers(0, size - 40, 2))
+        w, h = (int(v) for v in rng.integers(10, 60, 2))
+        cv2.rectangle(img, (x0, y0), (x0 + w, y0 + h), rng.uniform(20, 230, 3).tolist(), -1)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def _encode(rgb, quality):
+    buf = io.BytesIO()
+    Image.fromarray(rgb).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _analyze(data):
+    qt = np.asarray(Image.open(io.BytesIO(data)).quantization[0]).reshape(8, 8)
+    luma = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    return ForensicDoubleJPEG().analyze_array(luma, qt), qt
+
+
+@pytest.mark.parametrize("quality", [50, 60, 70, 75, 80, 85, 90])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_single_compression_not_flagged(quality, seed):
+    res, _ = _analyze(_encode(_natural(seed), quality))
+    assert res["double_compressed"] is False
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_recompression_recovers_primary_steps(seed):
+    first = _encode(_natural(seed), 50)
+    res, _ = _analyze(_encode(np.asarray(Image.open(io.BytesIO(first)).convert("RGB")), 90))
+    q50 = np.asarray(Image.open(io.BytesIO(first)).quantization[0]).reshape(8, 8)
+    assert res["double_compressed"] is True
+    exact = [res["primary_table_estimate"][u][v] == q50[u, v] for u, v in DEFAULT_FREQS]
+    assert sum(exact) * 2 > len(DEFAULT_FREQS)
+
+
+def test_directory_detects_jpegs_by_content(tmp_path):
+    data = _encode(_natural(0, size=64), 80)
+    (tmp_path / "a.jpg").write_bytes(data)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "renamed.bin").write_bytes(data)
+    (tmp_path / "sub" / "noext").write_bytes(data)
+    (tmp_path / "notes.jpg").write_bytes(b"not a jpeg")
+    results = list(ForensicDoubleJPEG().analyze_directory(str(tmp_path), workers=2))
+    assert sorted(r["path"] for r in results) == sorted(
+        str(tmp_path / p) for p in ("a.jpg", "sub/renamed.bin", "sub/noext")
+    )
+    assert all("error" not in r for r in results)
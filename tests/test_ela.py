@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from quantization_extend.deepfake_module.analysis_ela import ForensicELA
+
+
+def _image(shape, seed=0):
+    # ruido suave + bordas: exercita croma 4:2:0 e blocos vizinhos entre tiles
+    rng = np.random.default_rng(seed)
+    img = cv2.GaussianBlur(rng.integers(0, 255, shape, dtype=np.uint8), (5, 5), 0)
+    img[shape[0] // 3 :, shape[1] // 2 :] = 255 - img[shape[0] // 3 :, shape[1] // 2 :]
+    return img
+
+
+@pytest.mark.parametrize("shape", [(203, 301, 3), (97, 130, 3), (150, 160)])
+@pytest.mark.parametrize("max_tile_mb", [0.02, 0.05])
+def test_tiled_matches_full(shape, max_tile_mb):
+    ela = ForensicELA(quality=90)
+    img = _image(shape)
+    full, full_max = ela.ela_from_array(img)
+    tiled, tiled_max = ela.ela_tiled(img, max_tile_mb=max_tile_mb)
+    assert int(tiled_max) == int(full_max)
+    assert np.array_equal(tiled, full)
+
+
+def test_tiled_into_memmap(tmp_path):
+    ela = ForensicELA()
+    img = _image((130, 170, 3), seed=1)
+    out = np.lib.format.open_memmap(tmp_path / "ela.npy", mode="w+", dtype=np.uint8, shape=img.shape)
+    tiled, _ = ela.ela_tiled(img, max_tile_mb=0.02, out=out)
+    out.flush()
+    assert np.array_equal(np.load(tmp_path / "ela.npy"), ela.ela_from_array(img)[0])
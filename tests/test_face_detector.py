@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from quantization_extend.deepfake_module.face_detector import CROP_ALIGN, ForensicFaceDetector
+
+
+class _StubDetector(ForensicFaceDetector):
+    """Sem modelo: o "rosto" e uma caixa fixa, devolvida so quando o detector roda."""
+
+    def __init__(self, box, **kw):
+        self.box = box
+        self.calls = 0
+        super().__init__(**kw)
+
+    def _load(self, model_path, config_path):
+        return "stub", None
+
+    def _detect_small(self, small):
+        self.calls += 1
+        return [(*self.box, 1.0)]
+
+
+def _frames(n, start=(40, 30), step=(3, 2)):
+    # um retalho texturizado andando sobre fundo liso
+    rng = np.random.default_rng(0)
+    patch = cv2.GaussianBlur(rng.integers(0, 255, (40, 40, 3), dtype=np.uint8), (0, 0), 1.5)
+    for i in range(n):
+        frame = np.full((160, 200, 3), 90, np.uint8)
+        x, y = start[0] + i * step[0], start[1] + i * step[1]
+        frame[y : y + 40, x : x + 40] = patch
+        yield frame
+
+
+def test_track_frames_follows_between_detections():
+    det = _StubDetector((40, 30, 40, 40), redetect_every=5)
+    frames = list(_frames(5))
+    out = list(det.track_frames(iter(frames)))
+    assert det.calls == 1
+    assert [rec["frame"] for rec, _ in out] == list(range(5))
+    assert all(frame is src for (_, frame), src in zip(out, frames))
+    assert [rec["detected"] for rec, _ in out] == [True, False, False, False, False]
+    assert [rec["faces"][0]["box"][:2] for rec, _ in out] == [[40 + 3 * i, 30 + 2 * i] for i in range(5)]
+    assert list(det.track(iter(frames))) == [rec for rec, _ in out]
+
+
+def test_crop_box_on_grid_and_clipped():
+    det = _StubDetector((0, 0, 1, 1), margin=0.25)
+    x0, y0, x1, y1 = det.crop_box([13, 21, 40, 40], (160, 200, 3))
+    assert all(v % CROP_ALIGN == 0 for v in (x0, y0, x1, y1))
+    assert x0 <= 13 - 10 and y0 <= 21 - 10 and x1 >= 13 + 50 and y1 >= 21 + 50
+    assert det.crop_box([180, 140, 40, 40], (160, 200, 3))[2:] == [200, 160]
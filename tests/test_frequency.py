@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from quantization_extend.deepfake_module.analysis_frequency import MIN_TILE, ForensicFrequency
+
+
+@pytest.mark.parametrize("shape", [(5, 5), (7, 40), (40, 7)])
+def test_tiled_features_rejects_tiny_images(shape):
+    img = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    with pytest.raises(ValueError, match="too small"):
+        ForensicFrequency().tiled_features(img)
+
+
+@pytest.mark.parametrize("shape,tile", [((8, 40), None), ((8, 40), 4), ((30, 50), 64), ((30, 50), None)])
+def test_tile_clamped_to_shorter_side(shape, tile):
+    h, w = shape
+    img = np.random.default_rng(1).integers(0, 255, shape, dtype=np.uint8)
+    feats = ForensicFrequency().tiled_features(img, tile=tile, bins=8)
+    t = feats["tile"]
+    assert MIN_TILE <= t <= min(h, w)
+    ys, xs = feats["origins"]
+    # origens dentro da imagem e ultimo tile encostado na borda
+    assert ys[0] == 0 and xs[0] == 0 and ys[-1] == h - t and xs[-1] == w - t
+    assert feats["profiles"].shape == (len(ys), len(xs), 8)
+    assert np.isfinite(feats["profiles"]).all()
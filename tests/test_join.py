@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from quantization_extend.join import hash_join, join_collections
+
+
+def _normalized(groups):
+    return sorted((g["key"], g["a_count"], g["b_count"], sorted(g["a"]), sorted(g["b"])) for g in groups)
+
+
+def _rows(side, n, keys, seed):
+    rng = random.Random(seed)
+    return [(f"k{rng.randrange(keys)}", f"{side}/{i}.jpg") for i in range(n)]
+
+
+@pytest.mark.parametrize("max_rows", [1, 7, 50])
+def test_spilled_matches_in_memory(tmp_path, max_rows):
+    a = _rows("a", 200, 40, seed=1)
+    b = _rows("b", 300, 80, seed=2)  # metade das chaves de B nao existe em A
+    mem_stats, spill_stats = {}, {}
+    mem = list(hash_join(iter(a), iter(b), stats=mem_stats, tmpdir=tmp_path))
+    spilled = list(hash_join(iter(a), iter(b), max_rows=max_rows, partitions=5, stats=spill_stats, tmpdir=tmp_path))
+    assert not mem_stats["spilled"] and spill_stats["spilled"]
+    assert _normalized(spilled) == _normalized(mem)
+    for k in ("groups", "a_matched", "b_matched"):
+        assert spill_stats[k] == mem_stats[k]
+    assert list(tmp_path.iterdir()) == []  # particoes removidas
+
+
+def test_spill_only_on_b(tmp_path):
+    # A cabe em memoria, B passa de max_rows: o join ainda e particionado nos dois lados
+    a = [("k1", "a/1.jpg"), ("k2", "a/2.jpg")]
+    b = [("k1", f"b/{i}.jpg") for i in range(10)] + [("k3", "b/x.jpg")]
+    stats = {}
+    got = _normalized(hash_join(iter(a), iter(b), max_rows=4, partitions=3, stats=stats, tmpdir=tmp_path))
+    assert stats["spilled"]
+    assert got == [("k1", 1, 10, ["a/1.jpg"], sorted(p for _, p in b[:10]))]
+
+
+def test_collections_spilled_matches_in_memory(dataset):
+    mem = _normalized(join_collections(dataset / "gimp", dataset))
+    spilled = _normalized(join_collections(dataset / "gimp", dataset, max_rows=1, partitions=4))
+    assert spilled == mem
+    # cada JPEG do gimp casa com ele mesmo; img_50 tambem com a copia no pixlr
+    assert sorted(g[2] for g in mem) == [1, 1, 2]
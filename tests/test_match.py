@@ -0,0 +1,73 @@
+import struct
+
+from quantization_extend.db import build_database, save_db_json
+from quantization_extend.match import LazyDB, match_against_db
+from quantization_extend.prefilter import load_prefilter_for_db, write_prefilter_for_db
+
+
+def _with_exif_thumbnail(path, thumb_path):
+    """Insere um APP1 "Exif" com a miniatura logo apos o SOI (basta para extract._find_embedded)."""
+    data, thumb = path.read_bytes(), thumb_path.read_bytes()
+    body = b"Exif\x00\x00" + thumb
+    path.write_bytes(data[:2] + b"\xff\xe1" + struct.pack(">H", len(body) + 2) + body + data[2:])
+    return path
+
+
+def _db(tmp_path, dataset):
+    db_path = tmp_path / "quant_db.json"
+    save_db_json(build_database(dataset), db_path)
+    write_prefilter_for_db(db_path)
+    return db_path
+
+
+def test_prefilter_negative_thumbnail_does_not_open_db(tmp_path, dataset, make_jpeg):
+    db_path = _db(tmp_path, dataset)
+    thumb = make_jpeg(tmp_path / "t.jpg", quality=12, size=(16, 16))
+    p = _with_exif_thumbnail(make_jpeg(tmp_path / "in" / "x.jpg", quality=11), thumb)
+    bf = load_prefilter_for_db(db_path)
+    lazy = LazyDB(db_path)
+    res = match_against_db(lazy, p, prefilter=bf)
+    assert res["prefilter"] == "negative"
+    assert [e["prefilter"] for e in res["embedded"]] == ["negative"]
+    assert res["embedded"][0]["total_hits"] == 0
+    assert lazy._db is None
+
+
+def test_prefilter_candidate_thumbnail_is_matched(tmp_path, dataset, make_jpeg):
+    db_path = _db(tmp_path, dataset)
+    thumb = make_jpeg(tmp_path / "t.jpg", quality=75, size=(16, 16))
+    p = _with_exif_thumbnail(make_jpeg(tmp_path / "in" / "x.jpg", quality=11), thumb)
+    res = match_against_db(LazyDB(db_path), p, prefilter=load_prefilter_for_db(db_path))
+    assert res["prefilter"] == "negative"
+    (e,) = res["embedded"]
+    assert e["kind"] == "exif_thumbnail" and e["prefilter"] == "candidate"
+    assert {h["software"] for h in e["hits"]} == {"gimp"}
+
+
+def test_match_paths_keeps_only_size_collided_results(tmp_path, dataset, make_jpeg, monkeypatch):
+    from quantization_extend import match as match_mod
+
+    db_path = _db(tmp_path, dataset)
+    ev = tmp_path / "ev"
+    a = make_jpeg(ev / "a.jpg", quality=75, seed=1)
+    b = make_jpeg(ev / "b.jpg", quality=90, size=(80, 60), seed=2)
+    copy_a = ev / "z_copy_of_a.jpg"
+    copy_a.write_bytes(a.read_bytes())
+
+    stored = []
+    real = match_mod.DuplicateIndex
+
+    class Spy(real):
+        def size_collided(self, path):
+            r = super().size_collided(path)
+            stored.append((path.name, r))
+            return r
+
+    monkeypatch.setattr(match_mod, "DuplicateIndex", Spy)
+    results = list(match_mod.match_paths(LazyDB(db_path), [a, b, copy_a]))
+    # a e b tinham tamanho unico quando vistos: nada guardado
+    assert stored == [("a.jpg", False), ("b.jpg", False)]
+    ra, rb, rc = results
+    assert rc["input"]["alias_of"] == str(a.resolve())
+    assert rc["input"]["path"] == str(copy_a.resolve())
+    assert rc["hits"] == ra["hits"] and rc["input"]["sha256"] == ra["input"]["sha256"]
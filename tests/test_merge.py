@@ -0,0 +1,92 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from quantization_extend.db import build_database, iter_items, save_db_json
+from quantization_extend.db_sqlite import SqliteQuantDB, build_database_sqlite
+from quantization_extend.merge import build_sharded, merge_databases, shard_paths
+
+
+def _records(path):
+    """(path, sha256, qhash, jpeg_meta, canonico?) de cada item, mais os grupos por sha256."""
+    if path.suffix == ".sqlite":
+        with SqliteQuantDB(path) as sdb:
+            items = list(sdb.iter_items())
+    else:
+        from quantization_extend.db import load_db_json
+
+        items = list(iter_items(load_db_json(path)))
+    recs = sorted(
+        (it["path"], it["sha256"], tuple(sorted(it["qhash"].items())), it["software"], it["quality"], "alias_of" in it)
+        for it in items
+    )
+    groups = {}
+    for it in items:
+        groups.setdefault(it["sha256"], []).append(it)
+    # exatamente um canonico por sha256, e os aliases apontam para ele
+    for members in groups.values():
+        canon = [it for it in members if "alias_of" not in it]
+        assert len(canon) == 1
+        assert all(it["alias_of"] == canon[0]["path"] for it in members if "alias_of" in it)
+    return [r[:5] for r in recs], sum(r[5] for r in recs)
+
+
+def _attribution(path):
+    if path.suffix == ".sqlite":
+        with SqliteQuantDB(path) as sdb:
+            return sorted(tuple(r) for r in sdb.conn.execute("SELECT * FROM attribution"))
+    from quantization_extend.attribution import AttributionModel
+    from quantization_extend.db import load_db_json
+
+    return AttributionModel.from_db(load_db_json(path)).counts
+
+
+def _build(dataset, out, shard=None):
+    if out.suffix == ".sqlite":
+        build_database_sqlite(dataset, out, shard=shard)
+    else:
+        save_db_json(build_database(dataset, shard=shard), out)
+
+
+@pytest.mark.parametrize("suffix", [".json", ".sqlite"])
+@pytest.mark.parametrize("n", [3, 4])
+def test_sharded_merge_equals_monolithic(tmp_path, dataset, suffix, n):
+    mono = tmp_path / f"mono{suffix}"
+    _build(dataset, mono)
+    merged = tmp_path / f"merged{suffix}"
+    parts = shard_paths(merged, n, tmp_path / "parts")
+    parts[0].parent.mkdir()
+    for i, part in enumerate(parts):
+        _build(dataset, part, shard=(i, n))
+    stats = merge_databases(parts, merged)
+    assert stats["missing_shards"] == []
+    # mesmos registros e mesmo numero de aliases; qual copia e canonica pode diferir (ver merge_items)
+    assert _records(merged) == _records(mono)
+    assert _attribution(merged) == _attribution(mono)
+    # mesclar de novo o resultado e idempotente
+    again = tmp_path / f"again{suffix}"
+    merge_databases([merged], again)
+    assert _records(again) == _records(merged)
+
+
+def test_build_sharded_subprocesses_equal_monolithic(tmp_path, dataset, monkeypatch):
+    # os subprocessos importam o pacote pelo nome: um diretorio com o link quantization_extend
+    # no PYTHONPATH o expoe, qualquer que seja o nome do checkout; o cwd nao ajuda
+    site = tmp_path / "site"
+    site.mkdir()
+    (site / "quantization_extend").symlink_to(Path(__file__).resolve().parents[1], target_is_directory=True)
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join([str(site), os.environ.get("PYTHONPATH", "")]))
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    mono = tmp_path / "mono.json"
+    _build(dataset, mono)
+    merged = tmp_path / "out" / "merged.json"
+    stats = build_sharded(dataset, merged, shards=3, jobs=2, workers=1)
+    assert stats["missing_shards"] == [] and stats["inputs"] == 3
+    assert _records(merged) == _records(mono)
+    assert _attribution(merged) == _attribution(mono)
+    # parciais removidos depois do merge; nada escrito no cwd
+    assert sorted(p.name for p in merged.parent.iterdir()) == ["merged.json", "merged.json.bloom"]
+    assert list(work.iterdir()) == []
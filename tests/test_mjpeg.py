@@ -0,0 +1,88 @@
+import mmap
+import struct
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from quantization_extend.cli import build_parser
+from quantization_extend.extract import parse_jpeg_header, qhash_from_tables
+from quantization_extend.mjpeg import match_mjpeg, read_mjpeg_frames
+
+FRAMES = 12
+
+
+def _video(path, fourcc="MJPG", frames=FRAMES, size=(64, 48)):
+    w = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), 10, size)
+    if not w.isOpened():
+        pytest.skip(f"OpenCV sem escrita {fourcc} para {path.suffix}")
+    rng = np.random.default_rng(0)
+    for _ in range(frames):
+        w.write(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8))
+    w.release()
+    return path
+
+
+@pytest.mark.parametrize("name,container", [("clip.avi", "avi"), ("clip.mov", "mov")])
+def test_container_frames_single_segment(tmp_path, name, container):
+    path = _video(tmp_path / name)
+    res = match_mjpeg(None, path)
+    assert "error" not in res
+    assert res["input"]["container"] == container
+    assert res["input"]["frames"] == FRAMES and res["input"]["distinct_fingerprints"] == 1
+    assert res["table_changes"] == [] and res["errors"] == []
+    (seg,) = res["segments"]
+    assert (seg["first_frame"], seg["last_frame"], seg["frames"]) == (0, FRAMES - 1, FRAMES)
+    assert (seg["jpeg_meta"]["width"], seg["jpeg_meta"]["height"]) == (64, 48)
+
+    # o fingerprint do segmento e o do JPEG que esta no offset indicado
+    data = path.read_bytes()
+    frames = list(read_mjpeg_frames(path))
+    assert [f.index for f in frames] == list(range(FRAMES))
+    first = frames[0]
+    assert first.offset == seg["offset"]
+    hdr = parse_jpeg_header(data[first.offset : first.offset + first.length], embedded=False)
+    assert seg["qhash"] == qhash_from_tables(hdr.qtables)
+
+
+def test_non_jpeg_video_reports_no_samples(tmp_path):
+    path = _video(tmp_path / "clip.mp4", fourcc="mp4v")
+    res = match_mjpeg(None, path)
+    assert res["input"]["container"] == "mov" and res["input"]["frames"] == 0
+    assert res["segments"] == [] and res["error"] == "no JPEG samples"
+    args = build_parser().parse_args(["mjpeg", "--input", str(path)])
+    assert args.func(args) == 1
+
+
+@pytest.mark.parametrize("atom", [b"stsz", b"stco", b"stsc"])
+def test_corrupt_sample_table_counts(tmp_path, atom):
+    path = _video(tmp_path / "clip.mov")
+    data = bytearray(path.read_bytes())
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = mm.find(atom)
+    assert pos > 0
+    # contagem de entradas (stsz: depois do tamanho fixo) muito maior que o atomo
+    count_at = pos + 4 + 4 + (4 if atom == b"stsz" else 0)
+    struct.pack_into(">I", data, count_at, 0xFFFFFFF0)
+    path.write_bytes(bytes(data))
+    frames = list(read_mjpeg_frames(path))
+    assert 0 < len(frames) <= FRAMES
+
+
+def test_corrupt_frame_reported_outside_segments(tmp_path):
+    path = _video(tmp_path / "clip.avi")
+    frames = list(read_mjpeg_frames(path))
+    data = bytearray(path.read_bytes())
+    bad = frames[5]
+    data[bad.offset : bad.offset + 2] = b"\x00\x00"  # sem SOI: cabecalho invalido
+    path.write_bytes(bytes(data))
+
+    res = match_mjpeg(None, path)
+    assert "error" not in res
+    assert res["errors"] == [{"frame": 5, "offset": bad.offset}]
+    # mesma tabela dos dois lados do frame corrompido: nao e troca de tabela
+    assert res["table_changes"] == []
+    (seg,) = res["segments"]
+    assert (seg["first_frame"], seg["last_frame"], seg["frames"]) == (0, FRAMES - 1, FRAMES - 1)
+    assert res["input"]["frames"] == FRAMES and res["input"]["distinct_fingerprints"] == 1
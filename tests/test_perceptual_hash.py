@@ -0,0 +1,48 @@
+import io
+import random
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+from PIL import Image
+
+from quantization_extend.deepfake_module.perceptual_hash import MultiIndexHash, NearDuplicateIndex, hamming
+
+
+def _hashes(bits, seed=0):
+    # hashes aleatorios + vizinhos plantados a poucos bits de distancia (senao quase nada cai no raio)
+    rng = random.Random(seed)
+    base = [rng.getrandbits(bits) for _ in range(200)]
+    near = [h ^ sum(1 << b for b in rng.sample(range(bits), rng.randint(0, 12))) for h in base for _ in range(3)]
+    return base + near
+
+
+@pytest.mark.parametrize("bits", [64, 16])
+@pytest.mark.parametrize("radius", [0, 1, 3, 6, 10])
+def test_radius_search_matches_brute_force(bits, radius):
+    hashes = _hashes(bits, seed=radius)
+    index = MultiIndexHash(radius, bits=bits)
+    for i, h in enumerate(hashes):
+        index.add(h, i)
+    for q in hashes[::7] + [random.Random(1).getrandbits(bits) for _ in range(20)]:
+        brute = sorted((hamming(q, h), i) for i, h in enumerate(hashes) if hamming(q, h) <= radius)
+        assert index.search(q) == brute
+
+
+def _recompress(img, quality):
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, "JPEG", quality=quality)
+    return np.asarray(Image.open(buf))
+
+
+def test_near_duplicates_grouped():
+    rng = np.random.default_rng(0)
+    a, b = (cv2.GaussianBlur(rng.integers(0, 255, (96, 128), dtype=np.uint8), (0, 0), 3) for _ in range(2))
+    index = NearDuplicateIndex(radius=6)
+    assert index.add("a", a) is None
+    assert index.add("b", b) is None
+    rep, d = index.add("a_q60", _recompress(a, 60))
+    assert rep == "a" and d <= 6
+    assert index.add("b_small", cv2.resize(b, (64, 48), interpolation=cv2.INTER_AREA))[0] == "b"
+    assert dict(index.clusters()) == {"a": ["a", "a_q60"], "b": ["b", "b_small"]}
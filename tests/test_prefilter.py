@@ -0,0 +1,35 @@
+import sqlite3
+
+from quantization_extend.db_sqlite import build_database_sqlite
+from quantization_extend.prefilter import load_prefilter_for_db, write_prefilter_for_db
+
+
+def test_rebuilt_sqlite_db_invalidates_bloom(tmp_path, dataset, make_jpeg):
+    db_path = tmp_path / "quant_db.sqlite"
+    build_database_sqlite(dataset, db_path)
+    write_prefilter_for_db(db_path)
+    assert load_prefilter_for_db(db_path) is not None
+    old_bloom = (tmp_path / "quant_db.sqlite.bloom").read_bytes()
+
+    # refeito com o mesmo numero de tabelas distintas (qualities trocadas): o filtro antigo nao vale
+    other = tmp_path / "other"
+    for p in sorted(dataset.rglob("*.jpg")):
+        if p.name.startswith("copy"):
+            continue
+        q = int(p.stem.split("_")[1])
+        make_jpeg(other / p.parent.name / f"img_{q + 1}.jpg", quality=q + 1)
+    db_path.unlink()
+    build_database_sqlite(other, db_path)
+    (tmp_path / "quant_db.sqlite.bloom").write_bytes(old_bloom)
+    assert load_prefilter_for_db(db_path) is None
+
+
+def test_out_of_band_edit_invalidates_bloom(tmp_path, dataset):
+    db_path = tmp_path / "quant_db.sqlite"
+    build_database_sqlite(dataset, db_path)
+    write_prefilter_for_db(db_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("DELETE FROM items WHERE id = (SELECT MAX(id) FROM items)")
+    conn.close()
+    assert load_prefilter_for_db(db_path) is None
@@ -0,0 +1,43 @@
+import pytest
+
+from quantization_extend.db import load_db_json
+from quantization_extend.db_sqlite import SqliteQuantDB
+from quantization_extend.columnar import ColumnarDB
+from quantization_extend.extract import qhash_from_tables
+from quantization_extend.match import match_qhash
+from quantization_extend.synth import ijg_tables, write_synthetic_db
+
+
+@pytest.mark.parametrize("name", ["synth.json", "synth.sqlite"])
+def test_synthetic_families_weigh_once_per_label(tmp_path, name):
+    out = tmp_path / name
+    stats = write_synthetic_db(out, qualities=[50], workers=1)
+    assert stats["added"] > 2  # pillow: varias configuracoes com as mesmas tabelas
+    qhash = qhash_from_tables(ijg_tables(50))
+    meta = {"subsampling": "411", "progressive": False}  # sem par exato: cai para Y+C
+    if name.endswith(".json"):
+        db = ColumnarDB.from_db(load_db_json(out))
+        res = db.attribution.attribute(qhash, meta)
+    else:
+        with SqliteQuantDB(out) as sdb:
+            res = sdb.attribute(qhash, meta)
+    assert res["level"] == "Y+C"
+    assert {f["software"]: f["p"] for f in res["families"]} == {"ijg": 0.5, "pillow": 0.5}
+
+    # gerar de novo nao muda nada
+    assert write_synthetic_db(out, qualities=[50], workers=1)["added"] == 0
+
+
+@pytest.mark.parametrize("name", ["synth.json", "synth.sqlite"])
+def test_synthetic_hits_carry_string_label(tmp_path, name):
+    out = tmp_path / name
+    write_synthetic_db(out, qualities=[50], workers=1)
+    qhash = qhash_from_tables(ijg_tables(50))
+    if name.endswith(".json"):
+        hits = match_qhash(ColumnarDB.from_db(load_db_json(out)), qhash)
+    else:
+        with SqliteQuantDB(out) as sdb:
+            hits = match_qhash(sdb, qhash)
+    assert hits and all(isinstance(h.filename, str) for h in hits)
+    # rotulo = caminho sem o prefixo "synthetic:"
+    assert "ijg/baseline/q050" in {h.filename for h in hits}
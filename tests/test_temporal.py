@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from quantization_extend.deepfake_module.temporal import FEATURE_NAMES, TemporalAnalyzer, frame_features
+
+
+def _features(n, seed=0, burst=None):
+    # fluxo estacionario; ela_max e inteiro, parado nos primeiros quadros e depois com saltos de 1-3
+    rng = np.random.default_rng(seed)
+    base = rng.uniform(1, 10, len(FEATURE_NAMES))
+    base[FEATURE_NAMES.index("ela_max")] = 40
+    for i in range(n):
+        x = base + rng.normal(0, 0.02, len(base)) * base
+        x[FEATURE_NAMES.index("ela_max")] += 0 if i < 2 else rng.choice([-2, -1, 0, 0, 0, 1, 2, 3])
+        if burst and burst[0] <= i <= burst[1]:
+            x[:4] *= 1.5  # grupo ela
+        yield x
+
+
+def _run(analyzer, xs):
+    segments = [s for i, x in enumerate(xs) if (s := analyzer.update(i, x))]
+    last = analyzer.finish()
+    return segments + ([last] if last else [])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stationary_stream_has_no_segments(seed):
+    analyzer = TemporalAnalyzer(fps=25.0)
+    assert _run(analyzer, _features(2000, seed)) == []
+    assert analyzer.flagged <= 2  # quadros isolados acima de `enter` nao formam segmento
+
+
+def test_burst_segment_timestamps():
+    segments = _run(TemporalAnalyzer(fps=25.0), _features(400, seed=5, burst=(120, 129)))
+    assert len(segments) == 1
+    seg = segments[0]
+    assert (seg["start_frame"], seg["end_frame"]) == (120, 129)
+    assert (seg["start_time_s"], seg["end_time_s"]) == (4.8, 5.16)
+    assert (seg["start_timecode"], seg["end_timecode"]) == ("00:00:04.800", "00:00:05.160")
+    assert seg["group"] == "ela"
+
+
+def test_region_blur_found_in_frame_features():
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:160, 0:160].astype(np.float32)
+    base = 128 + 50 * (np.sin(xx / 17) * np.cos(yy / 23))[..., None]
+    base = np.clip(base + cv2.GaussianBlur(rng.normal(0, 40, (160, 160, 3)).astype(np.float32), (0, 0), 2), 0, 255)
+
+    def frames(blur):
+        for i in range(200):
+            f = np.clip(base + rng.normal(0, 2, base.shape), 0, 255).astype(np.uint8)
+            if blur and 120 <= i <= 129:
+                f[40:120, 40:120] = cv2.GaussianBlur(f[40:120, 40:120], (0, 0), 2.0)
+            yield frame_features(f)
+
+    assert _run(TemporalAnalyzer(fps=25.0), frames(blur=False)) == []
+    segments = _run(TemporalAnalyzer(fps=25.0), frames(blur=True))
+    assert [(s["start_frame"], s["end_frame"]) for s in segments] == [(120, 129)]
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from quantization_extend.db import _process_one, build_database, load_db_json, save_db_json
+from quantization_extend.db_sqlite import SqliteQuantDB, save_db_sqlite
+from quantization_extend.watch import _WatchDB, inotify_available, load_watch_log, run_watch
+
+
+def test_json_matcher_snapshot_not_changed_by_add(tmp_path, dataset, make_jpeg):
+    db_path = tmp_path / "quant_db.json"
+    save_db_json(build_database(dataset), db_path)
+    wdb = _WatchDB(db_path, persist_delay=3600)
+    snap = wdb.matcher()
+    n = len(snap)
+    counts = {lv: {k: dict(v) for k, v in c.items()} for lv, c in snap.attribution.counts.items()}
+
+    new = make_jpeg(tmp_path / "novo" / "x_33.jpg", quality=33, seed=7)
+    wdb.add(_process_one("novo", new))
+
+    # o snapshot entregue a um job nao ve a insercao (nem colunas nem modelo)...
+    assert len(snap) == n
+    assert {lv: {k: dict(v) for k, v in c.items()} for lv, c in snap.attribution.counts.items()} == counts
+    # ...e o proximo snapshot ve
+    assert len(wdb.matcher()) == n + 1
+    assert wdb.matcher() is not snap
+
+
+def test_watch_log_does_not_mark_errors_done(tmp_path):
+    log = tmp_path / "watch.jsonl"
+    recs = [
+        {"input": {"path": "/ev/a.jpg"}, "hits": []},
+        {"db_add": {"path": "/ds/gimp/b.jpg"}, "watch_latency_s": 0.1},
+        {"path": "/ev/parcial.jpg", "error": "ValueError: truncado"},
+    ]
+    log.write_text("".join(json.dumps(r) + "\n" for r in recs) + "{linha cortada\n")
+    assert load_watch_log(log) == {"/ev/a.jpg", "/ds/gimp/b.jpg"}
+
+
+class _Running:
+    """run_watch numa thread, parado por `stop`; stats ficam em .stats depois de close()."""
+
+    def __init__(self, **kw):
+        self.stop = threading.Event()
+        self.stats = {}
+        self.thread = threading.Thread(target=lambda: self.stats.update(run_watch(stop=self.stop, **kw)), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join(timeout=20)
+        assert not self.thread.is_alive()
+        return self.stats
+
+
+def _records(log):
+    return [json.loads(line) for line in log.read_text().splitlines()] if log.exists() else []
+
+
+def _wait(log, pred, timeout=15.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        recs = _records(log)
+        if pred(recs):
+            return recs
+        time.sleep(0.05)
+    raise AssertionError(f"timeout; log: {_records(log)}")
+
+
+def _matches(recs):
+    return [r for r in recs if "input" in r]
+
+
+def _adds(recs):
+    return [r for r in recs if "db_add" in r]
+
+
+def _json_db(tmp_path, dataset):
+    db_path = tmp_path / "quant_db.json"
+    save_db_json(build_database(dataset), db_path)
+    return db_path
+
+
+def _write_in_two_parts(path, data, pause):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data[: len(data) // 2])
+        f.flush()
+        time.sleep(pause)
+        f.write(data[len(data) // 2 :])
+
+
+def test_poll_partial_write_matched_once_after_settle(tmp_path, dataset, make_jpeg):
+    ev, log = tmp_path / "ev", tmp_path / "watch.jsonl"
+    ev.mkdir()
+    data = make_jpeg(tmp_path / "src" / "a.jpg", quality=75, size=(256, 192), seed=3).read_bytes()
+    make_jpeg(ev / "pronto.jpg", quality=90, seed=4)
+    w = _Running(inputs=[ev], db_path=_json_db(tmp_path, dataset), log_path=log, poll=True, settle=1.2, interval=0.1)
+    try:
+        _wait(log, _matches)  # watch rodando (o arquivo pre-existente ja foi processado)
+        # pausa menor que o settle: a metade escrita nao pode sair como arquivo pronto
+        _write_in_two_parts(ev / "a.jpg", data, pause=0.6)
+        (ev / "notas.txt").write_text("nao e JPEG")
+        _wait(log, lambda r: len(_matches(r)) == 2)
+        time.sleep(0.5)  # nenhum match extra depois do settle
+    finally:
+        stats = w.close()
+    recs = _records(log)
+    assert len(recs) == 2 and stats["mode"] == "poll"
+    (rec,) = [r for r in recs if r["input"]["path"].endswith("a.jpg")]
+    assert rec["input"]["path"] == str((ev / "a.jpg").resolve())
+    assert rec["input"]["sha256"] == hashlib.sha256(data).hexdigest()
+    assert {h["software"] for h in rec["hits"]} == {"gimp"}
+    assert stats["matched"] == 2 and stats["errors"] == 0
+
+
+def _drop(tmp_path, make_jpeg, name, dest, quality, seed):
+    # escrita fora da arvore + rename: o arquivo aparece inteiro
+    src = make_jpeg(tmp_path / "src" / name, quality=quality, seed=seed)
+    dest.mkdir(parents=True, exist_ok=True)
+    os.replace(src, dest / name)
+
+
+def test_poll_dataset_ingestion_and_resume(tmp_path, dataset, make_jpeg):
+    ev, refs, log, db_path = tmp_path / "ev", tmp_path / "refs", tmp_path / "watch.jsonl", _json_db(tmp_path, dataset)
+    ev.mkdir()
+    refs.mkdir()
+    n_items = len(load_db_json(db_path)["items"])
+    make_jpeg(ev / "antes.jpg", quality=60, seed=11)  # ja presente: processado ao iniciar
+    kw = dict(inputs=[ev], db_path=db_path, log_path=log, dataset=refs, poll=True, settle=0.2, interval=0.1)
+
+    w = _Running(**kw)
+    try:
+        _wait(log, _matches)
+        _drop(tmp_path, make_jpeg, "novo_33.jpg", refs / "novo_sw", 33, 5)
+        _wait(log, _adds)
+        # o que entrou no DB ja serve para o proximo match
+        _drop(tmp_path, make_jpeg, "depois.jpg", ev, 33, 6)
+        recs = _wait(log, lambda r: len(_matches(r)) == 2)
+    finally:
+        stats = w.close()
+    assert (stats["added"], stats["matched"], stats["skipped"], stats["errors"]) == (1, 2, 0, 0)
+    (add,) = _adds(recs)
+    assert add["db_add"]["software"] == "novo_sw" and add["db_add"]["quality"] == 33
+    (later,) = [r for r in _matches(recs) if r["input"]["path"].endswith("depois.jpg")]
+    assert [h["software"] for h in later["hits"]] == ["novo_sw"]
+    db = load_db_json(db_path)  # gravado ao parar
+    assert len(db["items"]) == n_items + 1
+    assert db_path.with_name(db_path.name + ".bloom").exists()
+
+    # reinicio com o mesmo log: os 3 arquivos ja registrados sao pulados, nada reprocessado
+    n_lines = len(_records(log))
+    w = _Running(**kw)
+    time.sleep(0.8)
+    stats = w.close()
+    assert (stats["skipped"], stats["matched"], stats["added"], stats["errors"]) == (3, 0, 0, 0)
+    assert len(_records(log)) == n_lines
+    assert len(load_db_json(db_path)["items"]) == n_items + 1
+
+
+def test_sqlite_readers_see_inserted_references(tmp_path, dataset, make_jpeg):
+    ev, refs, log, db_path = tmp_path / "ev", tmp_path / "refs", tmp_path / "watch.jsonl", tmp_path / "quant_db.sqlite"
+    ev.mkdir()
+    refs.mkdir()
+    save_db_sqlite(build_database(dataset), db_path)
+    w = _Running(inputs=[ev], db_path=db_path, log_path=log, dataset=refs, workers=3, poll=True, settle=0.2, interval=0.1)
+    try:
+        for k, q in enumerate((50, 75, 90)):
+            _drop(tmp_path, make_jpeg, f"ev_{q}.jpg", ev, q, 20 + k)
+        recs = _wait(log, lambda r: len(_matches(r)) == 3)
+        _drop(tmp_path, make_jpeg, "novo_33.jpg", refs / "novo_sw", 33, 5)
+        _wait(log, _adds)
+        _drop(tmp_path, make_jpeg, "ev_33.jpg", ev, 33, 6)
+        recs = _wait(log, lambda r: len(_matches(r)) == 4)
+    finally:
+        stats = w.close()
+    assert (stats["matched"], stats["added"], stats["errors"]) == (4, 1, 0)
+    by_name = {Path(r["input"]["path"]).name: r for r in _matches(recs)}
+    assert all(by_name[f"ev_{q}.jpg"]["hits"][0]["software"] == "gimp" for q in (50, 75, 90))
+    # leitor de outra thread enxerga a insercao commitada pelo watch
+    assert [h["software"] for h in by_name["ev_33.jpg"]["hits"]] == ["novo_sw"]
+    with SqliteQuantDB(db_path) as db:
+        assert len(db) == len(build_database(dataset)["items"]) + 1
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify so existe no Linux")
+def test_inotify_mode_matches_and_ingests(tmp_path, dataset, make_jpeg):
+    ev, refs, log = tmp_path / "ev", tmp_path / "refs", tmp_path / "watch.jsonl"
+    ev.mkdir()
+    refs.mkdir()
+    w = _Running(inputs=[ev], db_path=_json_db(tmp_path, dataset), log_path=log, dataset=refs, poll=False, settle=0.2)
+    try:
+        time.sleep(0.3)
+        _drop(tmp_path, make_jpeg, "novo_33.jpg", refs / "novo_sw", 33, 5)  # subdiretorio novo: vigiado ao surgir
+        _wait(log, _adds)
+        _write_in_two_parts(ev / "sub" / "a.jpg", make_jpeg(tmp_path / "src" / "a.jpg", quality=33, seed=6).read_bytes(), 0.1)
+        _wait(log, _matches)
+        time.sleep(0.4)
+    finally:
+        stats = w.close()
+    assert stats["mode"] == "inotify"
+    assert (stats["matched"], stats["added"], stats["errors"]) == (1, 1, 0)
+    (rec,) = _matches(_records(log))
+    assert [h["software"] for h in rec["hits"]] == ["novo_sw"]
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
 import hashlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from .profiling import timed
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    with timed("hash"):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+        return h.hexdigest()
 
 
 def sha256_text(text: str) -> str:
@@ -19,3 +26,28 @@ def sha256_text(text: str) -> str:
 
 def flatten_8x8(mat: list[list[int]]) -> list[int]:
     return [int(x) for row in mat for x in row]
+
+
+def imap_bounded(fn: Callable[[T], R], items: Iterable[T], workers: int = 1, max_in_flight: Optional[int] = None) -> Iterator[R]:
+    """Aplica fn sobre items num pool de threads, sem materializar a lista de entrada.
+
+    Mantem no maximo max_in_flight tarefas pendentes (default 4*workers), entao a
+    memoria fica limitada mesmo com milhoes de arquivos. Resultados saem na ordem
+    em que terminam. workers<=1 roda em serie.
+    """
+    if workers <= 1:
+        for it in items:
+            yield fn(it)
+        return
+
+    limit = max_in_flight or workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = set()
+        for it in items:
+            pending.add(ex.submit(fn, it))
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        for fut in as_completed(pending):
+            yield fut.result()
@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .attribution import AttributionModel
+from .columnar import ColumnarDB
+from .db import SCHEMA_V2, _process_one, load_db_json, pack_db, pack_item, save_db_json
+from .db_sqlite import SQLITE_SUFFIXES, SqliteQuantDB, insert_items, is_sqlite_file
+from .match import match_against_db
+from .prefilter import write_prefilter_for_db
+from .profiling import count, timed
+from .scan import has_magic, iter_tree
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ nome com len bytes)
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class _Inotify:
+    """inotify via ctypes (libc), sem dependencias externas. So Linux."""
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self._paths: Dict[int, Path] = {}
+
+    def add(self, path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch({path}): {os.strerror(err)}")
+        self._paths[wd] = Path(path)
+
+    def read(self, timeout: float) -> List[Tuple[Optional[Path], int]]:
+        """(caminho, mascara) dos eventos pendentes; caminho None = fila estourou (IN_Q_OVERFLOW)."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        out: List[Tuple[Optional[Path], int]] = []
+        i = 0
+        while i + _EVENT.size <= len(buf):
+            wd, mask, _, n = _EVENT.unpack_from(buf, i)
+            name = buf[i + _EVENT.size : i + _EVENT.size + n].rstrip(b"\0")
+            i += _EVENT.size + n
+            if mask & IN_Q_OVERFLOW:
+                out.append((None, mask))
+            elif mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+            elif wd in self._paths and name:
+                out.append((self._paths[wd] / os.fsdecode(name), mask))
+        return out
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def inotify_available() -> bool:
+    return sys.platform.startswith("linux") and hasattr(ctypes.CDLL(None), "inotify_init1")
+
+
+class DirectoryWatcher:
+    """Entrega arquivos novos ou alterados sob `roots` depois que a escrita terminou.
+
+    Com inotify (Linux), IN_CLOSE_WRITE/IN_MOVED_TO liberam o arquivo na hora; arquivos
+    vistos so por IN_CREATE/IN_MODIFY (ex.: escrita via compartilhamento de rede) ficam
+    pendentes ate (tamanho, mtime) ficarem estaveis por `settle` segundos. Sem inotify
+    (ou com poll=True), a arvore e varrida a cada `interval` segundos com o mesmo criterio
+    de estabilidade. Subdiretorios criados depois tambem sao observados.
+    """
+
+    def __init__(self, roots: Sequence[Path], settle: float = 0.3, interval: float = 0.5, poll: Optional[bool] = None):
+        self.roots = [Path(r) for r in roots]
+        self.settle = settle
+        self.interval = interval
+        self._pending: Dict[Path, Tuple[int, int, float]] = {}  # caminho -> (tamanho, mtime_ns, estavel desde)
+        self._emitted: Dict[Path, Tuple[int, int]] = {}  # ultima versao entregue, para nao repetir
+        self._inotify: Optional[_Inotify] = None
+        self._next_scan = 0.0
+        if not poll and (poll is False or inotify_available()):
+            self._inotify = _Inotify()
+            for r in self.roots:
+                self._watch_tree(r)
+        self._snapshot = {} if self._inotify else self._scan()
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify else "poll"
+
+    def existing(self) -> Iterable[Path]:
+        """Arquivos ja presentes ao iniciar (para processar o que chegou com o watch parado)."""
+        for r in self.roots:
+            for entry in iter_tree(r):
+                yield Path(entry.path)
+
+    def _watch_tree(self, root: Path) -> None:
+        for d, _, _ in os.walk(root):
+            try:
+                self._inotify.add(Path(d))
+            except OSError:
+                continue
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snap = {}
+        for r in self.roots:
+            for entry in iter_tree(r):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snap[Path(entry.path)] = (st.st_size, st.st_mtime_ns)
+        return snap
+
+    def _stat(self, path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _mark(self, path: Path, now: float) -> None:
+        sig = self._stat(path)
+        if sig is None:
+            self._pending.pop(path, None)
+            return
+        prev = self._pending.get(path)
+        if prev is None or prev[:2] != sig:
+            self._pending[path] = (*sig, now)
+
+    def _emit(self, path: Path, out: List[Path]) -> None:
+        sig = self._stat(path)
+        self._pending.pop(path, None)
+        if sig is None or self._emitted.get(path) == sig:
+            return
+        self._emitted[path] = sig
+        out.append(path)
+
+    def poll(self, timeout: float = 0.1) -> List[Path]:
+        """Espera ate `timeout` segundos e devolve os arquivos prontos desde a ultima chamada."""
+        out: List[Path] = []
+        now = time.monotonic()
+        if self._inotify is not None:
+            for path, mask in self._inotify.read(timeout):
+                now = time.monotonic()
+                if path is None:  # fila estourou: reconcilia pela varredura
+                    count("watch_overflow")
+                    for p in self.existing():
+                        self._mark(p, now)
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._watch_tree(path)
+                        for entry in iter_tree(path):  # arquivos criados antes do watch do diretorio
+                            self._mark(Path(entry.path), now)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self._emit(path, out)
+                else:
+                    self._mark(path, now)
+        else:
+            time.sleep(timeout)
+            now = time.monotonic()
+            if now >= self._next_scan:
+                self._next_scan = now + self.interval
+                snap = self._scan()
+                for p, sig in snap.items():
+                    if self._snapshot.get(p) != sig:
+                        self._mark(p, now)
+                self._snapshot = snap
+        # debounce: pendentes so saem com (tamanho, mtime) parados por `settle` segundos
+        now = time.monotonic()
+        for p, (size, mtime, since) in list(self._pending.items()):
+            sig = self._stat(p)
+            if sig is None:
+                self._pending.pop(p)
+            elif sig != (size, mtime):
+                self._pending[p] = (*sig, now)
+            elif now - since >= self.settle:
+                self._emit(p, out)
+        return out
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+class _WatchDB:
+    """DB de referencia mantido aberto durante o watch, com insercao incremental.
+
+    JSON: dict v2 em memoria + ColumnarDB refeito so quando ha itens novos e chega um match;
+    gravado em disco (com o <db>.bloom) quando as insercoes param por `persist_delay` segundos.
+    SQLite: insercao direta (insert_items) e uma conexao somente leitura por thread de match
+    (WAL: leitores enxergam cada lote inserido assim que ele e commitado).
+    """
+
+    def __init__(self, path: Path, persist_delay: float = 1.0):
+        self.path = Path(path)
+        self.persist_delay = persist_delay
+        self.sqlite = is_sqlite_file(self.path) or (not self.path.exists() and self.path.suffix.lower() in SQLITE_SUFFIXES)
+        self._local = threading.local()
+        self._dirty_at: Optional[float] = None
+        if self.sqlite:
+            self._writer = SqliteQuantDB(self.path, readonly=False)
+        else:
+            if self.path.exists():
+                self.db = pack_db(load_db_json(self.path))  # v1 -> v2: itens novos so referenciam tabelas
+            else:
+                self.db = {"schema": SCHEMA_V2, "dataset_root": None, "tables": {}, "items": []}
+            self.model = AttributionModel.from_db(self.db)
+            self._columnar: Optional[ColumnarDB] = None
+
+    def matcher(self) -> Any:
+        """DB para match_against_db.
+
+        SQLite: conexao somente leitura da thread atual (chamar na thread do match).
+        JSON: snapshot que add() nao altera (colunas e copia do modelo de atribuicao);
+        chamar so na thread principal, que e a unica que insere.
+        """
+        if self.sqlite:
+            r = getattr(self._local, "reader", None)
+            if r is None:  # fechada junto com a thread do pool (sqlite3 nao aceita close de outra thread)
+                r = self._local.reader = SqliteQuantDB(self.path)
+            return r
+        if self._columnar is None:
+            with timed("columnar_build"):
+                self._columnar = ColumnarDB.from_items(
+                    self.db["items"], tables=self.db["tables"], dataset_root=self.db.get("dataset_root"),
+                    attribution=AttributionModel.from_dict(self.model.to_dict()),
+                )
+        return self._columnar
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """Chamado so pela thread principal."""
+        if self.sqlite:
+            insert_items(self._writer.conn, [item])
+        else:
+            self.model.add(item)
+            self.db["items"].append(pack_item(item, self.db["tables"]))
+            self._columnar = None
+        self._dirty_at = time.monotonic()
+
+    def maybe_persist(self, force: bool = False) -> bool:
+        if self._dirty_at is None or (not force and time.monotonic() - self._dirty_at < self.persist_delay):
+            return False
+        if not self.sqlite:
+            self.db["attribution"] = self.model.to_dict()
+            save_db_json(self.db, self.path)
+            write_prefilter_for_db(self.path, self.db)
+        else:
+            write_prefilter_for_db(self.path, self._writer)
+        self._dirty_at = None
+        return True
+
+    def close(self) -> None:
+        self.maybe_persist(force=True)
+        if self.sqlite:
+            self._writer.close()
+
+
+def load_watch_log(log_path: Path) -> Set[str]:
+    """Caminhos ja registrados no log (match em "input.path", insercao no DB em "db_add.path").
+
+    Registros de erro ({"path", "error"}) nao contam: o arquivo pode ter falhado por ainda
+    estar sendo copiado, entao e tentado de novo no proximo inicio.
+    """
+    done: Set[str] = set()
+    log_path = Path(log_path)
+    if not log_path.exists():
+        return done
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                done.add((rec.get("input") or rec["db_add"])["path"])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+    return done
+
+
+def _software_of(path: Path, dataset: Optional[Path]) -> Optional[str]:
+    """dataset/<software>/... -> software; None se o arquivo nao e de referencia."""
+    if dataset is None:
+        return None
+    try:
+        rel = path.resolve().relative_to(dataset.resolve())
+    except ValueError:
+        return None
+    return rel.parts[0] if len(rel.parts) > 1 else None
+
+
+def run_watch(
+    inputs: Sequence[Path],
+    db_path: Path,
+    log_path: Path,
+    dataset: Optional[Path] = None,
+    workers: int = 4,
+    topk: int = 10,
+    settle: float = 0.3,
+    interval: float = 0.5,
+    poll: Optional[bool] = None,
+    existing: bool = True,
+    stop: Optional[threading.Event] = None,
+) -> Dict[str, Any]:
+    """Observa diretorios de evidencia (match) e, opcionalmente, um dataset/<software>/ (DB).
+
+    Cada JPEG novo (detectado pelo conteudo) vai para um pool de threads: evidencia passa por
+    match_against_db contra o DB mantido em memoria; referencia passa pela mesma extracao do
+    build-db e e inserida no DB. Resultados e insercoes sao anexados ao log JSONL (uma linha
+    por arquivo, flush imediato); o log e tambem o checkpoint: com existing=True, arquivos ja
+    presentes e ainda nao registrados sao processados ao iniciar. Roda ate `stop` ser sinalizado.
+    """
+    stop = stop or threading.Event()
+    dataset = Path(dataset) if dataset else None
+    roots = [Path(p) for p in inputs] + ([dataset] if dataset else [])
+    watcher = DirectoryWatcher(roots, settle=settle, interval=interval, poll=poll)
+    wdb = _WatchDB(Path(db_path))
+    done = load_watch_log(log_path)
+    stats: Dict[str, Any] = {"mode": watcher.mode, "matched": 0, "added": 0, "skipped": 0, "errors": 0}
+    Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+
+    def match_sqlite(p: Path) -> Dict[str, Any]:
+        return match_against_db(wdb.matcher(), p, topk=topk)  # leitor da thread do pool
+
+    def submit(ex: ThreadPoolExecutor, pending: Dict[Future, Tuple[Path, Optional[str], float]], paths: Iterable[Path]) -> None:
+        for p in paths:
+            if not has_magic(p):
+                continue
+            try:
+                t0 = p.stat().st_mtime  # latencia medida da ultima escrita do arquivo ate o resultado
+            except OSError:
+                continue
+            sw = _software_of(p, dataset)
+            if sw is None and dataset is not None and p.resolve().is_relative_to(dataset.resolve()):
+                continue  # arquivo solto na raiz do dataset: sem software
+            if sw is None and wdb.sqlite:
+                fut = ex.submit(match_sqlite, p)
+            elif sw is None:
+                # snapshot capturado aqui, na thread principal: o job nao ve insercoes posteriores
+                fut = ex.submit(match_against_db, wdb.matcher(), p, topk=topk)
+            else:
+                fut = ex.submit(_process_one, sw, p)
+            pending[fut] = (p, sw, t0)
+
+    with open(log_path, "a", encoding="utf-8") as log, ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        pending: Dict[Future, Tuple[Path, Optional[str], float]] = {}
+
+        def write(rec: Dict[str, Any]) -> None:
+            log.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            log.flush()
+
+        if existing:
+            todo = []
+            for p in watcher.existing():
+                if str(p.resolve()) in done:
+                    stats["skipped"] += 1
+                else:
+                    todo.append(p)
+            submit(ex, pending, todo)
+        try:
+            while not stop.is_set() or pending:
+                if not stop.is_set():
+                    ready = watcher.poll(timeout=0.05 if pending else 0.2)
+                    submit(ex, pending, ready)
+                if pending:
+                    finished, _ = wait(list(pending), timeout=0.05, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        p, sw, t0 = pending.pop(fut)
+                        try:
+                            res = fut.result()
+                        except Exception as e:  # arquivo ilegivel/corrompido nao derruba o watch
+                            stats["errors"] += 1
+                            write({"path": str(p.resolve()), "error": f"{type(e).__name__}: {e}"})
+                            continue
+                        latency = round(time.time() - t0, 4)
+                        if sw is None:
+                            res["watch_latency_s"] = latency
+                            write(res)
+                            stats["matched"] += 1
+                        else:
+                            wdb.add(res)
+                            write({"db_add": {"path": res["path"], "software": sw, "quality": res.get("quality"),
+                                              "sha256": res["sha256"], "qhash": res["qhash"]}, "watch_latency_s": latency})
+                            stats["added"] += 1
+                wdb.maybe_persist()
+        finally:
+            watcher.close()
+            wdb.close()
+    return stats